@@ -0,0 +1,157 @@
+####################################################################################################
+# cached access to channel planes
+####################################################################################################
+
+__all__ = ["ChannelPlanes"]
+
+import threading
+import collections
+import numpy as np
+
+class ChannelPlanes:
+    """
+    Provide float32 channel planes of a cube from a reader (see readers.py).
+
+    Planes are kept in a least-recently-used cache limited to cache_bytes. While a frame is
+    drawn, a background thread reads ahead the next channels in the order set by set_order, so
+    that the next plane is usually available without waiting for the disk. Memory use is bounded
+    by the cache size regardless of the cube size.
+    """
+
+    def __init__(self, reader, cache_bytes=256*2**20, readahead=4):
+        self.reader = reader
+        self.shape = reader.shape
+        self.plane_bytes = int(np.prod(self.shape[1:]))*4
+        self.cache_bytes = cache_bytes
+        self.readahead = max(0, min(readahead, cache_bytes//self.plane_bytes-1))
+
+        self.cache = collections.OrderedDict()
+        self.pending = set()
+        self.bytes_read = 0
+        self.order = []
+        self.position = {}
+        self.condition = threading.Condition()
+        self.requests = collections.deque()
+        self.running = True
+        self.thread = None
+        if self.readahead > 0:
+            self.thread = threading.Thread(target=self.prefetch, name='ChannelPlanes', daemon=True)
+            self.thread.start()
+
+    def __len__(self):
+        return self.shape[0]
+
+
+    def set_order(self, channels):
+        """
+        Set the order in which the channels will be requested, to read ahead accordingly.
+        """
+        with self.condition:
+            self.order = list(channels)
+            self.position = {channel: i for i,channel in enumerate(self.order)}
+
+
+    def read(self, channel):
+        """
+        Read a plane from disk and store it in the cache. The channel is no longer pending
+        afterwards, also if reading fails, so that threads waiting for it go on.
+        """
+        try:
+            plane = self.reader.read(int(channel))
+            plane.setflags(write=False)
+            with self.condition:
+                self.bytes_read += plane.nbytes
+                self.cache[channel] = plane
+                while len(self.cache) > 1 and len(self.cache)*self.plane_bytes > self.cache_bytes:
+                    self.cache.popitem(last=False)
+        finally:
+            with self.condition:
+                self.pending.discard(channel)
+                self.condition.notify_all()
+        return plane
+
+
+    def __getitem__(self, channel):
+        """
+        Get a channel plane. The returned array is read-only as it is shared with the cache.
+        """
+        with self.condition:
+            self.schedule(channel)
+            while channel in self.pending:
+                self.condition.wait()
+            if channel in self.cache:
+                self.cache.move_to_end(channel)
+                return self.cache[channel]
+            self.pending.add(channel)
+        return self.read(channel)
+
+
+    def get(self, channels):
+        """
+        Get a stack of channel planes.
+        """
+        return np.stack([self[channel] for channel in channels])
+
+
+    def chunks(self, channels, chunk_bytes=64*2**20):
+        """
+        Read the given channels in stacks of at most chunk_bytes, bypassing the cache. This is
+        meant for passes over many channels (e.g. statistics) that should not evict the planes
+        needed for drawing.
+        """
+        channels = list(channels)
+        step = max(1, chunk_bytes//self.plane_bytes)
+        for start in range(0, len(channels), step):
+            chunk = self.reader.read(channels[start:start+step])
+            with self.condition:
+                self.bytes_read += chunk.nbytes
+            yield chunk
+
+
+    def schedule(self, channel):
+        """
+        Queue the channels following the requested one for reading ahead. Needs the lock.
+        """
+        if self.thread is None or channel not in self.position:
+            return
+        i = self.position[channel]
+        for next_channel in self.order[i+1:i+1+self.readahead]:
+            if next_channel not in self.cache and next_channel not in self.pending:
+                self.pending.add(next_channel)
+                self.requests.append(next_channel)
+        self.condition.notify_all()
+
+
+    def prefetch(self):
+        """
+        Read queued channels in the background. Runs in the read-ahead thread.
+        """
+        while True:
+            with self.condition:
+                while self.running and not self.requests:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                channel = self.requests.popleft()
+            try:
+                self.read(channel)
+            except Exception:
+                # leave it to the main thread to read the plane and raise the error
+                pass
+
+
+    def close(self):
+        """
+        Stop reading ahead, drop the cache and close the reader.
+        """
+        with self.condition:
+            self.running = False
+            self.requests.clear()
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        self.cache.clear()
+        self.reader.close()
+
+
+####################################################################################################
@@ -0,0 +1,194 @@
+####################################################################################################
+# contour lines computed ahead of drawing
+####################################################################################################
+
+__all__ = ["ContourEngine"]
+
+import os
+import threading
+import numpy as np
+
+class ContourEngine:
+    """
+    Compute the contour lines of channel planes with contourpy, ahead of drawing.
+
+    The lines of the upcoming channels (in the order set by set_order) are traced in a thread
+    pool while the current frame is drawn. The lines of each level are joined into one vertex
+    array, separated by NaNs (which break the line when drawn), so a frame only needs to update
+    a few segments of a single LineCollection instead of building a new ContourSet. The lines can
+    be stored to and loaded from a file to skip tracing in later runs.
+    The lines are in pixel coordinates of the planes unless the coordinates (x, y) of the plane
+    columns and rows are given. With retain=False, the lines of a channel are dropped once they
+    were requested, so that only the lines traced ahead are held in memory.
+    options are passed on to contourpy.contour_generator (e.g. name, corner_mask, chunk_size) and
+    are stored with the lines like the levels.
+    """
+
+    def __init__(self, levels, get_plane, coordinates=None, workers=2, ahead=8, retain=True, options={}):
+        self.levels = [float(level) for level in levels]
+        self.options = dict(options)
+        self.get_plane = get_plane
+        self.coordinates = coordinates
+        self.workers = workers
+        self.ahead = ahead
+        self.retain = retain
+
+        self.lines = {}
+        self.futures = {}
+        self.order = []
+        self.position = {}
+        self.modified = False
+        self.lock = threading.Lock()
+        self.pool = None
+        if workers > 0:
+            from concurrent.futures import ThreadPoolExecutor
+            self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ContourEngine')
+
+
+    def set_order(self, channels):
+        """
+        Set the order in which the channels will be requested, to trace ahead accordingly.
+        """
+        with self.lock:
+            self.order = list(channels)
+            self.position = {channel: i for i,channel in enumerate(self.order)}
+
+
+    def trace(self, plane):
+        """
+        Trace the contour lines of a plane at all levels. Returns one (N,2) vertex array per level
+        that has lines, with the lines separated by NaN rows, and the level index of each array.
+        """
+        import contourpy
+
+        x, y = self.coordinates or (None, None)
+        generator = contourpy.contour_generator(x=x, y=y, z=plane, line_type='Separate', **self.options)
+        segments = []
+        index = []
+        for i,level in enumerate(self.levels):
+            lines = generator.lines(level)
+            if len(lines) == 0:
+                continue
+            gap = np.full((1,2), np.nan)
+            segments.append(np.concatenate([part for line in lines for part in (line, gap)][:-1]).astype(np.float32))
+            index.append(i)
+        return segments, np.array(index, dtype=np.intp)
+
+
+    def compute(self, channel):
+        lines = self.trace(self.get_plane(channel))
+        with self.lock:
+            self.lines[channel] = lines
+            self.futures.pop(channel, None)
+            self.modified = True
+        return lines
+
+
+    def schedule(self, channel):
+        """
+        Queue the channels following the requested one for tracing. Needs the lock.
+        """
+        if self.pool is None or channel not in self.position:
+            return
+        i = self.position[channel]
+        for next_channel in self.order[i+1:i+1+self.ahead]:
+            if next_channel not in self.lines and next_channel not in self.futures:
+                self.futures[next_channel] = self.pool.submit(self.compute, next_channel)
+
+
+    def __getitem__(self, channel):
+        """
+        Get the contour lines (segments, level index) of a channel.
+        """
+        with self.lock:
+            self.schedule(channel)
+            if channel in self.lines:
+                return self.lines[channel] if self.retain else self.lines.pop(channel)
+            future = self.futures.get(channel)
+        lines = future.result() if future is not None else self.compute(channel)
+        if not self.retain:
+            with self.lock:
+                self.lines.pop(channel, None)
+        return lines
+
+
+    def precompute(self, channels):
+        """
+        Trace all given channels that are not known yet, e.g. before storing the lines.
+        """
+        missing = [channel for channel in channels if channel not in self.lines]
+        if self.pool is None:
+            for channel in missing:
+                self.compute(channel)
+        else:
+            for future in [self.pool.submit(self.compute, channel) for channel in missing]:
+                future.result()
+
+
+    def save(self, filename, **key):
+        """
+        Store the lines of all traced channels together with key values that identify the data.
+        """
+        with self.lock:
+            channels = sorted(self.lines)
+            segments = [segment for channel in channels for segment in self.lines[channel][0]]
+            index = [self.lines[channel][1] for channel in channels]
+        np.savez(filename,
+                 levels   = self.levels,
+                 options  = self.options_key(),
+                 channels = np.array(channels, dtype=np.int64),
+                 counts   = np.array([len(i) for i in index], dtype=np.int64),
+                 index    = np.concatenate(index) if index else np.zeros(0, dtype=np.intp),
+                 lengths  = np.array([len(segment) for segment in segments], dtype=np.int64),
+                 vertices = np.concatenate(segments) if segments else np.zeros((0,2), dtype=np.float32),
+                 **key
+                )
+        self.modified = False
+
+
+    def options_key(self):
+        """
+        The contourpy options as stored with the lines.
+        """
+        return repr(sorted(self.options.items()))
+
+
+    def load(self, filename, **key):
+        """
+        Add the lines stored with save if the file exists and matches the levels, the options and
+        all key values. Returns whether the file was used.
+        """
+        if not os.path.exists(filename):
+            return False
+        try:
+            with np.load(filename) as stored:
+                if not np.array_equal(stored['levels'], self.levels) or stored['options'] != self.options_key():
+                    return False
+                for k,v in key.items():
+                    if k not in stored or stored[k] != v:
+                        return False
+                lengths = stored['lengths']
+                index = np.split(stored['index'], np.cumsum(stored['counts'])[:-1])
+                segments = np.split(stored['vertices'], np.cumsum(lengths)[:-1]) if len(lengths) else []
+                lines = {}
+                start = 0
+                for channel,i in zip(stored['channels'], index):
+                    lines[int(channel)] = (segments[start:start+len(i)], i)
+                    start += len(i)
+        except (OSError, ValueError, KeyError):
+            return False
+        with self.lock:
+            self.lines.update(lines)
+        return True
+
+
+    def close(self):
+        """
+        Stop tracing ahead.
+        """
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+
+
+####################################################################################################
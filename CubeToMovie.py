@@ -4,10 +4,19 @@
 
 __all__ = ["CubeToMovie"]
 
+import os
+import time
+import threading
+import contextlib
 import numpy as np
 import warnings
 import matplotlib as mpl
-import matplotlib.pyplot as plt
+
+# shared no-op context for spans without hooks
+_NO_SPAN = contextlib.nullcontext()
+
+# figures set up ahead of a render in this process, e.g. by a warm batch worker (see keep_figure)
+_kept_figures = []
 
 class CubeToMovie:
     """
@@ -15,7 +24,38 @@ class CubeToMovie:
     steps of creating a movie of the cube.
     """
 
-    def __init__(self, cube):
+    # attributes that fully describe how a movie is rendered, e.g. to set up a copy in a worker
+    settings = ['figsize', 'xlabel', 'ylabel',
+                'vmin', 'vmax', 'percentiles', 'scaling', 'scaling_window', 'channel_limits', 'cmap',
+                'percentile_method', 'percentile_sample', 'percentile_sampling', 'percentile_cache', 'imshow_kwargs',
+                'contourlevels', 'contour_kwargs', 'contour_workers', 'contour_cache', 'overlays',
+                'decimals', 'channelunit', 'channel_kwargs', 'usetex',
+                'show_cbar', 'cbarlabel', 'cbar_kwargs',
+                'cutout', 'downsample', 'downsample_mode', 'block_size', 'cache_bytes', 'readahead', 'out_of_core', 'chunk_bytes',
+                'memory_budget', 'batch_size',
+                'binning', 'bin_mode', 'spectral_grid', 'velocity_convention', 'bins', 'spectral_axis', 'channel_widths',
+                'repeat', 'renderer', 'frame_cache', 'frame_cache_bytes',
+                'outputs', 'writer', 'queue_depth', 'fps', 'dpi', 'bitrate', 'codec', 'metadata', 'movie_kwargs'
+               ]
+
+    # ways to combine the channels of a bin (see bin_channels)
+    bin_modes = ('mean', 'sum', 'max')
+
+    # contour_kwargs that change the traced lines, with the name of the contourpy option they are
+    # passed on to (see ContourEngine), and those that style the lines
+    contour_trace_kwargs = {'corner_mask': 'corner_mask', 'algorithm': 'name', 'nchunk': 'chunk_size'}
+    contour_style_kwargs = ['colors', 'linewidths', 'linestyles', 'negative_linestyles', 'alpha', 'zorder', 'antialiased']
+
+    # attributes that affect the pixels of a frame, for the keys of the frame cache
+    frame_settings = ['figsize', 'xlabel', 'ylabel',
+                      'vmin', 'vmax', 'scaling', 'scaling_window', 'cmap', 'imshow_kwargs',
+                      'contourlevels', 'contour_kwargs', 'overlays',
+                      'decimals', 'channelunit', 'channel_kwargs', 'usetex',
+                      'show_cbar', 'cbarlabel', 'cbar_kwargs',
+                      'renderer', 'dpi'
+                     ]
+
+    def __init__(self, cube, cutout=None, hooks=None, out_of_core=False, memory_budget=None):
         """
         Define a bunch of defaults.
         """
@@ -25,12 +65,40 @@ class CubeToMovie:
         self.was_interactive = False
         self.is_interactive = False
         self.preview_movie = False
+        self.preview_buffer = 16
 
         # warnings
-        self.warningstatus = {'wcswarning': True, 'contourwarning': True}
+        self.warningstatus = {'wcswarning': True, 'contourwarning': True, 'ompwarning': True}
+
+        # instrumentation
+        self.hooks = list(hooks or [])
+        self.profile = None
+
+        # channel selection and spectral binning
+        self.binning = 1
+        self.bin_mode = 'mean'
+        self.spectral_grid = None
+        self.velocity_convention = 'radio'
+        self.bins = None
+        self.channel_widths = None
 
         # data cube
-        self.load_cube(cube)
+        self.planes = None
+        self.contours = None
+        self.downsample = 'auto'
+        self.downsample_mode = 'mean'
+        self.block_size = 1
+        self.cache_bytes = 256*2**20
+        self.readahead = 4
+        self.memory_budget = memory_budget
+        self.memory_peak = 0
+        self.worker_memory_peak = 0
+        self.out_of_core = out_of_core or self.exceeds_memory_budget(cube)
+        self.chunk_bytes = 64*2**20
+        self.cutout = None
+        with self.span('load_cube'):
+            self.load_cube(cube)
+            self.set_cutout(cutout)
         self.channels = np.arange(len(self.cube))
 
         # figure
@@ -44,17 +112,34 @@ class CubeToMovie:
         self.vmin = None
         self.vmax = None
         self.percentiles = [0.25, 99.75]
+        self.percentile_method = 'exact'
+        self.percentile_sample = 1.
+        self.percentile_sampling = 'stride'
+        self.percentile_cache = True
+        self.histogram = None
+        self.scaling = 'global'
+        self.scaling_window = 1
+        self.channel_limits = None
         self.cmap = 'RdBu_r'
         self.imshow_kwargs = {}
 
         # contours
         self.contourlevels = None
         self.contour_kwargs = {}
+        self.contour_workers = 2
+        self.contour_cache = False
+        self.contour = None
+        self.contour_lines = None
+
+        # static overlays
+        self.overlays = []
 
         # channel info (velocity/frequency)
         self.decimals = 1
         self.channelunit = 'auto'
         self.channel_kwargs = {}
+        self.usetex = True
+        self.labels = {}
 
         # colorbar
         self.show_cbar = True
@@ -63,10 +148,16 @@ class CubeToMovie:
 
         # animating the channel maps
         self.repeat = False
+        self.renderer = 'full'
+        self.batch_size = 16
+        self.frame_cache = None
+        self.frame_cache_bytes = 4*2**30
 
         # saving the movie
         self.out = 'movie.mp4'
-        self.writer = 'ffmpeg'
+        self.outputs = None
+        self.writer = 'pipe'
+        self.queue_depth = 8
         self.fps = 2
         self.dpi = None
         self.bitrate = None
@@ -74,6 +165,51 @@ class CubeToMovie:
         self.metadata = {'title': 'channel maps movie', 'author':'cube2movie by GiantMolecularCloud', 'genre': 'astrophysics'}
         self.movie_kwargs = {}
 
+        # parallel rendering
+        self.workers = 1
+
+
+    def add_hook(self, hook):
+        """
+        Register a callable that receives a timing event (see Instrumentation.Span) for every
+        stage (load_cube, set_range, set_up_plot, save_movie) and for every step of every frame:
+        fetching the data, updating the contours, drawing and encoding. A final 'frame' event per
+        frame reports the bytes read so far and the peak memory. With several workers, 'segments'
+        events report the segments done while the workers render (see render_parallel).
+        """
+        self.hooks.append(hook)
+
+
+    def span(self, name, category='stage', **args):
+        """
+        Context manager that times the enclosed code for the hooks. Without hooks, it does nothing.
+        """
+        if not self.hooks:
+            return _NO_SPAN
+        from .Instrumentation import Span
+        return Span(self.hooks, name, category, args)
+
+
+    def frame_done(self, channel, start):
+        """
+        Report a finished frame (from start until now) with the number of frames of the movie, the
+        bytes read so far and the peak memory to the hooks. Returns the end of the frame.
+        """
+        from .Instrumentation import peak_rss
+
+        end = time.perf_counter()
+        event = {'name': 'frame', 'cat': 'frame', 'start': start, 'duration': end-start,
+                 'thread': 'MainThread',
+                 'args': {'channel': channel,
+                          'frames': len(self.channels),
+                          'bytes_read': 0 if self.planes is None else self.planes.bytes_read,
+                          'peak_rss': peak_rss()
+                         }
+                }
+        for hook in self.hooks:
+            hook(event)
+        return end
+
 
     def enable_interactive(self):
         mpl.interactive(True)
@@ -107,16 +243,19 @@ class CubeToMovie:
 
 
     def set_mpl_settings(self):
-        self.mpl_settings = plt.rcParams
-        plt.rcParams.update({'text.usetex': True,
-                             'savefig.pad_inches': 0.,
-                             'savefig.transparent': True,
-                             'savefig.frameon': True
-                            })
+        self.mpl_settings = mpl.rcParams.copy()
+        settings = {'text.usetex': self.usetex,
+                    'savefig.pad_inches': 0.,
+                    'savefig.transparent': True,
+                    'savefig.frameon': True
+                   }
+        # savefig.frameon was removed in matplotlib 3.3
+        mpl.rcParams.update({key: value for key,value in settings.items() if key in mpl.rcParams})
 
 
     def restore_mpl_settings(self):
-        plt.rcParams = self.mpl_settings
+        # the backend is left alone: setting it makes matplotlib resolve it through pyplot
+        mpl.rcParams.update({key: value for key,value in self.mpl_settings.items() if key != 'backend'})
 
 
     def supress_wcswarnings(self):
@@ -138,21 +277,37 @@ class CubeToMovie:
         self.warningstatus['contourwarning'] = False
 
 
+    def supress_OMPwarnings(self):
+        """
+        Silence the messages of the Intel OpenMP runtime (used e.g. by numpy with MKL), which are
+        printed by every thread that computes contours or reads planes.
+        """
+        self.omp_warnings = os.environ.get('KMP_WARNINGS')
+        os.environ['KMP_WARNINGS'] = 'off'
+        self.warningstatus['ompwarning'] = False
+
+
     def restore_warnings(self,types):
         if types=='all':
-            types = ['wcswarning','contourwarning']
-        if not isinstance(type, (tuple,list)):
+            types = ['wcswarning','contourwarning','ompwarning']
+        if not isinstance(types, (tuple,list)):
             types = [types]
         for t in types:
-            if t=='wcswarning':
+            if t=='wcswarning' and not self.warningstatus['wcswarning']:
                 from spectral_cube.utils import WCSWarning
                 warnings.simplefilter('default', category=WCSWarning)
-                self.warningstatus['wcswarning': True]
+                self.warningstatus['wcswarning'] = True
                 print("Re-enabled WCSWarnings.")
-            if t=='contourwarning':
-                warnings.simplefilter('default', message="No contour levels were found within the data range.")
-                self.warningstatus['contourwarning': True]
+            if t=='contourwarning' and not self.warningstatus['contourwarning']:
+                warnings.filterwarnings('default', message="No contour levels were found within the data range.")
+                self.warningstatus['contourwarning'] = True
                 print("Re-enabled contour warnings.")
+            if t=='ompwarning' and not self.warningstatus['ompwarning']:
+                if self.omp_warnings is None:
+                    os.environ.pop('KMP_WARNINGS', None)
+                else:
+                    os.environ['KMP_WARNINGS'] = self.omp_warnings
+                self.warningstatus['ompwarning'] = True
 
 
     def prepare_environment(self):
@@ -171,90 +326,825 @@ class CubeToMovie:
         """
         Restore all temporary environment settings: warnings and matplotlib.
         """
-        self.reset_interactive()
+        # the matplotlib settings include the interactive mode as set by prepare_environment
         self.restore_mpl_settings()
+        self.reset_interactive()
         self.restore_warnings('all')
 
 
+    def exceeds_memory_budget(self, cube):
+        """
+        Whether a cube file is too large to be read in memory within memory_budget, so that it
+        must be read out of core.
+        """
+        if self.memory_budget is None or not isinstance(cube, str) or not os.path.isfile(cube):
+            return False
+        if os.path.getsize(cube) > self.memory_budget/4:
+            print("The cube takes more than a quarter of the memory budget. Reading it out of core.")
+            return True
+        return False
+
+
+    def apply_memory_budget(self):
+        """
+        Fit the buffers of all stages into memory_budget (bytes, for this process) on top of the
+        memory already in use: plane cache and read-ahead, the chunks of out-of-core reading,
+        percentiles and moment maps, the batches of the numpy renderer, the frames queued for the
+        encoders and the preview, and the contour lines. Each of them gets at most a quarter of
+        what is left after the figure (see figure_bytes). The exact percentile, which needs the
+        whole cube in memory, is replaced by the streamed estimate if the cube does not fit.
+        Buffers are only ever reduced, down to their minimum; if even that does not fit, rendering
+        continues with a warning.
+        """
+        from .Instrumentation import current_rss
+
+        if self.memory_budget is None:
+            return
+        MB = 2**20
+        used = current_rss()
+        self.memory_peak = max(self.memory_peak, used)
+        share = max(self.memory_budget-used-self.figure_bytes(), 0)/4
+        plane_bytes = self.cube.shape[1]*self.cube.shape[2]*4
+        frame_bytes = self.figure_bytes()//16
+        outputs = len(self.output_specs())
+
+        self.cache_bytes = int(max(min(self.cache_bytes, share), 2*plane_bytes))
+        # out of core, a chunk is held up to four times (kept chunks, conversion)
+        self.chunk_bytes = int(max(min(self.chunk_bytes, share/4), plane_bytes))
+        # a batch holds its planes plus values, indices and colors of every pixel of the map
+        self.batch_size = int(max(1, min(self.batch_size, share/2//(plane_bytes+frame_bytes*10//4))))
+        self.queue_depth = int(max(1, min(self.queue_depth, share//(frame_bytes*outputs))))
+        self.preview_buffer = int(max(1, min(self.preview_buffer, share//frame_bytes)))
+        if self.percentile_method == 'exact' and not self.out_of_core and np.prod(self.cube.shape)*8 > share:
+            self.percentile_method = 'stream'
+        print("Memory budget {0:.0f} MB, {1:.0f} MB in use: plane cache {2:.0f} MB, chunks {3:.0f} MB, batches of {4}, {5} queued frames, {6} percentiles".format(
+              self.memory_budget/MB, used/MB, self.cache_bytes/MB, self.chunk_bytes/MB, self.batch_size, self.queue_depth, 'stream' if self.out_of_core else self.percentile_method))
+
+        minimum = 7*plane_bytes + frame_bytes*outputs + self.figure_bytes()
+        if self.memory_budget-used < minimum:
+            warnings.warn("\nThe memory budget of {0:.0f} MB leaves less than the {1:.0f} MB needed for the smallest buffers on top of the {2:.0f} MB in use. Rendering with the smallest buffers anyway.\n".format(self.memory_budget/MB, minimum/MB, used/MB),
+                          UserWarning,
+                          stacklevel = 2
+                         )
+
+
+    def figure_bytes(self):
+        """
+        Rough memory of the figure while rendering: sixteen RGBA frames for the canvas, the cached
+        background and foreground, the label rasters and the copies made while encoding.
+        """
+        dpi = self.dpi or mpl.rcParams['figure.dpi']
+        return 16*int(self.figsize[0]*dpi)*int(self.figsize[1]*dpi)*4
+
+
+    def report_memory(self):
+        """
+        Print the peak memory of the render (see Instrumentation.current_rss, sampled at every
+        frame written by the pipe writer) of this process and its workers, compared to
+        memory_budget, and the peak resident memory including pages of memory-mapped files.
+        """
+        from .Instrumentation import peak_rss
+
+        MB = 2**20
+        report = "Peak memory {0:.0f} MB".format(self.memory_peak/MB)
+        if self.worker_memory_peak:
+            report += " plus {0:.0f} MB per worker at most".format(self.worker_memory_peak/MB)
+        if self.memory_budget is not None:
+            report += ", budget {0:.0f} MB".format(self.memory_budget/MB)
+        print(report+" (peak resident memory {0:.0f} MB including mapped files)".format(peak_rss()/MB))
+
+
     def load_cube(self,cube):
         """
         Load cube from file, HDU or spectralcube.
-        TODO: also read CASA images
+        With out_of_core, files are opened with the dask backend of spectral_cube and read chunk
+        by chunk (see readers.DaskReader), so that memory use is bounded also for cubes larger
+        than the memory. A DaskSpectralCube is always treated as out of core.
+        CASA images, Zarr and HDF5 (files, groups or arrays) are read through the backends in
+        formats, straight from their chunks and always out of core.
         """
         from spectral_cube import SpectralCube
+        from spectral_cube.spectral_cube import BaseSpectralCube
+        from spectral_cube.dask_spectral_cube import DaskSpectralCubeMixin
         from astropy.io import fits
-
-        if isinstance(cube, SpectralCube):
-            self.cube = cube
-        elif isinstance(cube,(str,fits.hdu.hdulist.HDUList,fits.hdu.image.PrimaryHDU)):
-            self.cube = SpectralCube.read(cube)
+        from .formats import read_cube
+        from .readers import cube_hdu
+
+        self.source = cube
+        if isinstance(cube, BaseSpectralCube):
+            self.full_cube = cube
+        elif isinstance(cube,(fits.hdu.hdulist.HDUList,fits.hdu.image.PrimaryHDU)):
+            self.full_cube = SpectralCube.read(cube, use_dask=self.out_of_core)
         else:
-            raise TypeError("Cannot interpret input cube. Allowed: SpectralCube, HDU, HDUList or filename of fits image.")
+            self.full_cube = read_cube(cube)
+            if self.full_cube is None:
+                if not isinstance(cube, str):
+                    raise TypeError("Cannot interpret input cube. Allowed: SpectralCube, HDU, HDUList, filename of fits or CASA image, Zarr or HDF5 store, array or dataset.")
+                options = {}
+                if cube.lower().endswith(('.fits', '.fit', '.fts')):
+                    # the cube may be in an extension, after an empty primary HDU
+                    with fits.open(cube) as hdulist:
+                        options['hdu'] = cube_hdu(hdulist) or 0
+                self.full_cube = SpectralCube.read(cube, use_dask=self.out_of_core, **options)
+        self.out_of_core = isinstance(self.full_cube, DaskSpectralCubeMixin)
+        self.cube = self.full_cube
+        self.cutout = None
+        self.box = None
         self.spectral_axis = self.cube.spectral_axis
+        self.bins = None
+        self.channel_widths = None
+        self.close_planes()
+        self.histogram = None
+        self.channel_limits = None
+
+
+    def set_cutout(self, cutout):
+        """
+        Restrict the movie to a spatial region of the cube. cutout is either a box in pixels given
+        by the bottom left and top right corners ((x0,y0),(x1,y1)) (inclusive, zero-based), a box
+        in world coordinates given by two SkyCoord corners (blc,trc) or a SkyCoord centre and an
+        angular size (centre,size) with size a Quantity or a (width,height) tuple of Quantities.
+        None shows the full field.
+        The cube is sliced lazily, so only the pixels within the box are read from disk, and the
+        WCS of the sliced cube labels the axes accordingly.
+        """
+        self.cutout = cutout
+        if cutout is None:
+            self.cube = self.full_cube
+            self.box = None
+        else:
+            self.box = self.cutout_box(cutout)
+            y0, y1, x0, x1 = self.box
+            self.cube = self.full_cube[:, y0:y1, x0:x1]
+            print("Cutting out pixels x="+str(x0)+"..."+str(x1-1)+", y="+str(y0)+"..."+str(y1-1)+" ("+str(x1-x0)+"x"+str(y1-y0)+")")
+        self.close_planes()
+        self.histogram = None
+        self.channel_limits = None
+
+
+    def cutout_box(self, cutout):
+        """
+        Convert a cutout (see set_cutout) to pixel ranges (y0, y1, x0, x1) of the full cube, with
+        the upper limits exclusive and clipped to the cube.
+        """
+        import astropy.units as u
+        from astropy.coordinates import SkyCoord
+        from astropy.wcs.utils import proj_plane_pixel_scales
+
+        wcs = self.full_cube.wcs.celestial
+        ny, nx = self.full_cube.shape[1:]
+        first, second = cutout
+        if isinstance(first, SkyCoord) and isinstance(second, SkyCoord):
+            corners = np.array([wcs.world_to_pixel(first), wcs.world_to_pixel(second)], dtype=float)
+        elif isinstance(first, SkyCoord):
+            width, height = second if isinstance(second, (tuple,list)) else (second, second)
+            scale = proj_plane_pixel_scales(wcs)*u.Unit(wcs.wcs.cunit[0])
+            half = np.array([u.Quantity(width).to_value(scale.unit)/scale[0].value, u.Quantity(height).to_value(scale.unit)/scale[1].value])/2
+            centre = np.array(wcs.world_to_pixel(first), dtype=float)
+            corners = np.array([centre-half, centre+half])
+        else:
+            corners = np.array([first, second], dtype=float)
+        x0, y0 = np.floor(corners.min(axis=0)+0.5).astype(int)
+        x1, y1 = np.floor(corners.max(axis=0)+0.5).astype(int)+1
+        x0, x1 = max(x0, 0), min(x1, nx)
+        y0, y1 = max(y0, 0), min(y1, ny)
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError("The cutout "+str(cutout)+" does not overlap with the cube.")
+        return (int(y0), int(y1), int(x0), int(x1))
+
+
+    def open_planes(self):
+        """
+        Set up cached access to the channel planes, reading ahead in the order of the selected
+        channels.
+        """
+        from .readers import get_reader, BinnedReader, DownsampledReader
+        from .ChannelPlanes import ChannelPlanes
+
+        reader = get_reader(self.source, self.cube, self.box, self.chunk_bytes)
+        if self.block_size > 1:
+            reader = DownsampledReader(reader, self.block_size, mode=self.downsample_mode)
+        if self.bins is not None:
+            reader = BinnedReader(reader, self.bins, mode='mean' if self.spectral_grid is not None else self.bin_mode)
+        self.planes = ChannelPlanes(reader,
+                                    cache_bytes = self.cache_bytes,
+                                    readahead   = self.readahead
+                                   )
+        self.planes.set_order(self.channels)
+
+
+    def close_planes(self):
+        """
+        Close the plane provider and the contour engine that reads from it, e.g. after the data
+        layout changed. They are set up again on the next access.
+        """
+        if self.contours is not None:
+            self.contours.close()
+            self.contours = None
+        if self.planes is not None:
+            self.planes.close()
+            self.planes = None
+
+
+    def set_block_size(self):
+        """
+        Set the factor by which the channel planes are reduced before they are shown (see
+        DownsampledReader). downsample='auto' picks the largest factor that still leaves at least
+        one data pixel per screen pixel of the axes at the output dpi, an integer sets the factor
+        and False or 1 shows the full resolution.
+        """
+        if not self.downsample:
+            block_size = 1
+        elif self.downsample == 'auto':
+            bbox = self.ax.get_window_extent()
+            scale = (self.dpi or self.fig.dpi)/self.fig.dpi
+            ny, nx = self.cube.shape[1:]
+            block_size = int(min(nx/(bbox.width*scale), ny/(bbox.height*scale)))
+        else:
+            block_size = int(self.downsample)
+        block_size = max(block_size, 1)
+        if block_size != self.block_size:
+            self.block_size = block_size
+            self.close_planes()
+        if block_size > 1:
+            print("Reducing the channel maps by "+str(block_size)+"x"+str(block_size)+" pixel blocks ("+self.downsample_mode+")")
+
+
+    def plane_coordinates(self):
+        """
+        Pixel coordinates (x, y) of the cube at the centres of the pixels of the reduced planes, or
+        None at full resolution.
+        """
+        if self.block_size == 1:
+            return None
+        f = self.block_size
+        ny, nx = self.cube.shape[1]//f, self.cube.shape[2]//f
+        return np.arange(nx)*f+(f-1)/2, np.arange(ny)*f+(f-1)/2
+
+
+    def get_plane(self, channel):
+        """
+        Get the data of a channel as read-only float32 array.
+        """
+        if self.planes is None:
+            self.open_planes()
+        return self.planes[channel]
+
+
+    def get_planes(self, channels):
+        """
+        Get the data of several channels as a stack of float32 planes.
+        """
+        if self.planes is None:
+            self.open_planes()
+        return self.planes.get(channels)
+
+
+    def open_contours(self):
+        """
+        Set up the contour engine that traces the contour lines of the upcoming channels in the
+        background, loading stored lines if contour_cache is set.
+        """
+        from .ContourEngine import ContourEngine
+
+        if self.planes is None:
+            self.open_planes()
+        self.contours = ContourEngine(self.contourlevels, self.get_plane,
+                                      options     = self.contour_options(),
+                                      coordinates = self.plane_coordinates(),
+                                      workers = self.contour_workers,
+                                      ahead   = max(self.readahead, 2*self.contour_workers),
+                                      # all lines are kept only to be stored or without a budget
+                                      retain  = self.contour_cache or self.memory_budget is None
+                                     )
+        self.contours.set_order(self.channels)
+        key, cachefile = self.contour_cache_key()
+        if key is not None and self.contours.load(cachefile, **key):
+            print("Using cached contours from "+cachefile)
+
+
+    def contour_options(self):
+        """
+        The contourpy options that contour_kwargs set for tracing the lines. The other
+        contour_kwargs style the lines, see plot_contour. Raises a ValueError for contour_kwargs
+        that the contour lines cannot follow.
+        """
+        unsupported = [key for key in self.contour_kwargs if key not in self.contour_trace_kwargs and key not in self.contour_style_kwargs]
+        if unsupported:
+            raise ValueError("The contour_kwargs "+', '.join(unsupported)+" are not supported. Supported are "+
+                             ', '.join(list(self.contour_trace_kwargs)+self.contour_style_kwargs)+".")
+        return {self.contour_trace_kwargs[key]: value for key,value in self.contour_kwargs.items() if key in self.contour_trace_kwargs}
+
+
+    def contour_cache_key(self):
+        """
+        Sidecar file to store the contour lines of a fits file in ('<file>.contours.npz') and the
+        values that identify the data, or (None, None) if the lines are not stored.
+        """
+        if not (isinstance(self.source, str) and self.contour_cache and self.bins is None):
+            return None, None
+        stat = os.stat(self.source)
+        key = {'path': os.path.abspath(self.source), 'mtime': stat.st_mtime, 'size': stat.st_size,
+               'cutout': str(self.box), 'downsample': self.block_size
+              }
+        return key, self.source+'.contours.npz'
+
+
+    def get_contours(self, channel):
+        """
+        Get the contour lines of a channel as (segments, level index), see ContourEngine.
+        """
+        if self.contours is None:
+            self.open_contours()
+        return self.contours[channel]
+
+
+    def save_contours(self):
+        """
+        Store newly traced contour lines if contour_cache is set.
+        """
+        key, cachefile = self.contour_cache_key()
+        if key is not None and self.contours is not None and self.contours.modified:
+            try:
+                self.contours.save(cachefile, **key)
+                print("Stored contours in "+cachefile)
+            except OSError:
+                pass
 
 
     def set_range(self):
         """
-        Set minimum and maximum for plotting.
+        Set minimum and maximum for plotting. With scaling='channel', a range is set for every
+        channel instead (see set_channel_limits).
         """
         def round_to_4(x):
             return round(x, -int(np.floor(np.log10(np.abs(x))))+3)
 
-        if self.vmin==None:
-            self.vmin = round_to_4( self.cube.percentile(self.percentiles[0]).value )
-            print("Plotting from "+str(self.percentiles[0])+"th percentile ("+str(self.vmin)+") ", end='')
-        if self.vmax==None:
-            self.vmax = round_to_4( self.cube.percentile(self.percentiles[1]).value )
-            print("to "+str(self.percentiles[1])+"th percentile ("+str(self.vmax)+")")
+        with self.span('set_range'):
+            if self.scaling == 'channel':
+                self.set_channel_limits()
+                return
+            if self.vmin==None:
+                self.vmin = round_to_4( self.cube_percentile(self.percentiles[0]) )
+                print("Plotting from "+str(self.percentiles[0])+"th percentile ("+str(self.vmin)+") ", end='')
+            if self.vmax==None:
+                self.vmax = round_to_4( self.cube_percentile(self.percentiles[1]) )
+                print("to "+str(self.percentiles[1])+"th percentile ("+str(self.vmax)+")")
+
+
+    def set_channel_limits(self):
+        """
+        Set the color range of every channel from the percentiles of its own plane. The percentiles
+        of all selected channels are computed in one chunked pass, all planes of a chunk at once
+        (see plane_percentiles), on every n-th pixel for percentile_sample=1/n. With
+        scaling_window > 1, the ranges are smoothed by a running median over that many frames. A
+        given vmin or vmax fixes that end of the range for all channels. The ranges are stored in
+        channel_limits (channels x 2) for all channels, interpolated between the selected ones
+        where they are missing or invalid (e.g. empty planes).
+        """
+        from numpy.lib.stride_tricks import sliding_window_view
+        from .StreamingPercentiles import plane_percentiles
+
+        if self.planes is None:
+            self.open_planes()
+        channels = np.asarray(self.channels, dtype=np.intp)
+        stride = max(1, int(round(1/self.percentile_sample)))
+        limits = np.empty((len(channels),2))
+        done = 0
+        for chunk in self.planes.chunks(channels, self.chunk_bytes):
+            limits[done:done+len(chunk)] = plane_percentiles(chunk.reshape(len(chunk),-1)[:,::stride], self.percentiles).T
+            done += len(chunk)
+
+        limits[~(limits[:,1] > limits[:,0])] = np.nan
+        if self.scaling_window > 1 and len(limits) > 1:
+            before = self.scaling_window//2
+            padded = np.pad(limits, ((before, self.scaling_window-1-before), (0,0)), mode='edge')
+            with warnings.catch_warnings():
+                # windows of invalid channels only stay invalid
+                warnings.simplefilter('ignore', RuntimeWarning)
+                limits = np.nanmedian(sliding_window_view(padded, self.scaling_window, axis=0), axis=-1)
+        if self.vmin is not None:
+            limits[:,0] = self.vmin
+        if self.vmax is not None:
+            limits[:,1] = self.vmax
+
+        valid = limits[:,1] > limits[:,0]
+        if not valid.any():
+            raise ValueError("Cannot scale the channels individually, no selected channel has a valid range of values.")
+        order = np.argsort(channels[valid], kind='stable')
+        planes = np.arange(len(self.planes))
+        self.channel_limits = np.column_stack([np.interp(planes, channels[valid][order], limits[valid][order,i]) for i in [0,1]]).astype(np.float32)
+
+        window = " (running median over "+str(self.scaling_window)+" channels)" if self.scaling_window > 1 else ""
+        print("Scaling every channel from its "+str(self.percentiles[0])+"th to its "+str(self.percentiles[1])+"th percentile"+window+
+              ": vmin {0:.4g}...{1:.4g}, vmax {2:.4g}...{3:.4g}".format(*np.ravel([self.channel_limits[channels].min(axis=0), self.channel_limits[channels].max(axis=0)], order='F')))
+
+
+    def channel_range(self, channel):
+        """
+        The color range (vmin, vmax) of a channel: the same for all channels, or with
+        scaling='channel' the range of the channel (see set_channel_limits).
+        """
+        if self.scaling != 'channel':
+            return (self.vmin, self.vmax)
+        if self.channel_limits is None:
+            self.set_channel_limits()
+        vmin, vmax = self.channel_limits[channel]
+        return (float(vmin), float(vmax))
+
+
+    def cube_percentile(self, q):
+        """
+        The q-th percentile of the cube, either exact or estimated in a single streaming pass
+        (percentile_method='stream'). Out of core, the percentiles are always estimated, as the
+        exact percentile needs the whole cube in memory.
+        """
+        if self.percentile_method == 'stream' or self.bins is not None or self.out_of_core:
+            return self.percentile_estimator().percentile(q)
+        return self.cube.percentile(q).value
+
+
+    def percentile_estimator(self):
+        """
+        Histogram of the cube values to estimate any percentile from. It is built in one chunked
+        pass over the (optionally sampled) cube and stored in a sidecar file next to a fits file
+        ('<file>.percentiles.npz'), so that later runs on the unchanged file can skip the pass.
+        For binned channels, the histogram is built from the binned planes and not stored.
+        """
+        from .StreamingPercentiles import StreamingPercentiles
+
+        if self.histogram is not None:
+            return self.histogram
+
+        key = None
+        if isinstance(self.source, str) and self.percentile_cache and self.bins is None:
+            stat = os.stat(self.source)
+            key = {'path': os.path.abspath(self.source), 'mtime': stat.st_mtime, 'size': stat.st_size,
+                   'sample': self.percentile_sample, 'sampling': self.percentile_sampling,
+                   'cutout': str(self.box), 'downsample': self.block_size
+                  }
+            cachefile = self.source+'.percentiles.npz'
+            self.histogram = StreamingPercentiles.load(cachefile, **key)
+            if self.histogram is not None:
+                print("Using cached percentiles from "+cachefile)
+                return self.histogram
+
+        if self.planes is None:
+            self.open_planes()
+        self.histogram = StreamingPercentiles()
+        channels = np.arange(len(self.planes))
+        sample = self.percentile_sample
+        if sample < 1 and self.percentile_sampling == 'stride':
+            channels = channels[::max(1, int(round(1/sample)))]
+        rng = np.random.default_rng(0)
+        for chunk in self.planes.chunks(channels, self.chunk_bytes):
+            if sample < 1 and self.percentile_sampling == 'random':
+                values = chunk.ravel()[rng.integers(0, chunk.size, int(np.ceil(chunk.size*sample)))]
+                self.histogram.add(values, total=chunk.size)
+            elif sample < 1:
+                self.histogram.add(chunk, total=int(chunk.size*len(self.planes)/len(channels)), random=False)
+            else:
+                self.histogram.add(chunk)
+        print("Estimated percentiles to within {0:.2g} {1}".format(self.histogram.value_error(self.percentiles), self.cube.unit), end='')
+        if sample < 1 and self.histogram.rank_error() is not None:
+            print(" and +-{0:.2g} percentage points (95% confidence, sampled)".format(self.histogram.rank_error()), end='')
+        elif sample < 1:
+            # whole channels are not a random sample of the values
+            print(" (from every "+str(max(1, int(round(1/sample))))+"th channel)", end='')
+        print("")
+
+        if key is not None:
+            try:
+                self.histogram.save(cachefile, **key)
+            except OSError:
+                pass
+        return self.histogram
+
+
+    def get_settings(self):
+        """
+        Collect the current movie settings in a dictionary.
+        """
+        return {setting: getattr(self, setting) for setting in self.settings}
+
+
+    def apply_settings(self, settings):
+        """
+        Apply movie settings as returned by get_settings.
+        """
+        if 'cutout' in settings:
+            self.set_cutout(settings['cutout'])
+        for setting, value in settings.items():
+            setattr(self, setting, value)
 
 
     def select_channels(self,channels):
         """
-        Select the requested channels.
-        TODO: allow user input, add/average channels, resample cube
+        Select the requested channels and optionally combine them into bins (binning/bin_mode)
+        or resample them onto a spectral grid (spectral_grid). channels can be a list of channel
+        numbers, a (min, max) tuple of velocities/frequencies as astropy quantities or a list of
+        such tuples. An empty list selects all channels.
+        After binning, the channels are numbered by bin and spectral_axis holds the bin centres.
         """
+        if self.bins is not None:
+            self.spectral_axis = self.cube.spectral_axis
+            self.bins = None
+            self.channel_widths = None
+            self.histogram = None
+            self.close_planes()
+
+        self.channel_limits = None
+        channels = self.resolve_channels(channels)
+        if self.spectral_grid is not None:
+            self.resample_channels(channels)
+            channels = list(range(len(self.bins)))
+        elif self.binning > 1:
+            self.bin_channels(channels)
+            channels = list(range(len(self.bins)))
+
         self.channels = channels
+        if self.planes is not None:
+            self.planes.set_order(self.channels)
+        if self.contours is not None:
+            self.contours.set_order(self.channels)
         print("Selecting channels "+str(self.channels))
 
 
+    def spectral_axis_in(self, unit):
+        """
+        The spectral axis of the cube converted to the given unit, e.g. a velocity unit for a
+        frequency cube (using the rest frequency and velocity_convention).
+        """
+        import astropy.units as u
+
+        axis = self.cube.spectral_axis
+        try:
+            return axis.to(unit, equivalencies=u.spectral())
+        except u.UnitConversionError:
+            return self.cube.with_spectral_unit(unit, velocity_convention=self.velocity_convention).spectral_axis
+
+
+    def resolve_channels(self, channels):
+        """
+        Convert a channel selection to a list of channel numbers.
+        """
+        import astropy.units as u
+
+        if len(channels) == 0:
+            return list(range(len(self.cube)))
+        if isinstance(channels, tuple) and len(channels) == 2 and isinstance(channels[0], u.Quantity):
+            channels = [channels]
+        if isinstance(channels, u.Quantity):
+            channels = [tuple(channels)]
+        if isinstance(channels[0], (tuple, list, u.Quantity)):
+            selected = []
+            for low,high in channels:
+                axis = self.spectral_axis_in(u.Quantity(low).unit)
+                low, high = sorted([u.Quantity(low).to_value(axis.unit), u.Quantity(high).to_value(axis.unit)])
+                selected += [int(c) for c in np.nonzero((axis.value>=low) & (axis.value<=high))[0] if c not in selected]
+            return selected
+        return [int(c) for c in channels]
+
+
+    def bin_channels(self, channels):
+        """
+        Combine every binning consecutive selected channels into one frame, by their mean, sum or
+        maximum (bin_mode).
+        """
+        import astropy.units as u
+
+        if self.bin_mode not in self.bin_modes:
+            raise ValueError("Unknown bin_mode "+repr(self.bin_mode)+". Use one of "+', '.join(repr(mode) for mode in self.bin_modes)+".")
+        axis = self.cube.spectral_axis
+        width = np.abs(np.diff(axis[:2]))[0] if len(axis)>1 else 0*axis.unit
+        self.bins = []
+        for start in range(0, len(channels), self.binning):
+            group = np.asarray(channels[start:start+self.binning])
+            weights = np.full(len(group), 1./len(group) if self.bin_mode=='mean' else 1.)
+            self.bins.append((group, weights))
+        self.spectral_axis = u.Quantity([axis[group].mean() for group,weights in self.bins])
+        self.channel_widths = u.Quantity([len(group)*width for group,weights in self.bins])
+        print("Combining "+str(len(channels))+" channels into "+str(len(self.bins))+" bins ("+self.bin_mode+")")
+
+
+    def resample_channels(self, channels):
+        """
+        Resample the selected channels onto spectral_grid. A grid channel that is wider than the
+        channels of the cube is the mean of the channels it covers, weighted by their overlap with
+        it (the channels are taken as constant over their width). A narrower grid channel is
+        interpolated linearly between the two channels enclosing its centre.
+        """
+        grid = self.spectral_grid
+        axis = self.spectral_axis_in(grid.unit).value
+        values = grid.value
+        low, high = _channel_edges(axis)
+        grid_low, grid_high = _channel_edges(values)
+        selected = np.unique(channels)
+        selected = selected[np.argsort(axis[selected])]
+
+        position = np.interp(values, axis[selected], np.arange(len(selected)), left=np.nan, right=np.nan) if len(selected)>0 else np.full(len(values), np.nan)
+        inside = np.isfinite(position)
+        if not inside.all():
+            warnings.warn("\nDropping "+str(np.sum(~inside))+" values of spectral_grid outside of the selected channels.\n",
+                          UserWarning,
+                          stacklevel = 2
+                         )
+        self.bins = []
+        for k in np.flatnonzero(inside):
+            overlap = np.clip(np.minimum(high[selected], grid_high[k])-np.maximum(low[selected], grid_low[k]), 0, None)
+            native = np.interp(values[k], axis[selected], high[selected]-low[selected])
+            if grid_high[k]-grid_low[k] > native and overlap.sum() > 0:
+                covered = overlap > 0
+                self.bins.append((selected[covered], overlap[covered]/overlap.sum()))
+            else:
+                i = min(int(np.floor(position[k])), max(len(selected)-2, 0))
+                f = position[k]-i
+                self.bins.append((selected[[i,min(i+1,len(selected)-1)]], np.array([1-f,f])))
+        self.spectral_axis = grid[inside]
+        self.channel_widths = (grid_high-grid_low)[inside]*grid.unit if len(grid)>1 else None
+        print("Resampling "+str(len(selected))+" channels onto "+str(len(self.bins))+" spectral grid points")
+
+
     def create_figure(self, channel):
         """
-        TODO: figure out how to force mpl to draw already the first frame with tight_layout
+        The figure is drawn off-screen on an Agg canvas, without pyplot, so no GUI backend is
+        loaded or probed. A preview has its own window (see PreviewPlayer). A figure kept for
+        reuse (see keep_figure) is reset and drawn into instead of setting up a new one.
         """
-        self.fig = plt.figure(figsize      = self.figsize,
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        if _kept_figures:
+            self.fig = _kept_figures.pop()
+            self.reset_figure()
+        else:
+            self.fig = Figure(figsize      = self.figsize,
                               tight_layout = True
                              )
-        self.ax = plt.subplot(111,
-                              projection = self.cube.wcs,
-                              slices     = ('x', 'y', channel)
-                             )
+            FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot(111,
+                                       projection = self.cube.wcs,
+                                       slices     = ('x', 'y', channel)
+                                      )
         # self.fig.subplots_adjust(left=0, bottom=0, right=1, top=1, wspace=None, hspace=None)
         # plt.tight_layout()
 
 
+    def reset_figure(self):
+        """
+        Clear a kept figure and set it up as a new figure of this movie: size, default resolution,
+        subplot parameters and tight_layout.
+        """
+        self.fig.clear()
+        # the subplot parameters are only adjustable without a layout engine
+        tight = hasattr(self.fig, 'set_layout_engine')
+        if tight:
+            self.fig.set_layout_engine('none')
+        else:
+            self.fig.set_tight_layout(False)
+        self.fig.subplots_adjust(**{key: mpl.rcParams['figure.subplot.'+key] for key in ['left', 'bottom', 'right', 'top', 'wspace', 'hspace']})
+        self.fig.set_size_inches(self.figsize)
+        self.fig.set_dpi(mpl.rcParams['figure.dpi'])
+        if tight:
+            self.fig.set_layout_engine('tight')
+        else:
+            self.fig.set_tight_layout(True)
+
+
+    def keep_figure(self):
+        """
+        Keep the figure for the next render in this process to draw into (see create_figure),
+        e.g. the figure a batch worker warmed up with.
+        """
+        _kept_figures.append(self.fig)
+
+
     def plot_map(self, channel):
         """
         Initialize the map.
         TODO: allow for other stretches.
         """
-        self.map = self.ax.imshow(self.cube[channel,:,:].value,
+        self.set_block_size()
+        imshow_kwargs = dict(self.imshow_kwargs)
+        if self.block_size > 1:
+            # the reduced plane covers the same pixel coordinates as the full plane
+            f = self.block_size
+            ny, nx = self.cube.shape[1]//f*f, self.cube.shape[2]//f*f
+            imshow_kwargs.setdefault('extent', (-0.5, nx-0.5, -0.5, ny-0.5))
+        if self.renderer == 'numpy':
+            # the interpolation of the numpy renderer, also for the first frame drawn by matplotlib
+            imshow_kwargs['interpolation'] = 'nearest'
+        vmin, vmax = self.channel_range(channel)
+        self.map = self.ax.imshow(self.get_plane(channel),
                              origin = 'lower',
-                             cmap   = getattr(plt.cm, self.cmap),
-                             vmin   = self.vmin,
-                             vmax   = self.vmax,
-                             **self.imshow_kwargs
+                             cmap   = self.colormap(),
+                             vmin   = vmin,
+                             vmax   = vmax,
+                             **imshow_kwargs
                             )
 
     def plot_contour(self, channel):
         """
-        Initialize the contours.
+        Initialize the contours. A regular ContourSet of the first channel (drawn with
+        contour_kwargs, see contour_options) determines the line styles of the levels and provides
+        the lines for the colorbar. The contours of the frames
+        are drawn as a single LineCollection that is updated with the pre-computed lines of each
+        channel (see ContourEngine).
         """
-        if self.contourlevels is not []:
-            self.contour = self.ax.contour(self.cube[channel,:,:].value,
+        from matplotlib.collections import LineCollection
+
+        self.contour = None
+        self.contour_lines = None
+        if self.contourlevels:
+            self.contour_options()
+            coordinates = self.plane_coordinates() or ()
+            self.contour = self.ax.contour(*coordinates, self.get_plane(channel),
                                  levels = self.contourlevels,
-                                 colors = 'k',
-                                 **self.contour_kwargs
+                                 **{'colors': 'k', **self.contour_kwargs}
                                 )
+            if isinstance(self.contour, mpl.artist.Artist):
+                # matplotlib >=3.8: the ContourSet is a single artist
+                prototype = [self.contour]
+            else:
+                prototype = list(self.contour.collections)
+            self.contour_styles = self.contour_style(prototype)
+            self.contour_lines = LineCollection([],
+                                                transform    = prototype[0].get_transform(),
+                                                zorder       = prototype[0].get_zorder(),
+                                                alpha        = prototype[0].get_alpha(),
+                                                antialiaseds = prototype[0].get_antialiased()
+                                               )
+            for artist in prototype:
+                artist.remove()
+            self.ax.add_collection(self.contour_lines, autolim=False)
+            self.set_contour_lines(channel)
+
+    def contour_style(self, prototype):
+        """
+        Colors, line widths and line styles of the contour levels as drawn by matplotlib.
+        """
+        nlevels = len(self.contour.levels)
+        colors = np.concatenate([artist.get_edgecolor() for artist in prototype])
+        widths = np.concatenate([np.atleast_1d(artist.get_linewidths()) for artist in prototype])
+        styles = [style for artist in prototype for style in artist.get_linestyles()]
+        colors = colors[np.arange(nlevels)%len(colors)]
+        widths = widths[np.arange(nlevels)%len(widths)]
+        styles = [styles[i%len(styles)] for i in range(nlevels)]
+        # the dash patterns are returned scaled by the line width, which set_linestyle applies again
+        if mpl.rcParams['lines.scale_dashes']:
+            styles = [(offset/width, [dash/width for dash in dashes]) if dashes is not None and width>0 else (offset, dashes)
+                      for (offset, dashes),width in zip(styles, widths)]
+        return colors, widths, styles
+
+    def set_contour_lines(self, channel):
+        """
+        Show the contour lines of the given channel.
+        """
+        segments, index = self.get_contours(channel)
+        colors, widths, styles = self.contour_styles
+        self.contour_lines.set_segments(segments)
+        if len(segments) > 0:
+            self.contour_lines.set_color(colors[index])
+            # widths and styles are broadcast against each other, so reset the styles first to
+            # not broadcast the new widths against the styles of the previous frame
+            self.contour_lines.set_linestyle('solid')
+            self.contour_lines.set_linewidth(widths[index])
+            self.contour_lines.set_linestyle([styles[i] for i in index])
+
+    def contour_artists(self):
+        """
+        The artists that make up the current contours.
+        """
+        if self.contour_lines is None:
+            return []
+        return [self.contour_lines]
+
+    def remove_contour(self):
+        """
+        Remove the contours from the plot.
+        """
+        for artist in self.contour_artists():
+            artist.remove()
+        self.contour_lines = None
+
+    def prepare_overlays(self):
+        """
+        Compute what the static overlays show (e.g. moment maps of the cube), once.
+        """
+        for overlay in self.overlays:
+            overlay.prepare(self)
+
+
+    def plot_overlays(self):
+        """
+        Draw the static overlays (see Overlays) on top of the map, keeping the limits of the map.
+        """
+        self.prepare_overlays()
+        limits = self.ax.get_xlim(), self.ax.get_ylim()
+        for overlay in self.overlays:
+            overlay.draw(self)
+        self.ax.set_xlim(*limits[0])
+        self.ax.set_ylim(*limits[1])
+
 
     def channel_overlay(self, channel):
         """
@@ -290,7 +1180,8 @@ class CubeToMovie:
             if self.cbarlabel == 'auto':
                 self.cbarlabel = self.cube.header['bunit']
             self.cbar.set_label(self.cbarlabel)
-            self.cbar.add_lines(self.contour)
+            if self.contour is not None:
+                self.cbar.add_lines(self.contour)
 
 
     def set_up_plot(self):
@@ -300,12 +1191,16 @@ class CubeToMovie:
 
         print("Preparing channel map display ...")
         channel = 0
-        self.create_figure(channel)
-        self.plot_map(channel)
-        self.plot_contour(channel)
-        self.channel_overlay(channel)
-        self.set_axis_labels()
-        self.show_colorbar()
+        self.labels = {}
+        self.check_renderer()
+        with self.span('set_up_plot'):
+            self.create_figure(channel)
+            self.plot_map(channel)
+            self.plot_contour(channel)
+            self.plot_overlays()
+            self.channel_overlay(channel)
+            self.set_axis_labels()
+            self.show_colorbar()
 
 
     # def init_channel(self):
@@ -330,88 +1225,757 @@ class CubeToMovie:
 
 
     def plot_channel(self, channel):
-        global contour
+        with self.span('fetch', 'frame', channel=channel):
+            plane = self.get_plane(channel)
+        self.map.set_array(plane)
+        if self.scaling == 'channel':
+            # also updates the colorbar
+            self.map.set_clim(*self.channel_range(channel))
 
-        self.map.set_array(self.cube[channel,:,:].value)
+        if self.contour_lines is not None:
+            with self.span('contour', 'frame', channel=channel):
+                self.set_contour_lines(channel)
 
-        if self.contourlevels is not []:
-            for c in self.contour.collections:
-                c.remove()
-            self.contour = self.ax.contour(self.cube[channel,:,:].value,
-                                 levels = self.contourlevels,
-                                 colors = 'k',
-                                 **self.contour_kwargs
-                                )
+        self.plot_label(channel)
+        return self.dynamic_artists()
 
-        self.chan_olay = self.spectral_axis[channel]
+
+    def plot_label(self, channel):
+        """
+        Show the velocity/frequency of the given channel in the channel label.
+        """
+        self.chanlabel.set_text(self.label(channel))
+
+
+    def label(self, channel):
+        """
+        The text of the channel label of a channel. The labels of all selected channels are
+        formatted on first use (see channel_labels).
+        """
+        if channel not in self.labels:
+            self.labels.update(self.channel_labels(self.channels))
+            if channel not in self.labels:
+                self.labels.update(self.channel_labels([channel]))
+        return self.labels[channel]
+
+
+    def channel_labels(self, channels):
+        """
+        Format the channel labels of the given channels, converting their spectral coordinates
+        (and bin widths) to channelunit in one go. Returns a dictionary channel: label.
+        """
+        channels = [int(channel) for channel in channels]
+        values = self.spectral_axis[channels]
         if self.channelunit != 'auto':
-            self.chan_olay = self.chan_olay.to(self.channelunit)
-        self.chanlabel.set_text(("{0:."+str(self.decimals)+"f}\,{1}").format(self.chan_olay.value,self.chan_olay.unit.to_string('latex_inline')))
-        return [self.map, self.contour, self.chanlabel]
+            values = values.to(self.channelunit)
+        unit = values.unit.to_string('latex_inline')
+        # \, is a thin space in LaTeX text mode only
+        space = '\\,' if self.usetex else '$\\,$'
+        labels = [("{0:."+str(self.decimals)+"f}"+space+"{1}").format(value,unit) for value in values.value]
+        if self.channel_widths is not None:
+            widths = self.channel_widths[channels].to(values.unit)
+            labels = [label+(" ($\\Delta$ {0:."+str(self.decimals)+"f}"+space+"{1})").format(width,unit) for label,width in zip(labels,widths.value)]
+        return dict(zip(channels, labels))
+
+
+    def dynamic_artists(self):
+        """
+        The artists that change from frame to frame: map, contours, colorbar (with
+        scaling='channel') and channel label.
+        """
+        return [self.map] + self.contour_artists() + self.colorbar_artists() + [self.chanlabel]
+
+
+    def colorbar_artists(self):
+        """
+        The colorbar axes if it changes from frame to frame, i.e. with scaling='channel'.
+        """
+        if self.scaling == 'channel' and self.show_cbar:
+            return [self.cbar.ax]
+        return []
+
+
+    def cache_background(self):
+        """
+        Render everything that stays the same from frame to frame (axes, coordinate grid, colorbar,
+        labels) once and keep the rasterized background for blitting. The layout is fixed (see
+        fix_layout) so that tight_layout does not shift the static parts between frames.
+        """
+        self.fix_layout()
+        for artist in self.dynamic_artists():
+            artist.set_animated(True)
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.cache_foreground()
+        self.cache_labels()
+
+
+    def settle_layout(self):
+        """
+        Draw the figure at the movie resolution until tight_layout no longer moves the axes, so
+        that already the first frame has the final layout. The map keeps its aspect, which
+        takes tight_layout a few passes to converge.
+        """
+        if self.dpi is not None:
+            self.fig.set_dpi(self.dpi)
+        positions = None
+        for attempt in range(10):
+            self.fig.canvas.draw()
+            previous, positions = positions, [ax.get_position().bounds for ax in self.fig.axes]
+            if positions == previous:
+                break
+
+
+    def fix_layout(self):
+        """
+        Settle the layout at the movie resolution and keep it for all frames, so that tight_layout
+        does not move the axes between frames.
+        """
+        self.settle_layout()
+        if hasattr(self.fig, 'set_layout_engine'):
+            self.fig.set_layout_engine('none')
+        else:
+            self.fig.set_tight_layout(False)
+
+
+    def cache_labels(self):
+        """
+        Rasterize the channel labels of the selected channels once (see LabelAtlas), so that no
+        text is rendered per frame.
+        """
+        from .LabelAtlas import LabelAtlas
+
+        self.label_atlas = LabelAtlas(self)
+        self.label_atlas.prepare(self.channels)
+
+
+    def cache_foreground(self):
+        """
+        Rasterize the parts of the axes that are drawn on top of the map (frame, ticks, grid) on a
+        transparent canvas and keep the non-transparent pixels within the axes, so that they can
+        be put back on top of the blitted map. The map, contours and channel label are hidden, as
+        being animated does not keep an image out of Axes.draw in every matplotlib version.
+        """
+        patch = self.fig.patch.get_alpha(), self.ax.patch.get_visible()
+        hidden = [artist for artist in self.fig.get_children() if artist not in [self.ax, self.fig.patch] and artist.get_visible()]
+        hidden += [artist for artist in [self.map] + self.contour_artists() + [self.chanlabel] if artist.get_visible()]
+        self.fig.patch.set_alpha(0)
+        self.ax.patch.set_visible(False)
+        for artist in hidden:
+            artist.set_visible(False)
+        self.fig.canvas.draw()
+        foreground = np.array(self.frame_buffer())
+        for artist in hidden:
+            artist.set_visible(True)
+        self.fig.patch.set_alpha(patch[0])
+        self.ax.patch.set_visible(patch[1])
+
+        # only pixels within the axes can be covered by the map
+        height = foreground.shape[0]
+        x0, y0, x1, y1 = self.ax.bbox.extents
+        inside = np.zeros(foreground.shape[:2], dtype=bool)
+        inside[max(int(height-y1),0):int(np.ceil(height-y0)), max(int(x0),0):int(np.ceil(x1))] = True
+        self.foreground_pixels = np.nonzero(inside & (foreground[:,:,3]>0))
+        self.foreground_rgb = foreground[self.foreground_pixels][:,:3].astype(np.uint16)
+        self.foreground_alpha = foreground[self.foreground_pixels][:,3:].astype(np.uint16)
+
+
+    def composite_foreground(self, frame):
+        """
+        Alpha-blend the cached foreground onto an RGBA frame in place.
+        """
+        pixels = frame[self.foreground_pixels][:,:3]
+        frame[self.foreground_pixels+(slice(0,3),)] = (pixels*(255-self.foreground_alpha) + self.foreground_rgb*self.foreground_alpha + 127)//255
 
 
     def animate(self):
         """
-        Run the animation.
+        Run the animation. With preview_movie, a PreviewPlayer plays frames that are rasterized
+        ahead of time, otherwise the animation is set up for saving with a matplotlib writer.
         """
-        import matplotlib.animation as animation
         print("Animating ...")
-        self.movie = animation.FuncAnimation(self.fig,
+        if self.preview_movie:
+            from .PreviewPlayer import PreviewPlayer
+            self.movie = PreviewPlayer(self, buffer_size=self.preview_buffer)
+            self.movie.start()
+        else:
+            self.movie = self.function_animation()
+
+
+    def function_animation(self):
+        """
+        A matplotlib FuncAnimation that updates the figure channel by channel.
+        """
+        import matplotlib.animation as animation
+        return animation.FuncAnimation(self.fig,
                                         func      = self.plot_channel,
                                         frames    = self.channels,
                                         # init_func = self.init_channel,
                                         interval  = 1/self.fps*1000,                # in milliseconds
                                         repeat    = self.repeat,
-                                        blit      = False,                          # must be false due to contour animation
-                                        cache_frame_data = True                     # keep memory impact low
+                                        blit      = self.renderer == 'blit',
+                                        cache_frame_data = False                    # do not keep the data of every frame
                                        )
 
 
-    def save_movie(self):
+    def draw_frame(self, channel):
+        """
+        Update the plot to the given channel and render it to the canvas.
+        With renderer='blit', only the map, contours and a changing colorbar are drawn on top of the
+        cached background, followed by the cached foreground and the rasterized channel label.
+        """
+        self.plot_channel(channel)
+        with self.span('draw', 'frame', channel=channel):
+            if self.renderer == 'blit':
+                self.fig.canvas.restore_region(self.background)
+                for artist in [self.map] + self.contour_artists():
+                    self.ax.draw_artist(artist)
+                for artist in self.colorbar_artists():
+                    self.fig.draw_artist(artist)
+                frame = self.frame_buffer()
+                self.composite_foreground(frame)
+                self.label_atlas.composite(frame, channel)
+                if self.is_interactive:
+                    self.fig.canvas.blit(self.fig.bbox)
+            else:
+                self.fig.canvas.draw()
+
+
+    def frame_buffer(self):
+        """
+        The RGBA pixel buffer of the rendered canvas (height x width x 4, uint8) without copying.
+        """
+        return np.asarray(self.fig.canvas.buffer_rgba())
+
+
+    def iter_frames(self):
+        """
+        Render the selected channels one by one and yield the canvas buffer for each frame. The
+        buffer is overwritten by the next frame, so it must be consumed or copied right away.
+        """
+        self.check_renderer()
+        if self.frame_cache is None:
+            yield from self.render_frames(self.channels)
+        else:
+            yield from self.iter_cached_frames()
+
+
+    def check_renderer(self):
+        """
+        Fall back to renderer='blit' if the numpy renderer cannot draw what is asked for: contours
+        and imshow_kwargs other than aspect and interpolation='nearest'.
+        """
+        if self.renderer != 'numpy':
+            return
+        unsupported = [key for key,value in self.imshow_kwargs.items() if key != 'aspect' and (key, value) != ('interpolation', 'nearest')]
+        if self.contourlevels:
+            reason = "cannot draw contours"
+        elif unsupported:
+            reason = "does not support the imshow_kwargs "+', '.join(unsupported)
+        else:
+            return
+        warnings.warn("\nThe numpy renderer "+reason+". Falling back to renderer='blit'.\n",
+                      UserWarning,
+                      stacklevel = 3
+                     )
+        self.renderer = 'blit'
+
+
+    def render_frames(self, channels):
+        """
+        Draw the given channels with the selected renderer and yield the frames.
+        """
+        self.prepare_renderer()
+        yield from self.draw_frames(channels)
+
+
+    def prepare_renderer(self):
+        """
+        Set up the figure for drawing frames with the selected renderer: cache the background
+        (renderer='blit' and 'numpy') or fix the layout.
+        """
+        if self.renderer == 'numpy':
+            from .NumpyRenderer import NumpyRenderer
+            self.numpy_renderer = NumpyRenderer(self, batch_size=self.batch_size)
+            self.numpy_renderer.prepare()
+        elif self.renderer == 'blit':
+            self.cache_background()
+        elif self.scaling == 'channel':
+            # the tick labels of the colorbar change, the layout must not follow them
+            self.fix_layout()
+        else:
+            # also the first frame of a segment (see render_parallel) is drawn with the final layout
+            self.settle_layout()
+
+
+    def draw_frames(self, channels):
+        """
+        Draw the given channels with the renderer set up by prepare_renderer and yield the frames.
+        """
+        if self.renderer == 'numpy':
+            yield from self.numpy_renderer.iter_frames(channels)
+            return
+        for channel in channels:
+            self.draw_frame(channel)
+            yield self.frame_buffer()
+
+
+    def iter_cached_frames(self):
+        """
+        Yield the frames of the selected channels, loading unchanged frames from the frame cache
+        and drawing (and storing) only the others. Frames are stored as soon as they are drawn,
+        so an interrupted render continues where it stopped.
+        """
+        import collections
+        from .FrameCache import FrameCache
+
+        cache = FrameCache(self.frame_cache, max_bytes=self.frame_cache_bytes)
+        keys = self.frame_keys(self.channels)
+        missing = [channel for channel,key in zip(self.channels,keys) if key not in cache]
+        print("Reusing "+str(len(self.channels)-len(missing))+" of "+str(len(self.channels))+" frames from "+self.frame_cache)
+
+        prepared = bool(missing)
+        if prepared:
+            self.prepare_renderer()
+        rendered = self.draw_frames(missing)
+        missing = collections.deque(missing)
+        for channel, key in zip(self.channels, keys):
+            if missing and channel == missing[0]:
+                # the frames are drawn in the order of the missing channels
+                missing.popleft()
+                frame = next(rendered)
+                cache.put(key, frame)
+            else:
+                frame = cache.get(key)
+                if frame is None:
+                    # the cached frame was evicted (or is unreadable) since the check, draw it on
+                    # its own with the same renderer
+                    if not prepared:
+                        self.prepare_renderer()
+                        prepared = True
+                    frame = next(self.draw_frames([channel]))
+                    cache.put(key, frame)
+            yield frame
+
+
+    def frame_keys(self, channels):
+        """
+        Keys that identify the content of the frames of the given channels: the channel plane,
+        the channel label and everything else that affects the pixels of a frame (frame_settings,
+        WCS, unit, matplotlib version). The plane of a fits file is identified by the path, mtime
+        and size of the file and the channels, cutout and downsampling it is read with, like the
+        sidecar caches. The planes of a cube in memory are hashed as read (after cutout, binning
+        and downsampling), in one pass that bypasses the plane cache.
+        """
+        import hashlib
+        from .FrameCache import content_repr
+
+        if self.planes is None:
+            self.open_planes()
+        # the overlays are identified by what they show, e.g. the data of a contour image
+        self.prepare_overlays()
+        settings = [(setting, getattr(self, setting)) for setting in self.frame_settings]
+        base = hashlib.sha1(content_repr([settings, self.cube.wcs.to_header_string(), str(self.cube.unit), mpl.__version__]).encode())
+
+        channels = list(channels)
+        if isinstance(self.source, str) and os.path.isfile(self.source):
+            stat = os.stat(self.source)
+            base.update(content_repr({'path': os.path.abspath(self.source), 'mtime': stat.st_mtime, 'size': stat.st_size,
+                                      'cutout': str(self.box), 'downsample': (self.block_size, self.downsample_mode),
+                                      'bin_mode': self.planes.reader.mode if self.bins is not None else None
+                                     }).encode())
+            planes = ([channel] if self.bins is None else self.bins[channel] for channel in channels)
+        else:
+            planes = (np.ascontiguousarray(plane) for chunk in self.planes.chunks(channels, self.chunk_bytes) for plane in chunk)
+
+        keys = []
+        for channel, plane in zip(channels, planes):
+            key = base.copy()
+            key.update(content_repr(plane).encode())
+            label = (self.spectral_axis[channel], None if self.channel_widths is None else self.channel_widths[channel], self.channel_range(channel))
+            key.update(repr(label).encode())
+            keys.append(key.hexdigest())
+        return keys
+
+
+    # codecs for output containers that the default codec does not fit
+    output_codecs = {'.webm': 'libvpx-vp9', '.gif': 'gif', '.png': 'png', '.apng': 'apng'}
+
+    def output_specs(self, outputs=None):
+        """
+        Complete the output specs (see save_movie) with the movie settings: a spec is a file name
+        or a dictionary with 'out' and optionally 'encoder', 'codec', 'bitrate', 'scale' and
+        'extra_args'. The encoder is 'palette' (see PaletteWriter) for gif and apng and 'ffmpeg'
+        otherwise. The codec defaults to self.codec or, for webm, gif and png, to a codec of that
+        format. Without outputs, the only output is self.out.
+        """
+        outputs = outputs if outputs is not None else self.outputs
+        if not outputs:
+            outputs = [self.out]
+        specs = []
+        for output in outputs:
+            if isinstance(output, str):
+                output = {'out': output}
+            ext = os.path.splitext(output['out'])[1].lower()
+            codec = output.get('codec', self.output_codecs.get(ext, self.codec))
+            specs.append({'out':        output['out'],
+                          'encoder':    output.get('encoder', 'palette' if ext in ['.gif','.apng'] else 'ffmpeg'),
+                          'codec':      codec,
+                          'bitrate':    output.get('bitrate', self.bitrate if codec not in ['gif','png','apng'] else None),
+                          'scale':      output.get('scale', 1),
+                          'extra_args': output.get('extra_args', self.movie_kwargs.get('extra_args', []))
+                         })
+        return specs
+
+
+    def colormap(self):
+        """
+        The matplotlib colormap called cmap.
+        """
+        from matplotlib import cm
+        return getattr(cm, self.cmap)
+
+
+    def palette_colors(self, n=224):
+        """
+        Colours of the colormap for the global palette of GIF and APNG outputs (see PaletteWriter).
+        The remaining colours of the palette are taken from the figure.
+        """
+        cmap = self.colormap()
+        return cmap(np.linspace(0, 1, min(n, cmap.N)), bytes=True)[:,:3]
+
+
+    def save_movie(self, outputs=None):
         """
         Save the animation as a movie file.
-        TODO: fix potential problems with writers.
-                imagemagick: TypeError: 'str' object is not callable
-                pillow: ValueError: buffer is not large enough
-                ffmpeg: may need to specify path to ffmpeg in plt.rcParams['animation.ffmpeg_path'] = '/usr/local/bin/ffmpeg'
+        The default writer 'pipe' renders the frames directly to the canvas and streams the raw
+        pixel buffers to ffmpeg in the background (see FrameWriter). Any other writer name is
+        handed to matplotlib.animation.FuncAnimation.save instead.
+        With several outputs (a list of file names or output specs, see output_specs; default:
+        self.outputs), every frame is rendered once and handed to one encoder per output, which
+        run concurrently and scale the frames as needed. An output like 'frames/%04d.png' writes
+        a sequence of images. Several outputs require writer='pipe'.
+        ffmpeg: may need to specify path to ffmpeg in plt.rcParams['animation.ffmpeg_path'] = '/usr/local/bin/ffmpeg'
         """
         from astropy.utils.console import ProgressBar
+        from .Instrumentation import profiled, current_rss
+
+        specs = self.output_specs(outputs)
+        if len(specs) > 1 and self.writer != 'pipe':
+            raise ValueError("Several outputs require writer='pipe'.")
 
         warnings.warn("\nOnly ffmpeg is supported at the moment to write out the movie. If saving fails, make sure matplotlib can find your ffmpeg installation. You may need to set plt.rcParams['animation.ffmpeg_path'] = '/usr/bin/ffmpeg' to the appropriate path returned by 'which ffmpeg'.\n",
                       UserWarning,
                       stacklevel = 2
                      )
 
-        def update_progressbar(current_frame, total_frames):
-            bar.update()
-
         print("Saving frames ...")
-        with ProgressBar(len(self.channels)) as bar:
-            self.movie.save(self.out,
-                        writer  = self.writer,
-                        fps     = self.fps,
-                        dpi     = self.dpi,
-                        bitrate = self.bitrate,
-                        codec   = self.codec,
-                        progress_callback = update_progressbar,
-                        metadata   = self.metadata,
-                        **self.movie_kwargs
-                       )
-        print("Movie saved as "+self.out)
+        with self.span('save_movie'), profiled(self.profile):
+            if self.writer == 'pipe':
+                from .FrameWriter import FrameWriter
+                from .PaletteWriter import PaletteWriter
+
+                with ProgressBar(len(self.channels)) as bar:
+                    with contextlib.ExitStack() as stack:
+                        writers = []
+                        for spec in specs:
+                            if os.path.dirname(spec['out']):
+                                os.makedirs(os.path.dirname(spec['out']), exist_ok=True)
+                            if spec['encoder'] == 'palette':
+                                writers.append(stack.enter_context(PaletteWriter(spec['out'],
+                                                                                 fps         = self.fps,
+                                                                                 colors      = self.palette_colors(),
+                                                                                 scale       = spec['scale'],
+                                                                                 queue_depth = self.queue_depth
+                                                                                )))
+                                continue
+                            writers.append(stack.enter_context(FrameWriter(spec['out'],
+                                                                           fps         = self.fps,
+                                                                           codec       = spec['codec'],
+                                                                           bitrate     = spec['bitrate'],
+                                                                           metadata    = self.metadata,
+                                                                           queue_depth = self.queue_depth,
+                                                                           extra_args  = spec['extra_args'],
+                                                                           scale       = spec['scale']
+                                                                          )))
+                        # a preview started from the frames as they are saved (see save_with_preview)
+                        preview = getattr(self, 'movie', None)
+                        if not getattr(preview, 'feeding', False):
+                            preview = None
+                        start = time.perf_counter()
+                        for frame, channel in zip(self.iter_frames(), self.channels):
+                            with self.span('encode', 'frame', channel=channel):
+                                for writer in writers:
+                                    writer.write(frame)
+                            if preview is not None:
+                                preview.feed(frame)
+                            bar.update()
+                            if self.memory_budget is not None:
+                                self.memory_peak = max(self.memory_peak, current_rss())
+                            if self.hooks:
+                                start = self.frame_done(channel, start)
+            else:
+                start = time.perf_counter()
+                def update_progressbar(current_frame, total_frames):
+                    nonlocal start
+                    bar.update()
+                    if self.hooks:
+                        start = self.frame_done(self.channels[current_frame%len(self.channels)], start)
+
+                movie = getattr(self, 'movie', None)
+                if not hasattr(movie, 'save'):
+                    movie = self.function_animation()
+                with ProgressBar(len(self.channels)) as bar:
+                    movie.save(specs[0]['out'],
+                                writer  = self.writer,
+                                fps     = self.fps,
+                                dpi     = self.dpi,
+                                bitrate = specs[0]['bitrate'],
+                                codec   = specs[0]['codec'],
+                                progress_callback = update_progressbar,
+                                metadata   = self.metadata,
+                                **self.movie_kwargs
+                               )
+        self.save_contours()
+        for spec in specs:
+            print("Movie saved as "+spec['out'])
+
+    def save_with_preview(self):
+        """
+        Save the movie and show a preview that starts with the first rendered frame (see
+        PreviewPlayer with feed=True) instead of waiting for the whole movie to be encoded. The
+        preview rasterizes what it has not been fed once the movie is saved, and restores the
+        environment when it is over. Only writer='pipe' hands the frames over as they are rendered;
+        with any other writer, the preview starts after saving.
+        """
+        if self.writer != 'pipe':
+            self.save_movie()
+            self.animate()
+            return
+
+        from .PreviewPlayer import PreviewPlayer
+        print("Animating ...")
+        self.movie = PreviewPlayer(self, buffer_size=self.preview_buffer, feed=True)
+        self.movie.start()
+        saved = False
+        try:
+            self.save_movie()
+            saved = True
+        finally:
+            self.movie.end_feed(saved)
 
     def stop_animation(self):
         """
-        Stop the currently running animation.
-        TODO: implement stop on click in interactive mode
+        Stop the currently running animation. The preview also stops on a click into its window or
+        the space bar.
         """
-        self.movie.event_source.stop()
+        self.movie.pause()
 
     def start_animation(self):
         """
-        (Re-)start the current animation.
-        TODO: implement start on click in interactive mode
+        (Re-)start the current animation where it was stopped.
+        """
+        self.movie.resume()
+
+
+    def split_channels(self, segments):
+        """
+        Split the selected channels into contiguous, non-empty segments in channel order.
+        """
+        return [list(segment) for segment in np.array_split(np.asarray(self.channels), segments) if len(segment)>0]
+
+
+    def render_parallel(self):
+        """
+        Render and encode the movie in segments of contiguous channels on several worker processes.
+        Every worker builds its own figure from the current settings, so vmin/vmax must be set
+        already (see set_range). The segments are joined losslessly into the final movie.
+        Several outputs and paletted GIF or APNG outputs cannot be joined from segments, so they are
+        rendered in this process, as is a movie that gets a single worker (e.g. within the memory
+        budget).
+        While waiting for the workers, a 'segments' span is reported to the hooks every half second.
+        If a hook raises (e.g. a cancelled RenderHandle) or a segment fails, the other segments stop
+        at their next frame, which kills their ffmpeg, and the segments are deleted. The movie is
+        only written once all segments are done.
+        """
+        import shutil
+        import tempfile
+        import multiprocessing
+        import concurrent.futures
+
+        specs = self.output_specs()
+        workers = self.workers
+        if self.memory_budget is not None:
+            from .Instrumentation import current_rss
+            # the workers share what this process leaves of the budget; each of them needs at
+            # least about as much as this process for the interpreter and the cube, plus its figure
+            used = current_rss()
+            workers = int(max(1, min(workers, (self.memory_budget-used)//(used+self.figure_bytes()))))
+            if workers < self.workers:
+                print("Using "+str(workers)+" workers to stay within the memory budget")
+
+        if len(specs) > 1 or specs[0]['encoder'] == 'palette':
+            warnings.warn("\nSeveral outputs and GIF or APNG outputs with a global palette cannot be rendered in parallel segments. Rendering with a single worker.\n",
+                          UserWarning,
+                          stacklevel = 2
+                         )
+            workers = 1
+        if workers <= 1 or len(self.channels) <= 1:
+            # a single segment is rendered in this process, without starting a worker
+            self.set_up_plot()
+            self.animate()
+            self.save_movie()
+            return
+
+        # the workers get the overlays with what they show, e.g. moment maps, already computed
+        self.prepare_overlays()
+
+        if self.contourlevels and self.contour_cache:
+            # trace all contours once, the workers load them from the sidecar file
+            if self.contours is None:
+                self.open_contours()
+            self.contours.precompute(self.channels)
+            self.save_contours()
+
+        settings = self.get_settings()
+        if self.memory_budget is not None:
+            settings['memory_budget'] = (self.memory_budget-used)/workers
+        segments = self.split_channels(workers)
+        out = specs[0]['out']
+        base, ext = os.path.splitext(os.path.abspath(out))
+        tmpdir = tempfile.mkdtemp(prefix='cube2movie_', dir=os.path.dirname(base))
+        outs = [os.path.join(tmpdir, 'segment_'+str(i).zfill(4)+ext) for i in range(len(segments))]
+        try:
+            source = self.worker_source(tmpdir)
+        except BaseException:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            raise
+
+        print("Rendering "+str(len(self.channels))+" channels in "+str(len(segments))+" segments on "+str(workers)+" workers ...")
+        # spawn fresh interpreters: forking a process with an active matplotlib backend is unsafe
+        context = multiprocessing.get_context('spawn')
+        stop = context.Event()
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers = workers,
+                                                      mp_context  = context,
+                                                      initializer = _init_segment_worker,
+                                                      initargs    = (stop,)
+                                                     )
+        try:
+            jobs = [pool.submit(_render_segment, source, settings, segment, out) for segment,out in zip(segments,outs)]
+            pending = jobs
+            while pending:
+                # wake up regularly, so that the hooks can stop the render
+                with self.span('segments', segments=len(jobs), done=len(jobs)-len(pending)):
+                    done, pending = concurrent.futures.wait(pending, timeout=0.5, return_when=concurrent.futures.FIRST_EXCEPTION)
+                for job in done:
+                    self.worker_memory_peak = max(self.worker_memory_peak, job.result()[1])
+            # join next to the segments, so that a stopped render leaves no partial movie
+            joined = os.path.join(tmpdir, 'joined'+ext)
+            self.join_segments(outs, joined)
+            os.replace(joined, out)
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        print("Movie saved as "+out)
+
+
+    def worker_source(self, directory):
+        """
+        The cube as the worker processes open it: the file or store it was read from, or else a
+        fits file of the full cube written to directory, which the workers read memory-mapped
+        instead of each receiving a pickled copy of the cube.
+        """
+        if isinstance(self.source, str):
+            return self.source
+        filename = os.path.join(directory, 'cube.fits')
+        print("Writing the cube to "+filename+" for the workers ...")
+        self.full_cube.write(filename)
+        return filename
+
+
+    def join_segments(self, segments, out):
+        """
+        Concatenate movie segments into out without re-encoding.
         """
-        self.movie.event_source.start()
+        import subprocess
+        import tempfile
+
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as segmentlist:
+            for segment in segments:
+                segmentlist.write("file '"+os.path.abspath(segment)+"'\n")
+        try:
+            subprocess.run([mpl.rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error',
+                            '-f', 'concat', '-safe', '0', '-i', segmentlist.name,
+                            '-c', 'copy', out
+                           ],
+                           check = True
+                          )
+        finally:
+            os.remove(segmentlist.name)
+
+
+def _channel_edges(centres):
+    """
+    Lower and upper edges of channels with the given centres (in any order): halfway between
+    neighbouring centres, and at half the spacing beyond the first and last centre.
+    """
+    order = np.argsort(centres)
+    values = np.asarray(centres, dtype=np.float64)[order]
+    if len(values) > 1:
+        edges = np.concatenate([[1.5*values[0]-0.5*values[1]], (values[1:]+values[:-1])/2, [1.5*values[-1]-0.5*values[-2]]])
+    else:
+        edges = np.concatenate([values, values])
+    low, high = np.empty(len(values)), np.empty(len(values))
+    low[order], high[order] = edges[:-1], edges[1:]
+    return low, high
+
+
+# the event that stops the segments of a render, in a worker process
+_segment_stop = None
+
+def _init_segment_worker(stop):
+    """
+    Keep the event that stops the segments of a render (see render_parallel). Runs in a worker
+    process when it starts.
+    """
+    global _segment_stop
+    _segment_stop = stop
+
+
+def _stop_segment(event):
+    """
+    Hook of a worker process that stops its segment at the next event of the main thread once the
+    render is stopped. Leaving the frame loop kills ffmpeg (see FrameWriter.abort).
+    """
+    if _segment_stop is not None and _segment_stop.is_set() and threading.current_thread() is threading.main_thread():
+        from .RenderHandle import RenderCancelled
+        raise RenderCancelled()
+
+
+def _render_segment(cube, settings, channels, out):
+    """
+    Render a segment of channels into its own movie file. Runs in a worker process.
+    """
+    if _segment_stop is not None and _segment_stop.is_set():
+        return out, 0
+    cubemovie = CubeToMovie(cube, out_of_core=settings.get('out_of_core', False), memory_budget=settings.get('memory_budget'), hooks=[_stop_segment])
+    cubemovie.apply_settings(settings)
+    cubemovie.prepare_environment()
+    try:
+        cubemovie.apply_memory_budget()
+        cubemovie.outputs = [dict(cubemovie.output_specs()[0], out=out)]
+        cubemovie.channels = channels
+        cubemovie.set_up_plot()
+        cubemovie.animate()
+        cubemovie.save_movie()
+    finally:
+        # also after a failed or stopped segment, as the worker renders further segments
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+    return out, cubemovie.memory_peak
 
 
 ####################################################################################################
@@ -0,0 +1,136 @@
+####################################################################################################
+# content-addressed cache of rendered frames on disk
+####################################################################################################
+
+__all__ = ["FrameCache", "content_repr"]
+
+import os
+import zlib
+import hashlib
+import struct
+import collections
+import numpy as np
+
+class FrameCache:
+    """
+    Store rendered RGBA frames on disk under a key that identifies their content (see
+    CubeToMovie.frame_keys), so that unchanged frames can be reused instead of drawn again.
+
+    Frames are stored as raw RGBA pixels, zlib-compressed (a fast, lossless level by default, no
+    image or video encoding), one file per frame, and written atomically, so that an
+    interrupted render leaves only complete frames behind. When the cache grows beyond max_bytes,
+    the least recently used frames are deleted.
+    """
+
+    header = struct.Struct('<III')
+
+    def __init__(self, directory, max_bytes=4*2**30, level=1):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.level = level
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        files = [entry for entry in os.scandir(directory) if entry.name.endswith('.frame')]
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        self.entries = collections.OrderedDict((entry.name[:-6], entry.stat().st_size) for entry in files)
+        self.bytes = sum(self.entries.values())
+
+
+    def path(self, key):
+        return os.path.join(self.directory, key+'.frame')
+
+    def __contains__(self, key):
+        return key in self.entries
+
+
+    def get(self, key):
+        """
+        Load a frame, or None if it is not in the cache.
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+            shape = self.header.unpack_from(data)
+            frame = np.frombuffer(zlib.decompress(data[self.header.size:]), dtype=np.uint8).reshape(shape)
+            os.utime(self.path(key))
+        except (OSError, zlib.error, ValueError, struct.error):
+            # deleted by another process or damaged
+            self.bytes -= self.entries.pop(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return frame
+
+
+    def put(self, key, frame):
+        """
+        Store a frame (height x width x 4, uint8).
+        """
+        frame = np.ascontiguousarray(frame)
+        data = self.header.pack(*frame.shape) + zlib.compress(frame.data, self.level)
+        temporary = self.path(key)+'.'+str(os.getpid())+'.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, self.path(key))
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)
+        self.entries[key] = len(data)
+        self.bytes += len(data)
+        self.evict()
+
+
+    def evict(self):
+        """
+        Delete the least recently used frames until the cache fits into max_bytes.
+        """
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.bytes -= size
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+def content_repr(value, _seen=None):
+    """
+    A repr of value that stays the same across runs for the same content, for the keys of the
+    frame cache: arrays are represented by a hash of their data (the repr of numpy abbreviates
+    large arrays) and objects that have no repr of their own (which holds their memory address,
+    e.g. a Normalize) by their type and attributes.
+    """
+    from matplotlib.cbook import CallbackRegistry
+
+    seen = set() if _seen is None else _seen
+    if id(value) in seen:
+        return '...'
+    if isinstance(value, dict):
+        seen = seen|{id(value)}
+        return '{'+', '.join(content_repr(key, seen)+': '+content_repr(item, seen) for key,item in value.items())+'}'
+    if isinstance(value, (list, tuple)):
+        seen = seen|{id(value)}
+        items = ', '.join(content_repr(item, seen) for item in value)
+        return '['+items+']' if isinstance(value, list) else '('+items+')'
+    if isinstance(value, (set, frozenset)):
+        return '{'+', '.join(sorted(content_repr(item, seen) for item in value))+'}'
+    if isinstance(value, np.ndarray) and value.dtype.hasobject:
+        return type(value).__name__+'('+content_repr(value.tolist(), seen)+')'
+    if isinstance(value, np.ndarray):
+        # e.g. the unit of a Quantity
+        unit = getattr(value, 'unit', None)
+        digest = hashlib.sha1(np.ascontiguousarray(value).data).hexdigest()
+        return type(value).__name__+'('+str(value.dtype)+', '+str(value.shape)+', '+digest+('' if unit is None else ', '+str(unit))+')'
+    text = repr(value)
+    if ' at 0x' in text and hasattr(value, '__dict__'):
+        # attributes that do not affect the content: methods, callbacks
+        attributes = {key: item for key,item in sorted(vars(value).items()) if not callable(item) and not isinstance(item, CallbackRegistry)}
+        return type(value).__module__+'.'+type(value).__qualname__+content_repr(attributes, seen|{id(value)})
+    return text
+
+
+####################################################################################################
@@ -0,0 +1,193 @@
+####################################################################################################
+# raw frame pipe to ffmpeg
+####################################################################################################
+
+__all__ = ["FrameWriter"]
+
+import queue
+import tempfile
+import threading
+import subprocess
+import numpy as np
+import matplotlib as mpl
+
+class FrameWriter:
+    """
+    Encode frames by piping the raw RGBA canvas buffers to an ffmpeg subprocess.
+
+    Frames are copied into a fixed pool of preallocated buffers and handed to a background thread
+    through a bounded queue. The thread writes the buffers to ffmpeg as a rawvideo stream, so
+    drawing the next frame overlaps with encoding the current one. When all queue_depth buffers
+    are in use, write() blocks until ffmpeg has caught up (backpressure).
+    With scale != 1, ffmpeg resamples the frames (area average when shrinking) before encoding.
+    """
+
+    def __init__(self, out, fps=2, codec='h264', bitrate=None, metadata={}, queue_depth=8, extra_args=[], scale=1):
+        """
+        Set up the writer. ffmpeg is started with the first frame, which determines the frame size.
+        """
+        self.out = out
+        self.fps = fps
+        self.codec = codec
+        self.bitrate = bitrate
+        self.metadata = metadata
+        self.queue_depth = queue_depth
+        self.extra_args = extra_args
+        self.scale = scale
+
+        self.size = None
+        self.frames_written = 0
+        self.process = None
+        self.thread = None
+        self.error = None
+
+
+    def ffmpeg_command(self):
+        """
+        Assemble the ffmpeg command line to encode a rawvideo RGBA stream from stdin.
+        """
+        width, height = self.size
+        command = [mpl.rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo',
+                   '-pix_fmt', 'rgba',
+                   '-s', str(width)+'x'+str(height),
+                   '-r', str(self.fps),
+                   '-i', '-'
+                  ]
+        if self.codec is not None:
+            command += ['-vcodec', self.codec]
+        filters = []
+        if self.scale != 1:
+            filters += ['scale=round(iw*{0}):round(ih*{0}):flags=area'.format(self.scale)]
+        if self.codec in ['h264', 'libx264'] and '-pix_fmt' not in self.extra_args:
+            # most players only support yuv420p which requires even frame dimensions
+            command += ['-pix_fmt', 'yuv420p']
+            filters += ['pad=ceil(iw/2)*2:ceil(ih/2)*2']
+        if self.codec == 'gif':
+            # a palette fitted to the movie instead of the generic 256 colours
+            filters += ['split[a][b];[a]palettegen[p];[b][p]paletteuse']
+        if filters and '-vf' not in self.extra_args:
+            command += ['-vf', ','.join(filters)]
+        if self.bitrate is not None:
+            command += ['-b:v', str(self.bitrate)+'k']
+        for key,value in self.metadata.items():
+            command += ['-metadata', str(key)+'='+str(value)]
+        command += list(self.extra_args)
+        command += [self.out]
+        return command
+
+
+    def start(self, frame):
+        """
+        Start ffmpeg and the encoding thread for frames shaped like the given frame.
+        """
+        self.size = (frame.shape[1], frame.shape[0])
+        self.buffers = queue.Queue()
+        for i in range(self.queue_depth):
+            self.buffers.put(np.empty(frame.shape, dtype=np.uint8))
+        self.frames = queue.Queue(maxsize=self.queue_depth)
+
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(self.ffmpeg_command(),
+                                        stdin  = subprocess.PIPE,
+                                        stdout = subprocess.DEVNULL,
+                                        stderr = self.log
+                                       )
+        self.thread = threading.Thread(target=self.encode, name='FrameWriter', daemon=True)
+        self.thread.start()
+
+
+    def encode(self):
+        """
+        Pass queued frames on to ffmpeg until the end of the stream is signalled. Runs in the
+        background thread.
+        """
+        while True:
+            buffer = self.frames.get()
+            if buffer is None:
+                break
+            if self.error is None:
+                try:
+                    self.process.stdin.write(buffer.data)
+                except Exception as e:
+                    # keep draining the queue so that write() never blocks on a dead encoder
+                    self.error = e
+            self.buffers.put(buffer)
+
+
+    def write(self, frame):
+        """
+        Queue an RGBA frame (height x width x 4, uint8), e.g. np.asarray(fig.canvas.buffer_rgba()).
+        The frame is copied, so the canvas can be redrawn as soon as write returns.
+        """
+        frame = np.asarray(frame)
+        if self.process is None:
+            self.start(frame)
+        self.check()
+        buffer = self.buffers.get()
+        np.copyto(buffer, frame)
+        self.frames.put(buffer)
+        self.frames_written += 1
+
+
+    def check(self):
+        """
+        Raise an error if ffmpeg failed.
+        """
+        if self.error is not None:
+            raise RuntimeError("ffmpeg failed to encode "+self.out+": "+self.read_log()) from self.error
+
+
+    def read_log(self):
+        self.log.seek(0)
+        return self.log.read().decode(errors='replace').strip()
+
+
+    def close(self):
+        """
+        Flush the queue, finish encoding and wait for ffmpeg to exit.
+        """
+        if self.process is None:
+            return
+        self.frames.put(None)
+        self.thread.join()
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError as e:
+            self.error = self.error or e
+        returncode = self.process.wait()
+        self.check()
+        if returncode != 0:
+            raise RuntimeError("ffmpeg failed to encode "+self.out+": "+self.read_log())
+        self.log.close()
+
+
+    def abort(self):
+        """
+        Stop encoding immediately and kill ffmpeg, e.g. after an error while rendering.
+        """
+        if self.process is None:
+            return
+        self.error = self.error or RuntimeError("aborted")
+        self.process.kill()
+        self.frames.put(None)
+        self.thread.join()
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.wait()
+        self.log.close()
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+####################################################################################################
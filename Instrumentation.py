@@ -0,0 +1,160 @@
+####################################################################################################
+# timing events of stages and frames
+####################################################################################################
+
+__all__ = ["Span", "TraceCollector", "profiled", "peak_rss", "current_rss"]
+
+import os
+import sys
+import time
+import json
+import threading
+import contextlib
+
+
+def peak_rss():
+    """
+    Peak resident memory of this process in bytes.
+    """
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak*1024
+
+
+def current_rss():
+    """
+    Memory of this process in bytes right now: resident memory without the pages of memory-mapped
+    files (e.g. a FITS file), which the system drops when memory runs short. Where that is not
+    available, the peak resident memory.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            size, resident, shared = f.read().split()[:3]
+        return (int(resident)-int(shared))*os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+class Span:
+    """
+    Time a block of code and hand the event to the hooks of a CubeToMovie when it ends. An event
+    is a dictionary with the name of the span, its category ('stage' or 'frame'), its start
+    (time.perf_counter) and duration in seconds, the thread it ran in and further details in args
+    (e.g. the channel).
+    """
+
+    def __init__(self, hooks, name, category, args):
+        self.hooks = hooks
+        self.event = {'name': name, 'cat': category, 'args': args}
+
+    def __enter__(self):
+        self.event['start'] = time.perf_counter()
+        return self.event
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.event['duration'] = time.perf_counter()-self.event['start']
+        self.event['thread'] = threading.current_thread().name
+        for hook in self.hooks:
+            hook(self.event)
+
+
+class TraceCollector:
+    """
+    Hook that collects all events, to summarize them or write them as json or Chrome trace
+    (viewable in chrome://tracing or https://ui.perfetto.dev).
+    """
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        with self.lock:
+            self.events.append(event)
+
+
+    def summary(self):
+        """
+        Number of events, total and mean duration in seconds per span name.
+        """
+        summary = {}
+        for event in self.events:
+            entry = summary.setdefault(event['name'], {'category': event['cat'], 'count': 0, 'total': 0.})
+            entry['count'] += 1
+            entry['total'] += event['duration']
+        for entry in summary.values():
+            entry['mean'] = entry['total']/entry['count']
+        return summary
+
+
+    def print_summary(self):
+        print("\n{0:<14} {1:>8} {2:>8} {3:>10} {4:>10}".format('span', 'category', 'count', 'total [s]', 'mean [ms]'))
+        for name, entry in self.summary().items():
+            print("{0:<14} {1:>8} {2:>8} {3:>10.3f} {4:>10.2f}".format(name, entry['category'], entry['count'], entry['total'], entry['mean']*1000))
+
+
+    def chrome_trace(self):
+        """
+        The events in the Chrome trace event format. Bytes read and peak memory reported with the
+        frames are added as counters.
+        """
+        pid = os.getpid()
+        start = min((event['start'] for event in self.events), default=0)
+        threads = {}
+        trace = []
+        for event in self.events:
+            tid = threads.setdefault(event['thread'], len(threads))
+            ts = (event['start']-start)*1e6
+            trace.append({'name': event['name'], 'cat': event['cat'], 'ph': 'X', 'pid': pid, 'tid': tid,
+                          'ts': ts, 'dur': event['duration']*1e6, 'args': event['args']
+                         })
+            for counter in ['bytes_read', 'peak_rss']:
+                if counter in event['args']:
+                    trace.append({'name': counter, 'ph': 'C', 'pid': pid, 'ts': ts+event['duration']*1e6,
+                                  'args': {counter: event['args'][counter]}
+                                 })
+        for name, tid in threads.items():
+            trace.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+
+    def save(self, filename, format='chrome'):
+        """
+        Write the events as Chrome trace (format='chrome') or as plain json list of events together
+        with the summary (format='json').
+        """
+        if format == 'chrome':
+            content = self.chrome_trace()
+        elif format == 'json':
+            content = {'events': self.events, 'summary': self.summary()}
+        else:
+            raise ValueError("Unknown trace format "+str(format)+". Allowed: 'chrome', 'json'.")
+        with open(filename, 'w') as f:
+            json.dump(content, f, default=str)
+
+
+@contextlib.contextmanager
+def profiled(filename, top=20):
+    """
+    Run the enclosed code under cProfile, store the statistics in filename (for pstats or
+    snakeviz) and print the top functions by cumulative time. Does nothing if filename is None.
+    """
+    if filename is None:
+        yield
+        return
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(filename)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
+        print("Profile saved as "+filename)
+
+
+####################################################################################################
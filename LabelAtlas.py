@@ -0,0 +1,82 @@
+####################################################################################################
+# channel labels rasterized once
+####################################################################################################
+
+__all__ = ["LabelAtlas"]
+
+import numpy as np
+
+class LabelAtlas:
+    """
+    Rasterize the channel labels of a CubeToMovie once and composite them into the frames.
+
+    Every distinct label text is drawn a single time by the channel label artist itself (with
+    usetex or mathtext, exactly as matplotlib draws it in a frame) on an otherwise transparent
+    canvas. The RGBA raster is kept together with its position in the frame, so that putting a
+    label into a frame is an alpha blend of a small array instead of laying out and rendering text
+    (and, with usetex, reading the LaTeX output) for every frame. The positions are only valid as
+    long as the layout is fixed, i.e. after CubeToMovie.cache_background.
+    Drawing labels leaves the canvas cleared; the caller restores its background afterwards.
+    """
+
+    def __init__(self, cubemovie):
+        self.cubemovie = cubemovie
+        self.rasters = {}
+
+        # a completely transparent canvas to render the labels on
+        fig = cubemovie.fig
+        patch_alpha = fig.patch.get_alpha()
+        hidden = [artist for artist in fig.get_children() if artist is not fig.patch and artist.get_visible()]
+        fig.patch.set_alpha(0)
+        for artist in hidden:
+            artist.set_visible(False)
+        fig.canvas.draw()
+        self.clear = fig.canvas.copy_from_bbox(fig.bbox)
+        for artist in hidden:
+            artist.set_visible(True)
+        fig.patch.set_alpha(patch_alpha)
+
+
+    def render(self, text):
+        """
+        The raster of a label text as (rgb, alpha, (r0,r1,c0,c1)) with the box in frame pixels,
+        drawn on first use.
+        """
+        if text not in self.rasters:
+            cm = self.cubemovie
+            height, width = cm.frame_buffer().shape[:2]
+            cm.fig.canvas.restore_region(self.clear)
+            cm.chanlabel.set_text(text)
+            cm.chanlabel.set_visible(True)
+            cm.ax.draw_artist(cm.chanlabel)
+            box = cm.chanlabel.get_window_extent()
+            r0 = max(int(np.floor(height-box.y1))-1, 0)
+            r1 = min(int(np.ceil(height-box.y0))+1, height)
+            c0 = max(int(np.floor(box.x0))-1, 0)
+            c1 = min(int(np.ceil(box.x1))+1, width)
+            raster = np.array(cm.frame_buffer()[r0:r1,c0:c1])
+            self.rasters[text] = (raster[:,:,:3].astype(np.uint16), raster[:,:,3:].astype(np.uint16), (r0,r1,c0,c1))
+        return self.rasters[text]
+
+
+    def prepare(self, channels):
+        """
+        Rasterize the distinct labels of the given channels up front.
+        """
+        for text in dict.fromkeys(self.cubemovie.label(channel) for channel in channels):
+            self.render(text)
+
+
+    def composite(self, frame, channel):
+        """
+        Alpha-blend the label of a channel onto an RGBA frame in place. Returns the box of the
+        label in the frame.
+        """
+        rgb, alpha, box = self.render(self.cubemovie.label(channel))
+        r0, r1, c0, c1 = box
+        area = frame[r0:r1,c0:c1,:3]
+        area[...] = (area*(255-alpha) + rgb*alpha + 127)//255
+        return box
+
+
+####################################################################################################
@@ -0,0 +1,195 @@
+####################################################################################################
+# frame renderer that maps the data to pixels with numpy
+####################################################################################################
+
+__all__ = ["NumpyRenderer"]
+
+import numpy as np
+
+class NumpyRenderer:
+    """
+    Render frames without drawing the figure with matplotlib for every channel.
+
+    The figure set up by CubeToMovie.set_up_plot is rasterized once into a frame template: the
+    static figure without the map, plus the foreground that is drawn on top of the map (axes
+    frame, ticks, ...), see CubeToMovie.cache_background. For each frame, the channel plane is resampled to the
+    screen pixels of the map, normalized and mapped through a lookup table of the colormap, and
+    composited into the template together with the pre-rendered channel label (see LabelAtlas).
+    The data area matches matplotlib's imshow with interpolation='nearest'. With
+    scaling='channel', every plane is normalized by its own range and the colorbar is drawn by
+    matplotlib for every frame.
+    """
+
+    def __init__(self, cubemovie, batch_size=16):
+        self.cubemovie = cubemovie
+        self.batch_size = batch_size
+        self.label_box = None
+        self.colorbar_box = None
+
+
+    def prepare(self):
+        """
+        Rasterize the frame template, determine the pixel mapping of the data and build the
+        colormap lookup table.
+        """
+        cm = self.cubemovie
+
+        # fix the layout, render the static background, the foreground on top of the map and the
+        # channel labels
+        cm.cache_background()
+        cm.fig.canvas.restore_region(cm.background)
+        self.base = np.array(cm.frame_buffer())
+
+        self.set_pixel_mapping()
+        self.set_lookup_table()
+        self.frame = self.base.copy()
+        self.colorbar = cm.colorbar_artists()
+
+
+    def set_pixel_mapping(self):
+        """
+        Find the data pixel shown at each screen pixel of the map, as imshow does for nearest
+        neighbour interpolation. The data are the channel planes as read, i.e. reduced by
+        CubeToMovie.block_size.
+        """
+        cm = self.cubemovie
+        height, width = self.base.shape[:2]
+        f = cm.block_size
+        ny, nx = cm.cube.shape[1]//f, cm.cube.shape[2]//f
+
+        # screen pixels covered by the image, clipped to the axes
+        x0, y0 = cm.ax.transData.transform((-0.5,-0.5))
+        x1, y1 = cm.ax.transData.transform((nx*f-0.5,ny*f-0.5))
+        bbox = cm.ax.bbox
+        x0, x1 = max(x0, bbox.x0), min(x1, bbox.x1)
+        y0, y1 = max(y0, bbox.y0), min(y1, bbox.y1)
+        c0, c1 = int(np.round(x0)), int(np.round(x1))
+        r0, r1 = height-int(np.round(y1)), height-int(np.round(y0))
+        self.region = (r0, r1, c0, c1)
+
+        # data pixel at the center of each screen pixel; buffer rows run from top to bottom
+        inverse = cm.ax.transData.inverted()
+        cols = inverse.transform(np.column_stack([np.arange(c0,c1)+0.5, np.full(c1-c0, y0)]))[:,0]
+        rows = inverse.transform(np.column_stack([np.full(r1-r0, x0), height-np.arange(r0,r1)-0.5]))[:,1]
+        # pixels of the reduced planes cover f x f pixels of the cube
+        cols = np.clip(np.floor(cols+0.5).astype(np.intp)//f, 0, nx-1)
+        rows = np.clip(np.floor(rows+0.5).astype(np.intp)//f, 0, ny-1)
+        self.pixels = rows[:,None]*nx + cols[None,:]
+
+
+    def set_lookup_table(self):
+        """
+        Build the colormap lookup table ordered as [under, colors, over], so that the index of a
+        normalized value x is floor(x*N)+1. The opaque RGBA entries are packed into uint32 to map a
+        whole pixel with a single lookup. Bad values (NaN) are not looked up: imshow draws them in
+        the bad color of the colormap, which is transparent, so the template shows through.
+        """
+        cm = self.cubemovie
+        cmap = cm.colormap()
+        N = cmap.N
+        under_over = cmap(np.array([-1, N]), bytes=True)
+        lut = np.vstack([under_over[:1], cmap(np.arange(N), bytes=True), under_over[1:]])
+        lut[:,3] = 255
+        self.lut = np.ascontiguousarray(lut).view(np.uint32).ravel()
+        self.N = N
+        self.set_norm(*cm.channel_range(cm.channels[0]))
+
+
+    def set_norm(self, vmin, vmax):
+        """
+        Set the color range for the following frames, either a single range or arrays with a range
+        for each plane of the next batch. An empty range (vmin == vmax) maps every value to the
+        lowest color, as matplotlib's Normalize does.
+        """
+        # broadcast against a stack of planes of screen pixels
+        vmin = np.asarray(vmin, dtype=np.float64).reshape(-1,1,1)
+        span = np.asarray(vmax, dtype=np.float64).reshape(-1,1,1)-vmin
+        self.vmin = vmin.astype(np.float32)
+        self.scale = np.divide(self.N, span, out=np.zeros_like(span), where=span!=0).astype(np.float32)
+
+
+    def colorize(self, planes):
+        """
+        Resample a stack of channel planes to screen pixels and map them to RGBA. Returns the
+        colors and the mask of bad values, which composite leaves to the template.
+        """
+        N = self.N
+        values = np.take(planes.reshape(len(planes),-1), self.pixels, axis=1)
+        values -= self.vmin
+        values *= self.scale
+        top = values==N
+        values += 1
+        np.clip(values, 0, N+1, out=values)
+        bad = np.isnan(values)
+        values[bad] = 0
+        index = values.astype(np.uint16)
+        index[top] = N
+        return np.take(self.lut, index).view(np.uint8).reshape(index.shape+(4,)), bad
+
+
+    def composite(self, rgba, bad, channel):
+        """
+        Place a colorized plane, a changing colorbar, the foreground and the channel label (on top)
+        into the frame template. Where the plane is bad, the template is kept.
+        """
+        frame = self.frame
+        foreground = self.cubemovie.foreground_pixels
+        frame[foreground] = self.base[foreground]
+        for box in [self.label_box, self.colorbar_box]:
+            if box is not None:
+                r0, r1, c0, c1 = box
+                frame[r0:r1,c0:c1] = self.base[r0:r1,c0:c1]
+
+        r0, r1, c0, c1 = self.region
+        frame[r0:r1,c0:c1] = rgba
+        if bad.any():
+            frame[r0:r1,c0:c1][bad] = self.base[r0:r1,c0:c1][bad]
+
+        if self.colorbar:
+            self.colorbar_box = self.composite_colorbar(frame, channel)
+        self.cubemovie.composite_foreground(frame)
+        self.label_box = self.cubemovie.label_atlas.composite(frame, channel)
+        return frame
+
+
+    def composite_colorbar(self, frame, channel):
+        """
+        Draw the colorbar for the range of a channel with matplotlib and copy the pixels it covers
+        into the frame. Returns the box of the colorbar in the frame.
+        """
+        cm = self.cubemovie
+        cm.fig.canvas.restore_region(cm.background)
+        cm.map.set_clim(*cm.channel_range(channel))
+        for artist in self.colorbar:
+            cm.fig.draw_artist(artist)
+        drawn = cm.frame_buffer()
+        rows, cols = np.nonzero((drawn != self.base).any(axis=2))
+        if len(rows) == 0:
+            return None
+        r0, r1, c0, c1 = rows.min(), rows.max()+1, cols.min(), cols.max()+1
+        frame[r0:r1,c0:c1] = drawn[r0:r1,c0:c1]
+        return (r0, r1, c0, c1)
+
+
+    def iter_frames(self, channels):
+        """
+        Render the given channels in batches and yield the frames. The frame buffer is reused, so
+        each frame must be consumed or copied right away.
+        """
+        cm = self.cubemovie
+        channels = list(channels)
+        for start in range(0, len(channels), self.batch_size):
+            batch = channels[start:start+self.batch_size]
+            with cm.span('fetch', 'frame', channels=batch):
+                planes = cm.get_planes(batch)
+            with cm.span('colorize', 'frame', channels=batch):
+                if cm.scaling == 'channel':
+                    self.set_norm(*np.transpose([cm.channel_range(channel) for channel in batch]))
+                colorized, bad = self.colorize(planes)
+            for channel, rgba, mask in zip(batch, colorized, bad):
+                with cm.span('draw', 'frame', channel=channel):
+                    frame = self.composite(rgba, mask, channel)
+                yield frame
+
+
+####################################################################################################
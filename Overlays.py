@@ -0,0 +1,213 @@
+####################################################################################################
+# static overlays that are the same in every frame
+####################################################################################################
+
+__all__ = ["Overlay", "MomentContours", "ImageContours", "BeamEllipse", "Markers"]
+
+import abc
+import hashlib
+import warnings
+import numpy as np
+
+
+class Overlay(abc.ABC):
+    """
+    A layer that is drawn on top of the map and does not change from frame to frame.
+
+    prepare computes what the layer shows, once: it is called by CubeToMovie.prepare_overlays
+    before the figure is set up and again in worker processes, where it returns right away as the
+    result is sent along with the layer. draw adds the artists of the layer to the axes of the
+    CubeToMovie. With renderer='blit' or 'numpy', these artists are rasterized into the cached
+    foreground (see CubeToMovie.cache_foreground), so a layer adds no drawing per frame.
+    Subclasses set the parameters that define the layer in self.params, which also identify the
+    layer in the keys of the frame cache.
+    """
+
+    def __init__(self, **params):
+        self.params = params
+
+    def prepare(self, cubemovie):
+        pass
+
+    @abc.abstractmethod
+    def draw(self, cubemovie):
+        pass
+
+    def __repr__(self):
+        from .FrameCache import content_repr
+        return type(self).__name__+'('+', '.join(key+'='+content_repr(value) for key,value in sorted(self.params.items()))+')'
+
+
+class MomentContours(Overlay):
+    """
+    Contours of a moment map of the cube itself: moment=0 is the integrated intensity (in the unit
+    of the cube times the unit of the spectral axis, e.g. Jy/beam m/s), moment='max' the peak
+    intensity. The map is summed up over all channels (or the given channel numbers, e.g. those
+    of a line) in a single chunked pass over the channel planes as they are shown (cutout,
+    binning, downsampling), so that it never needs the whole cube in memory. With relative=True,
+    levels are fractions of the maximum of the map.
+    """
+
+    def __init__(self, levels, moment=0, channels=None, relative=False, **contour_kwargs):
+        super().__init__(levels=list(levels), moment=moment, channels=channels, relative=relative, contour_kwargs=contour_kwargs)
+        self.image = None
+        self.signature = None
+
+    def prepare(self, cubemovie):
+        cm = cubemovie
+        if cm.planes is None:
+            cm.open_planes()
+        channels = np.arange(len(cm.planes)) if self.params['channels'] is None else np.asarray(self.params['channels'], dtype=np.intp)
+        source = cm.source if isinstance(cm.source, str) else id(cm.full_cube)
+        signature = repr((source, cm.box, cm.block_size, cm.binning, cm.bin_mode, cm.spectral_axis[[0,-1]], channels.tolist()))
+        if self.signature == signature:
+            return
+
+        print("Computing moment "+str(self.params['moment'])+" map of "+str(len(channels))+" channels ...")
+        planes = cm.planes
+        if self.params['moment'] == 0 and cm.bins is not None and planes.reader.mode != 'mean':
+            # sums or maxima of channels are no mean intensities over the bin width: integrate
+            # the channels of the bins instead
+            from .ChannelPlanes import ChannelPlanes
+            planes = ChannelPlanes(planes.reader.reader, cache_bytes=0, readahead=0)
+            channels = np.unique(np.concatenate([cm.bins[channel][0] for channel in channels]))
+            axis = cm.cube.spectral_axis.value
+            widths = np.abs(np.gradient(axis)) if len(axis) > 1 else np.ones(1)
+        elif cm.channel_widths is not None:
+            widths = np.abs(cm.channel_widths.value)
+        else:
+            axis = cm.spectral_axis.value
+            widths = np.abs(np.gradient(axis)) if len(axis) > 1 else np.ones(1)
+        image = None
+        valid = None
+        done = 0
+        for chunk in planes.chunks(channels, cm.chunk_bytes):
+            if self.params['moment'] == 'max':
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', RuntimeWarning)
+                    partial = np.nanmax(chunk, axis=0)
+                image = partial if image is None else np.fmax(image, partial)
+            else:
+                partial = np.einsum('ijk,i->jk', np.nan_to_num(chunk), widths[channels[done:done+len(chunk)]])
+                image = partial if image is None else image+partial
+                finite = np.isfinite(chunk).any(axis=0)
+                valid = finite if valid is None else valid|finite
+            done += len(chunk)
+        if valid is not None:
+            image[~valid] = np.nan
+        self.image = image.astype(np.float32)
+        self.signature = signature
+
+    def draw(self, cubemovie):
+        cm = cubemovie
+        levels = np.asarray(self.params['levels'], dtype=float)
+        if self.params['relative']:
+            levels = levels*np.nanmax(self.image)
+        coordinates = cm.plane_coordinates() or ()
+        kwargs = dict({'colors': 'k'}, **self.params['contour_kwargs'])
+        cm.ax.contour(*coordinates, self.image, levels=np.unique(levels), **kwargs)
+
+    def __repr__(self):
+        digest = None if self.image is None else hashlib.sha1(self.image.data).hexdigest()
+        return super().__repr__()[:-1]+', image='+str(digest)+')'
+
+
+class ImageContours(Overlay):
+    """
+    Contours of an external image (fits file name, HDU or (data, header)), e.g. another tracer or
+    wavelength. The image is drawn in its own coordinates, which are transformed to the coordinates
+    of the cube by the axes.
+    """
+
+    def __init__(self, image, levels, **contour_kwargs):
+        # an image in memory is identified by a hash of its data and WCS (see __repr__)
+        super().__init__(image=image if isinstance(image, str) else type(image).__name__, levels=list(levels), contour_kwargs=contour_kwargs)
+        self.source = image
+        self.data = None
+
+    def prepare(self, cubemovie):
+        from astropy.io import fits
+        from astropy.wcs import WCS
+
+        if self.data is not None:
+            return
+        if isinstance(self.source, str):
+            data, header = fits.getdata(self.source, header=True)
+        elif isinstance(self.source, tuple):
+            data, header = self.source
+        else:
+            data, header = self.source.data, self.source.header
+        self.wcs = WCS(header).celestial
+        # drop degenerate axes, e.g. a single channel or Stokes
+        self.data = np.asarray(data, dtype=np.float32).reshape(data.shape[-2:]) if data.ndim > 2 else np.asarray(data, dtype=np.float32)
+
+    def draw(self, cubemovie):
+        kwargs = dict({'colors': 'k'}, **self.params['contour_kwargs'])
+        cubemovie.ax.contour(self.data, levels=self.params['levels'], transform=cubemovie.ax.get_transform(self.wcs), **kwargs)
+
+    def __repr__(self):
+        if self.data is None:
+            digest = None
+        else:
+            digest = hashlib.sha1(np.ascontiguousarray(self.data).data)
+            digest.update(self.wcs.to_header_string().encode())
+            digest = digest.hexdigest()
+        return super().__repr__()[:-1]+', data='+str(digest)+')'
+
+
+class BeamEllipse(Overlay):
+    """
+    The beam of the cube (the largest beam of a cube with a beam per channel) as an ellipse in a
+    corner of the map: loc is 'lower left', 'lower right', 'upper left' or 'upper right'.
+    """
+
+    def __init__(self, loc='lower left', pad=2, **ellipse_kwargs):
+        super().__init__(loc=loc, pad=pad, ellipse_kwargs=ellipse_kwargs)
+
+    def draw(self, cubemovie):
+        import astropy.units as u
+        from astropy.wcs.utils import proj_plane_pixel_scales
+        from spectral_cube.utils import NoBeamError
+
+        cube = cubemovie.cube
+        try:
+            beam = cube.beams.largest_beam() if hasattr(cube, 'beams') else cube.beam
+        except NoBeamError:
+            beam = None
+        if beam is None:
+            warnings.warn("\nThe cube has no beam. Not drawing the beam ellipse.\n",
+                          UserWarning,
+                          stacklevel = 2
+                         )
+            return
+        wcs = cube.wcs.celestial
+        pixscale = proj_plane_pixel_scales(wcs)[1]*u.Unit(wcs.wcs.cunit[1])
+        ny, nx = cube.shape[1:]
+        size = (beam.major/pixscale).decompose().value/2 + self.params['pad']
+        vertical, horizontal = self.params['loc'].split()
+        x = size-0.5 if horizontal == 'left' else nx-0.5-size
+        y = size-0.5 if vertical == 'lower' else ny-0.5-size
+        kwargs = dict({'facecolor': 'none', 'edgecolor': 'k', 'hatch': '////', 'linewidth': 1}, **self.params['ellipse_kwargs'])
+        cubemovie.ax.add_patch(beam.ellipse_to_plot(x, y, pixscale, **kwargs))
+
+
+class Markers(Overlay):
+    """
+    Markers at positions given as SkyCoord, e.g. sources or regions of interest, optionally with
+    text labels next to them.
+    """
+
+    def __init__(self, coords, labels=None, marker='+', **plot_kwargs):
+        super().__init__(coords=str(coords), labels=labels, marker=marker, plot_kwargs=plot_kwargs)
+        self.coords = coords
+
+    def draw(self, cubemovie):
+        x, y = cubemovie.cube.wcs.celestial.world_to_pixel(self.coords)
+        x, y = np.atleast_1d(x), np.atleast_1d(y)
+        kwargs = dict({'color': 'k', 'markersize': 10}, **self.params['plot_kwargs'])
+        cubemovie.ax.plot(x, y, linestyle='none', marker=self.params['marker'], **kwargs)
+        for xi, yi, label in zip(x, y, self.params['labels'] or []):
+            cubemovie.ax.annotate(label, (xi, yi), xytext=(5,5), textcoords='offset points', color=kwargs['color'])
+
+
+####################################################################################################
@@ -0,0 +1,258 @@
+####################################################################################################
+# animated GIF and APNG with a single global palette
+####################################################################################################
+
+__all__ = ["PaletteWriter"]
+
+import zlib
+import queue
+import struct
+import fractions
+import threading
+import numpy as np
+
+class PaletteWriter:
+    """
+    Write an animated GIF (.gif) or APNG (.png, .apng) with one global palette of 256 colours.
+
+    The palette is fixed for the whole movie: the given colours (e.g. sampled from the colormap of
+    the map) plus frame_colors colours of the first frame (background, axes, labels) picked by
+    median cut. Instead of quantizing every frame on its own, frames are mapped to palette indices
+    through a lookup table of all colours at 6 bits per channel, which is built once and maps the
+    palette colours exactly onto themselves. Only the rectangle that changed since the previous
+    frame is stored. Mapping and compression run on a background thread; like FrameWriter, write()
+    copies the frame into one of queue_depth buffers and blocks when all of them are in use.
+    With scale != 1, the frames are resampled (box filter) before they are mapped.
+    """
+
+    def __init__(self, out, fps=2, colors=None, frame_colors=32, scale=1, queue_depth=8, level=6):
+        self.out = out
+        self.fps = fps
+        self.colors = np.zeros((0,3), dtype=np.uint8) if colors is None else np.asarray(colors, dtype=np.uint8)[:256-frame_colors,:3]
+        self.frame_colors = 256-len(self.colors)
+        self.scale = scale
+        self.queue_depth = queue_depth
+        self.level = level
+        self.apng = not out.lower().endswith('.gif')
+
+        self.frames_written = 0
+        self.frames_encoded = 0
+        self.file = None
+        self.thread = None
+        self.error = None
+
+
+    def resize(self, rgb):
+        """
+        Resample an RGB frame by scale.
+        """
+        if self.scale == 1:
+            return rgb
+        from PIL import Image
+        height, width = rgb.shape[:2]
+        size = (max(1, int(round(width*self.scale))), max(1, int(round(height*self.scale))))
+        return np.asarray(Image.fromarray(rgb).resize(size, Image.Resampling.BOX))
+
+
+    def set_palette(self, rgb):
+        """
+        Build the global palette from the given colours and the first frame, and the lookup table
+        from colours to palette indices.
+        """
+        from PIL import Image
+
+        # every other pixel is enough to find the main colours
+        quantized = Image.fromarray(np.ascontiguousarray(rgb[::2,::2])).quantize(self.frame_colors, method=Image.Quantize.MEDIANCUT)
+        used = len(quantized.getcolors(256))
+        extra = np.array(quantized.getpalette()[:3*used], dtype=np.uint8).reshape(-1,3)
+        palette = np.unique(np.vstack([self.colors, extra]), axis=0)[:256]
+        self.palette = np.vstack([palette, np.repeat(palette[-1:], 256-len(palette), axis=0)])
+
+        # nearest palette colour at the centre of every 6 bit colour cell, with the squared
+        # distance |c-p|^2 reduced to |p|^2-2c.p (|c|^2 is the same for all p)
+        centres = (np.indices((64,64,64), dtype=np.float32).reshape(3,-1).T*4+2)
+        colors = self.palette.astype(np.float32)
+        norms = (colors**2).sum(axis=1)
+        self.lut = np.empty(len(centres), dtype=np.uint8)
+        for start in range(0, len(centres), 32768):
+            self.lut[start:start+32768] = (norms-2*centres[start:start+32768]@colors.T).argmin(axis=1)
+        self.lut[self.cell(self.palette)] = np.arange(256, dtype=np.uint8)
+
+
+    def cell(self, rgb):
+        """
+        Index of the 6 bit colour cell of RGB values.
+        """
+        rgb = rgb.astype(np.intp)
+        return (rgb[...,0]>>2)<<12 | (rgb[...,1]>>2)<<6 | rgb[...,2]>>2
+
+
+    def start(self, frame):
+        """
+        Open the file and start the background thread for frames shaped like the given frame.
+        """
+        self.buffers = queue.Queue()
+        for i in range(self.queue_depth):
+            self.buffers.put(np.empty(frame.shape[:2]+(3,), dtype=np.uint8))
+        self.frames = queue.Queue(maxsize=self.queue_depth)
+        self.previous = None
+        self.sequence = 0
+        self.file = open(self.out, 'wb')
+        self.thread = threading.Thread(target=self.encode, name='PaletteWriter', daemon=True)
+        self.thread.start()
+
+
+    def encode(self):
+        """
+        Map, crop, compress and write queued frames until the end of the stream is signalled.
+        Runs in the background thread.
+        """
+        while True:
+            buffer = self.frames.get()
+            if buffer is None:
+                break
+            if self.error is None:
+                try:
+                    self.encode_frame(self.resize(buffer))
+                except Exception as e:
+                    # keep draining the queue so that write() never blocks
+                    self.error = e
+            self.buffers.put(buffer)
+
+
+    def encode_frame(self, rgb):
+        """
+        Write a frame as palette indices, cropped to the part that changed.
+        """
+        if self.previous is None:
+            self.set_palette(rgb)
+            self.write_header(rgb.shape[1], rgb.shape[0])
+        index = self.lut[self.cell(rgb)]
+
+        if self.previous is None:
+            r0, r1, c0, c1 = 0, index.shape[0], 0, index.shape[1]
+        else:
+            changed = index != self.previous
+            rows = np.flatnonzero(changed.any(axis=1))
+            cols = np.flatnonzero(changed.any(axis=0))
+            if len(rows) == 0:
+                r0, r1, c0, c1 = 0, 1, 0, 1
+            else:
+                r0, r1, c0, c1 = rows[0], rows[-1]+1, cols[0], cols[-1]+1
+        self.previous = index
+        crop = np.ascontiguousarray(index[r0:r1,c0:c1])
+        if self.apng:
+            self.write_apng_frame(crop, c0, r0)
+        else:
+            self.write_gif_frame(crop, c0, r0)
+
+
+    def write_header(self, width, height):
+        if self.apng:
+            self.file.write(b'\x89PNG\r\n\x1a\n')
+            self.chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0))
+            # the number of frames is filled in by close
+            self.actl = self.file.tell()
+            self.chunk(b'acTL', struct.pack('>II', 0, 0))
+            self.chunk(b'PLTE', self.palette.tobytes())
+        else:
+            self.file.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0xF7, 0, 0) + self.palette.tobytes())
+            # loop forever
+            self.file.write(b'!\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', 0) + b'\x00')
+
+
+    def chunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind+data) & 0xffffffff))
+
+
+    def write_apng_frame(self, crop, x, y):
+        delay = fractions.Fraction(1/self.fps).limit_denominator(65535)
+        height, width = crop.shape
+        self.chunk(b'fcTL', struct.pack('>IIIIIHHBB', self.sequence, width, height, x, y, delay.numerator, delay.denominator, 0, 0))
+        self.sequence += 1
+        # filter type 0 (none) in front of every row
+        data = zlib.compress(np.hstack([np.zeros((height,1), dtype=np.uint8), crop]).tobytes(), self.level)
+        if self.frames_encoded == 0:
+            self.chunk(b'IDAT', data)
+        else:
+            self.chunk(b'fdAT', struct.pack('>I', self.sequence) + data)
+            self.sequence += 1
+        self.frames_encoded += 1
+
+
+    def write_gif_frame(self, crop, x, y):
+        from PIL import Image, GifImagePlugin
+
+        image = Image.frombytes('P', (crop.shape[1], crop.shape[0]), crop.tobytes())
+        # graphic control extension (delay, keep the previous frame below) and LZW compressed data
+        for data in GifImagePlugin.getdata(image, offset=(int(x),int(y)), duration=1000/self.fps, disposal=1):
+            self.file.write(data)
+        self.frames_encoded += 1
+
+
+    def write(self, frame):
+        """
+        Queue an RGBA or RGB frame (height x width x 3 or 4, uint8). The frame is copied, so the
+        canvas can be redrawn as soon as write returns.
+        """
+        frame = np.asarray(frame)
+        if self.file is None:
+            self.start(frame)
+        self.check()
+        buffer = self.buffers.get()
+        np.copyto(buffer, frame[:,:,:3])
+        self.frames.put(buffer)
+        self.frames_written += 1
+
+
+    def check(self):
+        """
+        Raise an error if encoding failed.
+        """
+        if self.error is not None:
+            raise RuntimeError("Failed to write "+self.out+": "+str(self.error)) from self.error
+
+
+    def close(self):
+        """
+        Encode the queued frames and finish the file.
+        """
+        if self.file is None:
+            return
+        self.frames.put(None)
+        self.thread.join()
+        try:
+            self.check()
+            if self.apng:
+                self.chunk(b'IEND', b'')
+                self.file.seek(self.actl)
+                self.chunk(b'acTL', struct.pack('>II', self.frames_encoded, 0))
+            else:
+                self.file.write(b';')
+        finally:
+            self.file.close()
+
+
+    def abort(self):
+        """
+        Stop encoding immediately, e.g. after an error while rendering.
+        """
+        if self.file is None:
+            return
+        self.error = self.error or RuntimeError("aborted")
+        self.frames.put(None)
+        self.thread.join()
+        self.file.close()
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+####################################################################################################
@@ -0,0 +1,304 @@
+####################################################################################################
+# interactive preview from frames rasterized ahead of time
+####################################################################################################
+
+__all__ = ["PreviewPlayer"]
+
+import copy
+import time
+import threading
+import collections
+import numpy as np
+import matplotlib.pyplot as plt
+
+class PreviewPlayer:
+    """
+    Play a preview of the movie in its own window without stalling the interpreter.
+
+    The frames are rasterized ahead of time in a background thread, on an off-screen copy of the
+    figure of the CubeToMovie, into a ring buffer of at most buffer_size frames. A timer of the
+    window only puts ready images on screen at the target fps. Frames that are overdue by the time
+    they are ready are dropped, and the rasterizer skips channels that are already overdue, so the
+    preview keeps the pace of the movie instead of slowing down.
+    A click into the window or the space bar stops and restarts the playback (see
+    CubeToMovie.stop_animation and start_animation). The timer is available as event_source.
+    The environment of the CubeToMovie (interactive mode, warnings, matplotlib settings) stays
+    prepared while the preview draws and is restored when it has finished or is closed.
+
+    With feed=True, the preview starts from the frames of the movie while it is saved: the render
+    hands every frame to feed, which buffers it and puts due frames on screen, and end_feed hands
+    over to the background rasterizer from the first frame that was not fed (e.g. because the
+    save ran ahead of the preview by more than buffer_size frames). Only one render draws at a
+    time, the rasterizer starts after saving.
+    """
+
+    def __init__(self, cubemovie, buffer_size=16, feed=False):
+        self.cubemovie = cubemovie
+        self.channels = list(cubemovie.channels)
+        self.fps = cubemovie.fps
+        self.repeat = cubemovie.repeat
+        self.buffer_size = max(1, buffer_size)
+
+        self.buffer = collections.deque()
+        self.condition = threading.Condition()
+        self.running = False
+        self.paused = False
+        self.finished = False
+        self.feeding = feed
+        self.accepting = feed
+        self.next_index = 0
+        self.start_time = None
+        self.elapsed = 0.
+        self.shown = 0
+        self.dropped = 0
+        self.restored = False
+        self.clone = None
+
+        if feed:
+            # the frames of the movie, with the figure at the movie resolution
+            dpi = cubemovie.dpi or cubemovie.fig.dpi
+            width, height = (int(size*dpi) for size in cubemovie.fig.get_size_inches())
+        else:
+            self.prepare_clone()
+            width, height = self.clone.fig.canvas.get_width_height()
+            dpi = self.clone.fig.dpi
+        self.fig = plt.figure(figsize=(width/dpi, height/dpi), dpi=dpi)
+        ax = self.fig.add_axes([0,0,1,1])
+        ax.set_axis_off()
+        self.image = ax.imshow(np.zeros((height,width,4), dtype=np.uint8), interpolation='none')
+        self.event_source = self.fig.canvas.new_timer(interval=1000/self.fps)
+        self.event_source.add_callback(self.show_next)
+        self.fig.canvas.mpl_connect('button_press_event', self.toggle)
+        self.fig.canvas.mpl_connect('key_press_event', self.toggle)
+        self.fig.canvas.mpl_connect('close_event', lambda event: self.close())
+        self.thread = threading.Thread(target=self.rasterize, name='PreviewPlayer', daemon=True)
+
+
+    def prepare_clone(self):
+        """
+        Set up an off-screen copy with its own figure and channel planes, to draw in the
+        background. It is set up in the main thread and shares only state that is no longer
+        changed (the cube, the color range and the prepared overlays). Without feed, it draws at
+        the resolution of the screen, otherwise at the resolution of the fed frames.
+        """
+        cubemovie = self.cubemovie
+        cubemovie.prepare_overlays()
+        self.clone = copy.copy(cubemovie)
+        self.clone.hooks = []
+        self.clone.channels = list(cubemovie.channels)
+        self.clone.labels = {}
+        self.clone.warningstatus = dict(cubemovie.warningstatus)
+        self.clone.planes = None
+        self.clone.contours = None
+        self.clone.frame_cache = None
+        if not self.feeding:
+            self.clone.dpi = None
+        self.clone.is_interactive = False
+        self.clone.set_up_plot()
+        self.render = self.renderer()
+
+
+    def position(self):
+        """
+        Playback time in seconds, not counting pauses.
+        """
+        if self.paused or self.start_time is None:
+            return self.elapsed
+        return self.elapsed+time.perf_counter()-self.start_time
+
+
+    def due(self):
+        """
+        Index of the frame that should be on screen now. Indices keep counting when repeating.
+        """
+        return int(self.position()*self.fps)
+
+
+    def renderer(self):
+        """
+        Prepare the off-screen copy for drawing and return a function that renders a channel and
+        returns the frame buffer.
+        """
+        clone = self.clone
+        if clone.renderer == 'numpy' and not clone.contourlevels:
+            from .NumpyRenderer import NumpyRenderer
+            renderer = NumpyRenderer(clone, batch_size=1)
+            renderer.prepare()
+            return lambda channel: next(renderer.iter_frames([channel]))
+        if clone.renderer != 'full':
+            clone.renderer = 'blit'
+            clone.cache_background()
+
+        def render(channel):
+            clone.draw_frame(channel)
+            return clone.frame_buffer()
+        return render
+
+
+    def rasterize(self):
+        """
+        Render the frames into the ring buffer. Runs in the background thread.
+        """
+        index = self.next_index
+        while True:
+            with self.condition:
+                while self.running and len(self.buffer) >= self.buffer_size:
+                    self.condition.wait()
+                if not self.running:
+                    break
+                # skip what is already overdue
+                due = self.due() if self.repeat else min(self.due(), len(self.channels))
+                if due > index:
+                    self.dropped += due-index
+                    index = due
+            if not self.repeat and index >= len(self.channels):
+                break
+            frame = np.array(self.render(self.channels[index%len(self.channels)]))
+            with self.condition:
+                self.buffer.append((index, frame))
+                # the clock starts with the first frame, not with setting up the renderer
+                if self.start_time is None:
+                    self.start_time = time.perf_counter()
+            index += 1
+        with self.condition:
+            self.finished = True
+        if self.clone is not None:
+            self.clone.close_planes()
+
+
+    def feed(self, frame):
+        """
+        Buffer a frame of the movie as it is saved and show the frame that is due. Runs in the
+        render, which is never held up: once the buffer is full, the following frames are left to
+        the rasterizer (see end_feed). Also processes the events of the window, which cannot run
+        its timer while the render keeps the main thread busy.
+        """
+        with self.condition:
+            if self.accepting and self.next_index < len(self.channels) and len(self.buffer) < self.buffer_size:
+                self.buffer.append((self.next_index, np.array(frame)))
+                self.next_index += 1
+                # the clock starts with the first frame
+                if self.start_time is None:
+                    self.start_time = time.perf_counter()
+            else:
+                # keep the fed frames contiguous, the rest is rasterized after saving
+                self.accepting = False
+        if self.running and not self.paused:
+            self.show_next()
+        self.fig.canvas.flush_events()
+
+
+    def end_feed(self, saved=True):
+        """
+        Stop feeding when the movie is saved and let the rasterizer continue with the frames that
+        were not fed, or with the next round when repeating. If saving failed, the preview is
+        closed and the environment is left to the caller.
+        """
+        self.feeding = False
+        self.accepting = False
+        if not saved:
+            self.restored = True
+            self.close()
+        elif not self.running:
+            # closed while saving
+            self.restore_environment()
+        else:
+            if self.repeat or self.next_index < len(self.channels):
+                self.prepare_clone()
+            self.thread.start()
+
+
+    def show_next(self):
+        """
+        Show the latest ready frame that is due and drop older ones. Runs in the timer of the
+        window and never waits for the rasterizer.
+        """
+        due = self.due()
+        frame = None
+        with self.condition:
+            while self.buffer and self.buffer[0][0] <= due:
+                if frame is not None:
+                    self.dropped += 1
+                frame = self.buffer.popleft()[1]
+            self.condition.notify_all()
+            finished = self.finished and not self.buffer
+        if frame is not None:
+            self.image.set_data(frame)
+            self.fig.canvas.draw_idle()
+            self.shown += 1
+        if finished:
+            self.event_source.stop()
+            self.running = False
+            print("Preview showed "+str(self.shown)+" frames, "+str(self.dropped)+" dropped")
+            self.restore_environment()
+
+
+    def start(self):
+        """
+        Start rasterizing (without feed) and playing.
+        """
+        self.running = True
+        if not self.feeding:
+            self.thread.start()
+        self.event_source.start()
+
+
+    def pause(self):
+        """
+        Stop the playback. Rasterizing continues until the buffer is full.
+        """
+        if not self.paused:
+            with self.condition:
+                self.elapsed = self.position()
+                self.paused = True
+            self.event_source.stop()
+
+
+    def resume(self):
+        """
+        Continue the playback where it was paused.
+        """
+        if self.paused:
+            with self.condition:
+                self.start_time = time.perf_counter()
+                self.paused = False
+            self.event_source.start()
+
+
+    def toggle(self, event):
+        """
+        Stop or restart on a click or the space bar.
+        """
+        if event.name == 'key_press_event' and event.key != ' ':
+            return
+        if self.paused:
+            self.cubemovie.start_animation()
+        else:
+            self.cubemovie.stop_animation()
+
+
+    def close(self):
+        """
+        Stop playing and rasterizing, e.g. when the window is closed.
+        """
+        self.event_source.stop()
+        with self.condition:
+            self.running = False
+            self.buffer.clear()
+            self.condition.notify_all()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.restore_environment()
+
+
+    def restore_environment(self):
+        """
+        Restore the environment of the CubeToMovie once, when the preview no longer draws (see
+        CubeToMovie.restore_environment). While the movie is saved, end_feed restores it.
+        """
+        if not self.restored and not self.feeding:
+            self.restored = True
+            self.cubemovie.restore_environment()
+
+
+####################################################################################################
@@ -0,0 +1,224 @@
+####################################################################################################
+# renders running in a background process
+####################################################################################################
+
+__all__ = ["RenderHandle", "RenderCancelled"]
+
+import time
+import queue
+import threading
+
+
+class RenderCancelled(Exception):
+    """
+    Raised in the render process to stop a cancelled render.
+    """
+
+
+class ProgressReporter:
+    """
+    Hook of the render process (see CubeToMovie.hooks) that sends the progress of the frames to
+    the RenderHandle and stops the render when it is cancelled. Stopping raises RenderCancelled
+    from the next event of the main thread, i.e. within the frame loop it leaves the writers, which
+    kill ffmpeg (see FrameWriter.abort).
+    """
+
+    def __init__(self, messages, cancel):
+        self.messages = messages
+        self.cancel = cancel
+        self.frames = 0
+
+    def __call__(self, event):
+        if threading.current_thread() is not threading.main_thread():
+            return
+        if self.cancel.is_set():
+            raise RenderCancelled()
+        if event['name'] == 'frame':
+            self.frames += 1
+            self.messages.put(('frame', (self.frames, event['args']['frames'])))
+
+
+def _run_render(cube, options, messages, cancel):
+    """
+    Run cube2movie and send its result. Runs in the render process.
+    """
+    import traceback
+    import matplotlib as mpl
+    mpl.use('Agg')
+    from .cube2movie import cube2movie
+
+    reporter = ProgressReporter(messages, cancel)
+    options = dict(options, hooks=list(options.get('hooks', []))+[reporter], preview_movie=False)
+    try:
+        messages.put(('done', cube2movie(cube, **options)))
+    except RenderCancelled:
+        messages.put(('cancelled', None))
+    except BaseException as e:
+        messages.put(('error', ''.join(traceback.format_exception(type(e), e, e.__traceback__))))
+
+
+class RenderHandle:
+    """
+    Handle on a render running in a background process (see cube2movie_async).
+
+    The progress is available as frames_done, frames_total (None until the first frame is done),
+    throughput (frames per second) and eta (seconds); the handle shows it when printed. result()
+    waits for the render and returns the movie files written, or raises the error of the render.
+    cancel() stops the render at the next frame: ffmpeg is killed, the environment of the render
+    is restored and the process ends. A render that does not stop in time (e.g. while computing
+    the percentiles of a large cube) is terminated.
+    In asyncio code (e.g. a Jupyter cell), the handle can be awaited. Callbacks added with
+    add_done_callback are called with the handle when the render ends, in a background thread.
+    With several workers, the frames of the segments are only counted when the movie is done.
+    """
+
+    def __init__(self, cube, options):
+        import multiprocessing
+        import concurrent.futures
+
+        self.cube = cube
+        self.frames_done = 0
+        self.frames_total = None
+        self.first_frame = None
+        self.last_frame = None
+        self.future = concurrent.futures.Future()
+
+        # spawn fresh interpreters: forking a process with an active matplotlib backend is unsafe
+        context = multiprocessing.get_context('spawn')
+        self.messages = context.Queue()
+        self.cancel_event = context.Event()
+        # not a daemon: the render may start processes of its own (workers)
+        self.process = context.Process(target = _run_render,
+                                       args   = (cube, options, self.messages, self.cancel_event),
+                                       name   = 'cube2movie'
+                                      )
+        self.process.start()
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self.thread = threading.Thread(target=self.watch, name='RenderHandle', daemon=True)
+        self.thread.start()
+
+
+    def watch(self):
+        """
+        Follow the messages of the render process until it ends. Runs in a background thread.
+        """
+        while True:
+            try:
+                kind, value = self.messages.get(timeout=0.5)
+            except queue.Empty:
+                if self.process.is_alive():
+                    continue
+                # the last message may still be on its way
+                try:
+                    kind, value = self.messages.get(timeout=1)
+                except queue.Empty:
+                    kind, value = 'error', "The render process ended with exit code "+str(self.process.exitcode)+"."
+                    if self.cancel_event.is_set():
+                        kind = 'cancelled'
+            if kind == 'frame':
+                self.frames_done, self.frames_total = value
+                self.last_frame = time.perf_counter()
+                if self.first_frame is None:
+                    self.first_frame = (self.frames_done, self.last_frame)
+                continue
+            break
+
+        self.process.join()
+        self.end_time = time.perf_counter()
+        if kind == 'done':
+            self.frames_done = self.frames_total = max(self.frames_done, self.frames_total or 0)
+            self.future.set_result(value)
+        elif kind == 'cancelled':
+            self.future.cancel()
+            self.future.set_running_or_notify_cancel()
+        else:
+            self.future.set_exception(RuntimeError("Rendering "+str(self.cube)+" failed:\n"+value))
+
+
+    @property
+    def throughput(self):
+        """
+        Frames per second since the first frame, None before the second frame.
+        """
+        if self.first_frame is None or self.last_frame == self.first_frame[1]:
+            return None
+        return (self.frames_done-self.first_frame[0])/(self.last_frame-self.first_frame[1])
+
+
+    @property
+    def eta(self):
+        """
+        Estimated seconds until all frames are rendered, None while unknown.
+        """
+        if self.done():
+            return 0.
+        if self.frames_total is None or not self.throughput:
+            return None
+        return max(self.frames_total-self.frames_done, 0)/self.throughput
+
+
+    @property
+    def elapsed(self):
+        """
+        Seconds since the render was started, or that it took.
+        """
+        return (self.end_time or time.perf_counter())-self.start_time
+
+
+    def cancel(self, timeout=10):
+        """
+        Stop the render and wait until the process has ended. The process is terminated if it does
+        not stop within timeout seconds. Returns False if the render had already ended.
+        """
+        if self.done():
+            return False
+        self.cancel_event.set()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.thread.join()
+        return self.future.cancelled()
+
+
+    def done(self):
+        return self.future.done()
+
+    def running(self):
+        return not self.future.done()
+
+    def cancelled(self):
+        return self.future.cancelled()
+
+    def result(self, timeout=None):
+        """
+        Wait for the render and return the movie files written.
+        """
+        return self.future.result(timeout)
+
+    def exception(self, timeout=None):
+        return self.future.exception(timeout)
+
+    def add_done_callback(self, callback):
+        self.future.add_done_callback(lambda future: callback(self))
+
+    def __await__(self):
+        import asyncio
+        return asyncio.wrap_future(self.future).__await__()
+
+
+    def __repr__(self):
+        if self.cancelled():
+            state = 'cancelled'
+        elif self.done():
+            state = 'failed' if self.future.exception() else 'done'
+        else:
+            state = 'running'
+        progress = str(self.frames_done)+'/'+('?' if self.frames_total is None else str(self.frames_total))+' frames'
+        if self.running() and self.throughput:
+            progress += ', {0:.1f} frames/s, ETA {1:.0f} s'.format(self.throughput, self.eta)
+        return '<RenderHandle '+str(self.cube)+' '+state+': '+progress+' in {0:.0f} s>'.format(self.elapsed)
+
+
+####################################################################################################
@@ -0,0 +1,186 @@
+####################################################################################################
+# percentiles of large cubes in a single pass
+####################################################################################################
+
+__all__ = ["StreamingPercentiles", "plane_percentiles"]
+
+import os
+import numpy as np
+
+class StreamingPercentiles:
+    """
+    Estimate percentiles of data that is passed in chunks, without holding or sorting all of it.
+
+    The values are collected in a histogram with a fixed number of bins over asinh(value/scale),
+    which is linear for values within the scale set by the first chunk and logarithmic beyond.
+    The bulk of the data is thus resolved finely, while a few extreme outliers only stretch the
+    histogram logarithmically. The histogram range is set by the first chunk and doubled
+    (merging pairs of bins) whenever a later chunk falls outside of it. Any percentile can then
+    be read off the cumulative histogram, interpolating linearly within the bin. The error of the
+    estimated values is at most the width of their bin (see value_error).
+    """
+
+    def __init__(self, bins=2**16):
+        self.bins = bins + bins%2
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+        self.scale = None
+        self.low = None
+        self.width = None
+        self.sampled = 0
+        self.total = 0
+        self.random = True
+
+
+    def transform(self, values):
+        return np.arcsinh(np.asarray(values, dtype=np.float64)/self.scale)
+
+    def inverse(self, values):
+        return self.scale*np.sinh(values)
+
+
+    def grow(self, low, high):
+        """
+        Double the bin width until the histogram covers [low, high] (transformed values).
+        """
+        while low < self.low or high >= self.low+self.bins*self.width:
+            merged = self.counts.reshape(-1,2).sum(axis=1)
+            empty  = np.zeros(self.bins//2, dtype=np.int64)
+            self.width *= 2
+            if low < self.low:
+                self.counts = np.concatenate([empty, merged])
+                self.low -= self.bins//2*self.width
+            else:
+                self.counts = np.concatenate([merged, empty])
+
+
+    def add(self, values, total=None, random=True):
+        """
+        Add a chunk of values. NaNs and infinities are ignored. If the values are a sample of a
+        larger chunk, total is the number of values in that chunk and random tells whether they
+        were drawn at random from it (for the error estimate).
+        """
+        values = np.asarray(values).ravel()
+        values = values[np.isfinite(values)]
+        self.total += len(values) if total is None else total
+        self.random = self.random and (random or total is None)
+        if len(values) == 0:
+            return
+        low, high = float(values.min()), float(values.max())
+        if self.low is None:
+            self.scale = max(high-low, abs(high)*1e-6, 1e-30)
+            low, high = self.transform([low, high])
+            self.width = max(high-low, 1e-12)/(self.bins-1)
+            self.low = low
+        else:
+            low, high = self.transform([low, high])
+        self.grow(low, high)
+        index = ((self.transform(values)-self.low)/self.width).astype(np.int64)
+        np.clip(index, 0, self.bins-1, out=index)
+        self.counts += np.bincount(index, minlength=self.bins)
+        self.sampled += len(values)
+
+
+    def locate(self, q):
+        """
+        The bins of the q-th percentiles and the fractions of the bins below them.
+        """
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        cumulative = np.cumsum(self.counts)
+        rank = q/100*(cumulative[-1]-1)
+        i = np.searchsorted(cumulative, rank, side='right')
+        before = np.where(i>0, cumulative[np.maximum(i-1,0)], 0)
+        fraction = (rank-before+0.5)/np.maximum(self.counts[i],1)
+        return i, np.clip(fraction,0,1)
+
+
+    def percentile(self, q):
+        """
+        Estimate the q-th percentile (0-100). q can be a number or a list.
+        """
+        i, fraction = self.locate(q)
+        values = self.inverse(self.low + (i+fraction)*self.width)
+        return values if len(values)>1 else values[0]
+
+
+    def value_error(self, q=(0,100)):
+        """
+        Maximum error of the estimated q-th percentile values due to the histogram binning, i.e.
+        the largest width of their bins.
+        """
+        i, fraction = self.locate(q)
+        edges = self.inverse(self.low + np.array([i, i+1])*self.width)
+        return float(np.max(edges[1]-edges[0]))
+
+
+    def rank_error(self, confidence=0.95):
+        """
+        Error of the estimated percentiles in percentage points due to sampling, at the given
+        confidence (Dvoretzky-Kiefer-Wolfowitz inequality). 0 if all values were used. The bound
+        assumes a random sample; for other samples (e.g. every n-th channel), it is None.
+        """
+        if self.sampled >= self.total or self.sampled == 0:
+            return 0.
+        if not self.random:
+            return None
+        return 100*np.sqrt(np.log(2/(1-confidence))/(2*self.sampled))
+
+
+    def save(self, filename, **key):
+        """
+        Store the histogram together with key values that identify the data.
+        """
+        np.savez(filename, counts=self.counts, scale=self.scale, low=self.low, width=self.width,
+                 sampled=self.sampled, total=self.total, random=self.random, **key
+                )
+
+
+    @classmethod
+    def load(cls, filename, **key):
+        """
+        Load a histogram stored with save if it exists and matches all key values, else None.
+        """
+        if not os.path.exists(filename):
+            return None
+        try:
+            with np.load(filename) as stored:
+                for k,v in key.items():
+                    if k not in stored or stored[k] != v:
+                        return None
+                estimator = cls(bins=len(stored['counts']))
+                estimator.counts  = stored['counts']
+                estimator.scale   = float(stored['scale'])
+                estimator.low     = float(stored['low'])
+                estimator.width   = float(stored['width'])
+                estimator.sampled = int(stored['sampled'])
+                estimator.total   = int(stored['total'])
+                estimator.random  = bool(stored['random'])
+        except (OSError, ValueError, KeyError):
+            return None
+        return estimator
+
+
+
+def plane_percentiles(planes, q):
+    """
+    The q-th percentiles (list) of every plane of a stack (n x ny x nx), ignoring NaNs, as an array
+    of shape (len(q), n). All planes are sorted at once and the percentiles are interpolated
+    linearly between ranks as numpy.nanpercentile does. Planes without finite values give NaN.
+    """
+    values = np.asarray(planes, dtype=np.float32).reshape(len(planes), -1)
+    valid = np.isfinite(values)
+    count = valid.sum(axis=1)
+    # invalid values sort to the end, behind the count valid ones
+    values = np.where(valid, values, np.inf)
+    values.sort(axis=1)
+    result = np.full((len(q), len(values)), np.nan)
+    rows = np.flatnonzero(count)
+    for i, percentile in enumerate(q):
+        rank = percentile/100*(count[rows]-1)
+        below = np.floor(rank).astype(np.intp)
+        above = np.minimum(below+1, count[rows]-1)
+        weight = rank-below
+        result[i,rows] = values[rows,below]*(1-weight) + values[rows,above]*weight
+    return result
+
+
+####################################################################################################
@@ -1,4 +1,34 @@
-from .CubeToMovie import CubeToMovie
-from .cube2movie import cube2movie
+import sys
+import types
+import importlib
+
+# public names and the modules they are defined in, imported on first use: importing the package
+# loads neither numpy, matplotlib, astropy nor spectral_cube
+_exports = {'CubeToMovie':      'CubeToMovie',
+            'cube2movie':       'cube2movie',
+            'cube2movie_async': 'cube2movie'
+           }
+
+__all__ = list(_exports)
+
+
+class _Package(types.ModuleType):
+
+    def __getattr__(self, name):
+        if name not in _exports:
+            raise AttributeError("module "+repr(self.__name__)+" has no attribute "+repr(name))
+        value = getattr(importlib.import_module('.'+_exports[name], self.__name__), name)
+        setattr(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        # importing a module binds it to the package by its name, which must not hide the class
+        # or function of the same name
+        if name in _exports and isinstance(value, types.ModuleType):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
 
 version = "0.1"
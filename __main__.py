@@ -0,0 +1,12 @@
+####################################################################################################
+# command line entry point: python -m cube2movie manifest.json
+####################################################################################################
+
+import sys
+from .batch import main
+
+# spawned worker processes import this module again as __mp_main__
+if __name__ == '__main__':
+    sys.exit(main())
+
+####################################################################################################
@@ -0,0 +1,208 @@
+####################################################################################################
+# render many cubes on a pool of warm worker processes
+####################################################################################################
+
+__all__ = ["read_manifest", "resolve_paths", "estimate_cost", "run_batch", "main"]
+
+import os
+import json
+import time
+
+
+def read_manifest(filename):
+    """
+    Read a manifest of cubes to render. The manifest is a json file with either a list of jobs or
+    a dictionary {"defaults": {...}, "jobs": [...]}. A job is the filename of a cube or a
+    dictionary {"cube": filename, ...} with further keyword arguments to cube2movie, which
+    override the defaults. The movie is written next to the cube unless "out" is given. Relative
+    paths are relative to the directory of the manifest.
+    """
+    with open(filename) as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    jobs = []
+    for job in manifest['jobs']:
+        if isinstance(job, str):
+            job = {'cube': job}
+        job = dict(manifest.get('defaults', {}), **job)
+        if 'cube' not in job:
+            raise ValueError("Job without cube in "+filename+": "+str(job))
+        job['cube'] = os.path.join(directory, job['cube'])
+        job['out'] = job.get('out', os.path.splitext(job['cube'])[0]+'.mp4')
+        jobs.append(resolve_paths(job, directory))
+    return jobs
+
+
+def resolve_paths(job, directory=None):
+    """
+    Make the paths of the cube and the movies (out and outputs, see CubeToMovie.output_specs) of
+    a job absolute, relative to directory (default: the current working directory), so that the
+    workers do not depend on their working directory.
+    """
+    def resolve(path):
+        return os.path.abspath(os.path.join(directory or os.getcwd(), path))
+
+    job = dict(job)
+    job['cube'] = resolve(job['cube'])
+    if job.get('out') is not None:
+        job['out'] = resolve(job['out'])
+    if job.get('outputs'):
+        job['outputs'] = [resolve(spec) if isinstance(spec, str) else dict(spec, out=resolve(spec['out'])) for spec in job['outputs']]
+    return job
+
+
+def estimate_cost(job):
+    """
+    Estimate the relative cost of rendering a job as the number of pixels per channel times the
+    number of rendered channels, from the fits header. Other cubes are estimated from their size
+    on disk. Missing cubes cost 0 (their jobs fail right away).
+    """
+    from astropy.io import fits
+
+    cube = job['cube']
+    if not os.path.exists(cube):
+        return 0
+    try:
+        header = fits.getheader(cube)
+        pixels = header['NAXIS1']*header['NAXIS2']
+        channels = header['NAXIS3']
+    except (OSError, KeyError, IndexError):
+        size = sum(os.path.getsize(os.path.join(root,name)) for root,dirs,names in os.walk(cube) for name in names) if os.path.isdir(cube) else os.path.getsize(cube)
+        return size//4
+    selected = job.get('channels', [])
+    if selected and all(isinstance(channel, int) for channel in selected):
+        channels = len(selected)
+    return pixels*channels
+
+
+def _warm_up(usetex=True):
+    """
+    Import the heavy modules and draw a small channel map once, so that font caches, (La)TeX and
+    the WCS axes machinery are set up before the first job arrives. The figure is kept for the
+    first job to draw into (see CubeToMovie.keep_figure). Runs once in every worker.
+    """
+    import warnings
+    import traceback
+    from .CubeToMovie import CubeToMovie
+    from .benchmark import synthetic_hdu
+
+    try:
+        cubemovie = CubeToMovie(synthetic_hdu(nx=32, ny=32, nchan=2))
+        cubemovie.usetex = usetex
+        cubemovie.prepare_environment()
+        cubemovie.vmin, cubemovie.vmax = 0, 1
+        cubemovie.figsize = (2,2)
+        cubemovie.set_up_plot()
+        cubemovie.fig.canvas.draw()
+        cubemovie.keep_figure()
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+    except Exception as e:
+        # the jobs still run, but the first one pays for the setup and likely fails the same way
+        warnings.warn("\nWarming up worker "+str(os.getpid())+" failed:\n"+''.join(traceback.format_exception(type(e), e, e.__traceback__)), UserWarning, stacklevel=2)
+
+
+def _run_job(job):
+    """
+    Render a single job and report its timing. Runs in a worker process.
+    """
+    import traceback
+    from .cube2movie import cube2movie
+
+    options = {key: value for key,value in job.items() if key != 'cube'}
+    options['preview_movie'] = False
+    result = {'cube': job['cube'], 'out': job['out'], 'pid': os.getpid()}
+    start = time.perf_counter()
+    try:
+        cube2movie(job['cube'], **options)
+        result['status'] = 'ok'
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = ''.join(traceback.format_exception_only(type(e), e)).strip()
+    result['seconds'] = time.perf_counter()-start
+    return result
+
+
+def write_summary(results, filename):
+    """
+    Write the job results to a json or (any other extension) csv file.
+    """
+    if filename.endswith('.json'):
+        with open(filename, 'w') as f:
+            json.dump(results, f, indent=2)
+        return
+    import csv
+    fields = ['cube', 'out', 'status', 'cost', 'seconds', 'pid', 'error']
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, restval='')
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def run_batch(jobs, workers=None, summary=None):
+    """
+    Render jobs (see read_manifest) on a pool of worker processes that stay alive between jobs.
+    The most expensive jobs (see estimate_cost) are started first, so that long jobs do not end up
+    running alone at the end. Returns the results of all jobs in the order of jobs and writes them
+    to the summary file if given.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    workers = workers or os.cpu_count()
+    jobs = [resolve_paths(job) for job in jobs]
+    costs = [estimate_cost(job) for job in jobs]
+    order = sorted(range(len(jobs)), key=lambda i: costs[i], reverse=True)
+
+    print("Rendering "+str(len(jobs))+" cubes on "+str(workers)+" workers ...")
+    results = [None]*len(jobs)
+    start = time.perf_counter()
+    # spawn fresh interpreters: forking a process with an active matplotlib backend is unsafe
+    with ProcessPoolExecutor(max_workers = workers,
+                             mp_context  = multiprocessing.get_context('spawn'),
+                             initializer = _warm_up,
+                             initargs    = (any(job.get('usetex', True) for job in jobs),)
+                            ) as pool:
+        futures = {pool.submit(_run_job, jobs[i]): i for i in order}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = dict(future.result(), cost=costs[i])
+            print("["+results[i]['status']+"] "+jobs[i]['cube']+" in {0:.1f}s".format(results[i]['seconds']))
+    total = time.perf_counter()-start
+
+    print("\n{0:<40} {1:>8} {2:>14} {3:>10}".format('cube', 'status', 'cost [pix]', 'time [s]'))
+    for result in results:
+        print("{0:<40} {1:>8} {2:>14} {3:>10.1f}".format(os.path.basename(result['cube']), result['status'], result['cost'], result['seconds']))
+    print("{0} of {1} cubes rendered in {2:.1f}s (sum of job times {3:.1f}s)".format(sum(result['status']=='ok' for result in results), len(results), total, sum(result['seconds'] for result in results)))
+    if summary is not None:
+        write_summary(results, summary)
+        print("Summary saved as "+summary)
+    return results
+
+
+def main(argv=None):
+    """
+    Command line entry point, see python -m cube2movie --help.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m cube2movie', description="Render movies of many cubes listed in a manifest.")
+    parser.add_argument('manifest', help="json file with the cubes and their cube2movie options")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument('-s', '--summary', default=None, help="write the job timings to this csv or json file")
+    parser.add_argument('-n', '--dry-run', action='store_true', help="only list the jobs in the order they would be started")
+    args = parser.parse_args(argv)
+
+    jobs = read_manifest(args.manifest)
+    if args.dry_run:
+        for job in sorted(jobs, key=estimate_cost, reverse=True):
+            print("{0:>14} {1} -> {2}".format(estimate_cost(job), job['cube'], job['out']))
+        return 0
+    results = run_batch(jobs, workers=args.workers, summary=args.summary)
+    return 0 if all(result['status']=='ok' for result in results) else 1
+
+
+####################################################################################################
@@ -0,0 +1,400 @@
+####################################################################################################
+# benchmarks on synthetic cubes
+####################################################################################################
+
+__all__ = ["synthetic_hdu", "synthetic_cube", "benchmark_workers", "NullWriter", "benchmark_stages", "benchmark_suite", "compare_results", "benchmark_out_of_core", "benchmark_startup"]
+
+import os
+import sys
+import json
+import time
+import numpy as np
+
+
+def synthetic_hdu(nx=256, ny=256, nchan=64, seed=0):
+    """
+    Create a synthetic cube with a valid celestial and spectral (radio velocity) WCS as fits HDU.
+    The cube contains a rotating gaussian source on top of gaussian noise.
+    """
+    from astropy.io import fits
+
+    header = fits.Header()
+    header['CTYPE1'] = 'RA---SIN'
+    header['CRVAL1'] = 83.8
+    header['CDELT1'] = -1e-4
+    header['CRPIX1'] = nx/2
+    header['CUNIT1'] = 'deg'
+    header['CTYPE2'] = 'DEC--SIN'
+    header['CRVAL2'] = -5.4
+    header['CDELT2'] = 1e-4
+    header['CRPIX2'] = ny/2
+    header['CUNIT2'] = 'deg'
+    header['CTYPE3'] = 'VRAD'
+    header['CRVAL3'] = 0.
+    header['CDELT3'] = 1000.
+    header['CRPIX3'] = nchan/2
+    header['CUNIT3'] = 'm/s'
+    header['RESTFRQ'] = 230.538e9
+    header['BUNIT'] = 'Jy/beam'
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:ny,:nx]
+    data = np.empty((nchan,ny,nx), dtype=np.float32)
+    for chan in range(nchan):
+        angle = 2*np.pi*chan/nchan
+        x0 = nx/2 + nx/4*np.cos(angle)
+        y0 = ny/2 + ny/4*np.sin(angle)
+        data[chan] = np.exp(-((x-x0)**2+(y-y0)**2)/(2*(nx/16)**2)) + 0.05*rng.standard_normal((ny,nx))
+    return fits.PrimaryHDU(data, header)
+
+
+def synthetic_cube(filename, nx=256, ny=256, nchan=64, seed=0):
+    """
+    Write a synthetic cube (see synthetic_hdu) to a fits file.
+    """
+    synthetic_hdu(nx=nx, ny=ny, nchan=nchan, seed=seed).writeto(filename, overwrite=True)
+    return filename
+
+
+def benchmark_workers(workers=[1,2,4,8], nx=256, ny=256, nchan=64, directory='.', **kwargs):
+    """
+    Time cube2movie on a synthetic cube for different numbers of worker processes and report the
+    speed-up relative to the first entry in workers. Further kwargs are passed to cube2movie.
+    """
+    from .cube2movie import cube2movie
+
+    cube = synthetic_cube(os.path.join(directory, 'benchmark_cube.fits'), nx=nx, ny=ny, nchan=nchan)
+    out  = os.path.join(directory, 'benchmark_movie.mp4')
+
+    timings = {}
+    for n in workers:
+        start = time.perf_counter()
+        cube2movie(cube, channels=list(range(nchan)), out=out, workers=n, **kwargs)
+        timings[n] = time.perf_counter()-start
+
+    print("\n{0:>8} {1:>10} {2:>10} {3:>11}".format('workers', 'time [s]', 'speed-up', 'efficiency'))
+    for n,t in timings.items():
+        speedup = timings[workers[0]]/t
+        print("{0:>8} {1:>10.2f} {2:>10.2f} {3:>10.0f}%".format(n, t, speedup, speedup*workers[0]/n*100))
+    os.remove(cube)
+    os.remove(out)
+    return timings
+
+
+class NullWriter:
+    """
+    Stand-in for FrameWriter that discards the frames, to time rendering without encoding.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.frames_written = 0
+
+    def write(self, frame):
+        self.frames_written += 1
+
+    def close(self):
+        pass
+
+
+def _benchmark_case(case):
+    """
+    Time the stages of rendering a movie of one cube. Runs in a fresh worker process, so that
+    imports are included in load_cube and the peak memory belongs to this case alone.
+    """
+    from .CubeToMovie import CubeToMovie
+    from .FrameWriter import FrameWriter
+    from .Instrumentation import peak_rss
+
+    settings = dict(case['settings'])
+    stages = {}
+    start = time.perf_counter()
+    cubemovie = CubeToMovie(case['cube'], out_of_core=settings.pop('out_of_core', False))
+    stages['load_cube'] = time.perf_counter()-start
+    cubemovie.figsize       = tuple(case['figsize'])
+    cubemovie.dpi           = case['dpi']
+    cubemovie.renderer      = case['renderer']
+    cubemovie.contourlevels = [0.25, 0.5, 0.75] if case['contours'] else []
+    cubemovie.out           = case['out']
+    for setting, value in settings.items():
+        setattr(cubemovie, setting, value)
+    # after the settings, which include usetex
+    cubemovie.prepare_environment()
+
+    start = time.perf_counter()
+    cubemovie.set_range()
+    stages['set_range'] = time.perf_counter()-start
+
+    start = time.perf_counter()
+    cubemovie.set_up_plot()
+    stages['set_up_plot'] = time.perf_counter()-start
+
+    if case['encoder'] == 'null':
+        writer = NullWriter()
+    else:
+        writer = FrameWriter(cubemovie.out, fps=cubemovie.fps, codec=cubemovie.codec, bitrate=cubemovie.bitrate, queue_depth=cubemovie.queue_depth)
+    frame_times = []
+    encode = 0.
+    frames = cubemovie.iter_frames()
+    while True:
+        start = time.perf_counter()
+        frame = next(frames, None)
+        drawn = time.perf_counter()
+        if frame is None:
+            break
+        frame_times.append(drawn-start)
+        writer.write(frame)
+        encode += time.perf_counter()-drawn
+    start = time.perf_counter()
+    writer.close()
+    encode += time.perf_counter()-start
+    cubemovie.close_planes()
+    cubemovie.restore_environment()
+
+    stages['draw'] = float(np.sum(frame_times))
+    stages['encode'] = encode
+    return {'stages':      stages,
+            'frame_ms':    {'mean':   1000*float(np.mean(frame_times)),
+                            'median': 1000*float(np.median(frame_times)),
+                            'p95':    1000*float(np.percentile(frame_times, 95)),
+                            'first':  1000*frame_times[0]
+                           },
+            'frames':      len(frame_times),
+            'peak_rss_mb': peak_rss()/2**20
+           }
+
+
+def benchmark_stages(nx=256, ny=256, nchan=64, contours=False, renderer='full', encoder='null', directory='.', dpi=100, figsize=(8,8), **settings):
+    """
+    Time the stages of rendering a synthetic cube (load_cube, set_range, set_up_plot, the drawing
+    of every frame and the time spent waiting for the encoder) and record the peak memory. The
+    case runs in a fresh process. encoder='null' discards the frames instead of piping them to
+    ffmpeg. Further settings are set as CubeToMovie attributes.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    cube = os.path.join(directory, 'benchmark_'+str(nx)+'x'+str(ny)+'x'+str(nchan)+'.fits')
+    if not os.path.exists(cube):
+        synthetic_cube(cube, nx=nx, ny=ny, nchan=nchan)
+    case = {'nx': nx, 'ny': ny, 'nchan': nchan, 'contours': contours, 'renderer': renderer, 'encoder': encoder,
+            'dpi': dpi, 'figsize': list(figsize), 'settings': settings,
+            'cube': cube, 'out': os.path.join(directory, 'benchmark_movie.mp4')
+           }
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        result = pool.submit(_benchmark_case, case).result()
+    del case['cube'], case['out']
+    return dict(case, **result)
+
+
+def _environment():
+    """
+    Versions and machine the benchmarks ran on, to tell results apart.
+    """
+    import platform
+    import subprocess
+    import matplotlib
+    import astropy
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True
+                               ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'matplotlib': matplotlib.__version__, 'astropy': astropy.__version__,
+            'machine': platform.machine(), 'cpus': os.cpu_count()
+           }
+
+
+def benchmark_suite(sizes=[256,512,1024], nchans=[32,128], contours=[False,True], renderers=['full'], encoder='null', directory='.', output=None, **kwargs):
+    """
+    Run benchmark_stages over a grid of square cube sizes, channel counts, with and without
+    contours and for the given renderers. The results are printed and, if output is given, written
+    to a json file that can be compared to other runs with compare_results.
+    Further kwargs are passed to benchmark_stages.
+    """
+    results = {'environment': _environment(), 'cases': []}
+    print("\n{0:>11} {1:>8} {2:>8} {3:>10} {4:>10} {5:>10} {6:>10} {7:>10} {8:>10} {9:>9}".format(
+          'cube', 'contours', 'renderer', 'load [s]', 'range [s]', 'setup [s]', 'draw [s]', 'encode [s]', 'frame [ms]', 'RSS [MB]'))
+    for size in sizes:
+        for nchan in nchans:
+            for contour in contours:
+                for renderer in renderers:
+                    case = benchmark_stages(nx=size, ny=size, nchan=nchan, contours=contour, renderer=renderer, encoder=encoder, directory=directory, **kwargs)
+                    results['cases'].append(case)
+                    stages = case['stages']
+                    print("{0:>11} {1:>8} {2:>8} {3:>10.2f} {4:>10.2f} {5:>10.2f} {6:>10.2f} {7:>10.2f} {8:>10.1f} {9:>9.0f}".format(
+                          str(size)+'x'+str(size)+'x'+str(nchan), str(contour), renderer, stages['load_cube'], stages['set_range'],
+                          stages['set_up_plot'], stages['draw'], stages['encode'], case['frame_ms']['median'], case['peak_rss_mb']))
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print("Results saved as "+output)
+    return results
+
+
+def compare_results(old, new, threshold=0.1):
+    """
+    Compare two result files of benchmark_suite case by case and print the ratio new/old of every
+    stage. Changes beyond the relative threshold are marked as slower or faster.
+    """
+    def load(filename):
+        with open(filename) as f:
+            return json.load(f)
+
+    def case_key(case):
+        return (case['nx'], case['ny'], case['nchan'], case['contours'], case['renderer'], case['encoder'], case['dpi'], tuple(case['figsize']), json.dumps(case['settings'], sort_keys=True))
+
+    old, new = load(old), load(new)
+    print("comparing "+str(old['environment']['commit'])+" (old) to "+str(new['environment']['commit'])+" (new)")
+    previous = {case_key(case): case for case in old['cases']}
+    comparison = []
+    for case in new['cases']:
+        if case_key(case) not in previous:
+            continue
+        reference = previous[case_key(case)]
+        print("\n"+str(case['nx'])+"x"+str(case['ny'])+"x"+str(case['nchan'])+", contours: "+str(case['contours'])+", renderer: "+case['renderer'])
+        values = dict(case['stages'], frame_median=case['frame_ms']['median']/1000, peak_rss=case['peak_rss_mb'])
+        references = dict(reference['stages'], frame_median=reference['frame_ms']['median']/1000, peak_rss=reference['peak_rss_mb'])
+        for stage, value in values.items():
+            ratio = value/references[stage] if references[stage] > 0 else np.inf
+            change = 'slower' if ratio > 1+threshold else 'faster' if ratio < 1-threshold else ''
+            print("  {0:<14} {1:>10.3f} {2:>10.3f} {3:>7.2f}x {4}".format(stage, references[stage], value, ratio, change))
+            comparison.append({'case': case_key(case)[:6], 'stage': stage, 'old': references[stage], 'new': value, 'ratio': ratio})
+    return comparison
+
+
+def benchmark_out_of_core(nx=1024, ny=1024, nchan=256, chunk_bytes=[16*2**20,64*2**20], directory='.', **kwargs):
+    """
+    Compare the peak memory and throughput of rendering a synthetic cube in memory (exact
+    percentiles) and out of core with dask for the given chunk sizes. Every case runs in a fresh
+    process (see benchmark_stages). Further kwargs are passed to benchmark_stages.
+    """
+    # every case computes its percentiles instead of reusing the sidecar file of the previous one
+    kwargs.setdefault('percentile_cache', False)
+    cases = {'in memory': benchmark_stages(nx=nx, ny=ny, nchan=nchan, directory=directory, **kwargs)}
+    for size in chunk_bytes:
+        cases['dask '+str(size//2**20)+' MB'] = benchmark_stages(nx=nx, ny=ny, nchan=nchan, directory=directory, out_of_core=True, chunk_bytes=size, **kwargs)
+
+    cube_mb = nx*ny*nchan*4/2**20
+    print("\n{0:>14} {1:>10} {2:>10} {3:>10} {4:>10} {5:>9}".format('mode', 'range [s]', 'draw [s]', 'MB/s', 'frame/s', 'RSS [MB]'))
+    for mode, case in cases.items():
+        stages = case['stages']
+        seconds = stages['set_range']+stages['draw']
+        print("{0:>14} {1:>10.2f} {2:>10.2f} {3:>10.1f} {4:>10.1f} {5:>9.0f}".format(
+              mode, stages['set_range'], stages['draw'], cube_mb/seconds, case['frames']/stages['draw'], case['peak_rss_mb']))
+    return cases
+
+
+# modules that a plain import of the package must not load, and GUI toolkits that probing for an
+# interactive backend would load
+HEAVY_MODULES = ['numpy', 'matplotlib', 'matplotlib.pyplot', 'astropy', 'spectral_cube']
+GUI_MODULES = ['tkinter', 'PyQt5', 'PyQt6', 'PySide2', 'PySide6', 'gi', 'wx']
+
+STARTUP_SCRIPT = """
+import sys, time, json, resource
+start = time.perf_counter()
+import {package} as c2m
+imported = time.perf_counter()
+on_import = [module for module in {heavy!r} if module in sys.modules]
+first = []
+def first_frame(event):
+    if event['name'] == 'frame' and not first:
+        first.append(time.perf_counter())
+c2m.cube2movie({cube!r}, out={out!r}, channels=[0,1], hooks=[first_frame], **{options!r})
+end = time.perf_counter()
+print(json.dumps({{'import': imported-start, 'first_frame': first[0]-start, 'render': end-start,
+                  'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*(1 if sys.platform == 'darwin' else 1024),
+                  'on_import': on_import, 'gui': [module for module in {gui!r} if module in sys.modules]}}))
+"""
+
+
+def benchmark_startup(nx=256, ny=256, nchan=8, runs=5, renderer='blit', directory='.', dpi=100, figsize=(8,8), output=None, **kwargs):
+    """
+    Time the startup of a fresh interpreter rendering a short synthetic cube: the import of the
+    package, the first frame (from the start of the import, including loading the cube, the
+    percentiles and setting up the plot) and the whole render of two frames, as the median of
+    runs. Also reports the heavy modules (numpy, matplotlib, pyplot, astropy, spectral_cube)
+    loaded by the import of the package alone and any GUI toolkit loaded by the render, which
+    should both be none. The result is a case of benchmark_suite, so with output, it can be
+    compared to other commits with compare_results. Further kwargs are passed to cube2movie.
+    """
+    import subprocess
+
+    cube = os.path.join(directory, 'benchmark_'+str(nx)+'x'+str(ny)+'x'+str(nchan)+'.fits')
+    if not os.path.exists(cube):
+        synthetic_cube(cube, nx=nx, ny=ny, nchan=nchan)
+    out = os.path.join(directory, 'benchmark_startup.mp4')
+    package = os.path.dirname(os.path.abspath(__file__))
+    script = STARTUP_SCRIPT.format(package=os.path.basename(package), heavy=HEAVY_MODULES, gui=GUI_MODULES,
+                                   cube=cube, out=out, options=dict(kwargs, renderer=renderer, dpi=dpi, figsize=tuple(figsize), percentile_cache=False))
+    paths = [os.path.dirname(package)] + ([os.environ['PYTHONPATH']] if 'PYTHONPATH' in os.environ else [])
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(paths))
+
+    timings = []
+    for run in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True)
+        process = time.perf_counter()-start
+        if result.returncode != 0:
+            raise RuntimeError("Startup benchmark failed:\n"+result.stderr)
+        timings.append(dict(json.loads(result.stdout.strip().splitlines()[-1]), process=process))
+    os.remove(out)
+
+    stages = {stage: float(np.median([timing[stage] for timing in timings])) for stage in ['import', 'first_frame', 'render', 'process']}
+    print("\n{0:>11} {1:>8} {2:>11} {3:>16} {4:>10} {5:>11}".format('cube', 'renderer', 'import [ms]', 'first frame [ms]', 'render [s]', 'process [s]'))
+    print("{0:>11} {1:>8} {2:>11.0f} {3:>16.0f} {4:>10.2f} {5:>11.2f}".format(
+          str(nx)+'x'+str(ny)+'x'+str(nchan), renderer, 1000*stages['import'], 1000*stages['first_frame'], stages['render'], stages['process']))
+    print("loaded by the import: "+(', '.join(timings[0]['on_import']) or 'none'))
+    print("GUI toolkits loaded:  "+(', '.join(timings[0]['gui']) or 'none'))
+
+    case = {'nx': nx, 'ny': ny, 'nchan': nchan, 'contours': False, 'renderer': renderer, 'encoder': 'ffmpeg',
+            'dpi': dpi, 'figsize': list(figsize), 'settings': dict(kwargs, startup=True),
+            'stages': stages, 'frame_ms': {'median': 1000*stages['first_frame']}, 'frames': 2,
+            'peak_rss_mb': float(np.median([timing['peak_rss'] for timing in timings]))/2**20, 'on_import': timings[0]['on_import'], 'gui': timings[0]['gui']
+           }
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump({'environment': _environment(), 'cases': [case]}, f, indent=2)
+        print("Results saved as "+output)
+    return case
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark cube2movie on synthetic cubes.")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1,2,4,8], help="numbers of worker processes to compare")
+    parser.add_argument('--size', type=int, nargs=2, default=[256,256], metavar=('NX','NY'), help="spatial size of the cube")
+    parser.add_argument('--nchan', type=int, default=64, help="number of channels")
+    parser.add_argument('--directory', default='.', help="directory to write the cube and movie to")
+    parser.add_argument('--suite', action='store_true', help="time the rendering stages over a grid of cubes instead of comparing workers")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256,512,1024], help="square cube sizes of the suite")
+    parser.add_argument('--nchans', type=int, nargs='+', default=[32,128], help="channel counts of the suite")
+    parser.add_argument('--renderers', nargs='+', default=['full'], help="renderers of the suite")
+    parser.add_argument('--no-contours', action='store_true', help="run the suite only without contours")
+    parser.add_argument('--encoder', choices=['null','ffmpeg'], default='null', help="discard frames or encode them with ffmpeg")
+    parser.add_argument('--output', default=None, help="json file to write the suite results to")
+    parser.add_argument('--out-of-core', action='store_true', help="compare reading the cube in memory and out of core with dask")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD','NEW'), help="compare two json result files of the suite")
+    parser.add_argument('--startup', action='store_true', help="time the import and the first frame of fresh interpreters")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+    elif args.startup:
+        case = benchmark_startup(nx=args.size[0], ny=args.size[1], nchan=args.nchan, renderer=args.renderers[0], directory=args.directory, output=args.output)
+        # fail when the import became eager or a GUI backend is probed
+        sys.exit(1 if case['on_import'] or case['gui'] else 0)
+    elif args.out_of_core:
+        benchmark_out_of_core(nx=args.size[0], ny=args.size[1], nchan=args.nchan, directory=args.directory)
+    elif args.suite:
+        benchmark_suite(sizes=args.sizes, nchans=args.nchans, contours=[False] if args.no_contours else [False,True],
+                        renderers=args.renderers, encoder=args.encoder, directory=args.directory, output=args.output)
+    else:
+        benchmark_workers(args.workers, nx=args.size[0], ny=args.size[1], nchan=args.nchan, directory=args.directory)
+
+
+####################################################################################################
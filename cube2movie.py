@@ -2,15 +2,26 @@
 # wrapper function for convenient use
 ####################################################################################################
 
-__all__ = ["cube2movie"]
+__all__ = ["cube2movie", "cube2movie_async"]
 
 def cube2movie(cube,
     channels         = [],
+    binning          = 1,
+    bin_mode         = 'mean',
+    spectral_grid    = None,
+    velocity_convention = 'radio',
+    cutout           = None,
     # figure options
     figsize          = (8,8),
     vmin             = None,
     vmax             = None,
     percentiles      = [0.25, 99.75],
+    percentile_method   = 'exact',
+    percentile_sample   = 1.,
+    percentile_sampling = 'stride',
+    percentile_cache    = True,
+    scaling          = 'global',
+    scaling_window   = 1,
     cmap             = 'RdBu_r',
     imshow_kwargs    = {},
     xlabel           = 'auto',
@@ -18,39 +29,95 @@ def cube2movie(cube,
     # contour options
     contourlevels    = [],
     contour_kwargs   = {},
+    contour_workers  = 2,
+    contour_cache    = False,
+    overlays         = [],
     # channel label options
     decimals         = 1,
     channelunit      = 'auto',
     channel_kwargs   = {},
+    usetex           = True,
     # colorbar
     show_cbar        = True,
     cbarlabel        = 'auto',
     cbar_kwargs      = {'fraction': 0.042, 'pad': 0.04},
     # movie options
     out              = 'movie.mp4',
+    outputs          = None,
     fps              = 2,
     dpi              = 300,
     bitrate          = 2500,
     codec            = 'h264',
+    writer           = 'pipe',
+    queue_depth      = 8,
     movie_kwargs     = {},
+    workers          = 1,
+    frame_cache      = None,
+    frame_cache_bytes = 4*2**30,
     # preview options
     preview_movie    = False,
+    preview_buffer   = 16,
     repeat           = False,
-    animation_kwargs = {}
+    animation_kwargs = {},
+    # rendering options
+    renderer         = 'full',
+    downsample       = 'auto',
+    downsample_mode  = 'mean',
+    cache_bytes      = 256*2**20,
+    readahead        = 4,
+    out_of_core      = False,
+    chunk_bytes      = 64*2**20,
+    memory_budget    = None,
+    # instrumentation
+    hooks            = [],
+    trace            = None,
+    trace_format     = 'chrome',
+    profile          = None
     ):
     """Quickly (or rather easily) Generate movies from image cubes.
 
     Parameters
     ----------
     cube : str, spectral_cube.SpectralCube, astropy.io.fits.hdu.hdulist.HDUList,
-           astropy.io.fits.hdu.image.PrimaryHDU
-        The input cube to visualize.
-    channels: list
-        The channels to plot in the movie. This currently supports only lists of channel numbers.
-        An empty list defaults to all channels in the cube.
-        TODO: allow seletion by velocity/frequency and resampling of the cube (e.g. sum/average
-        channels to get fewer frames in the movie).
+           astropy.io.fits.hdu.image.PrimaryHDU, zarr array or group, h5py dataset or group
+        The input cube to visualize. Files can be fits, CASA images, Zarr stores or HDF5 files.
+        CASA images, Zarr and HDF5 are read straight from their chunks and always out of core (see
+        out_of_core). For Zarr and HDF5, the first array with three or more axes is shown, one
+        called 'data' preferred, and the WCS is taken from its attributes: the FITS header as
+        string in 'header' or the FITS keywords (CTYPE1, ..., BUNIT) as single attributes. Other
+        formats can be added with formats.register_format. Use file names with workers > 1.
+    channels: list or tuple
+        The channels to plot in the movie. Either a list of channel numbers, or a range of
+        velocities/frequencies as a tuple of astropy quantities, e.g. (-50*u.km/u.s, 50*u.km/u.s),
+        or a list of such ranges. Velocities and frequencies are converted into each other with the
+        rest frequency of the cube. An empty list defaults to all channels in the cube.
         Default: []
+    binning : int
+        Combine this many consecutive selected channels into one frame to get fewer frames in the
+        movie. The channel label then shows the bin centre and width. Planes are combined as they
+        are read, so this works for cubes larger than memory.
+        Default: 1
+    bin_mode : str
+        How channels are combined into a bin: 'mean', 'sum' or 'max'.
+        Default: 'mean'
+    spectral_grid : astropy.units.Quantity
+        Resample the selected channels onto this spectral grid (velocities or frequencies), e.g.
+        np.arange(-50,51,2)*u.km/u.s. A grid channel wider than the channels of the cube is the
+        mean of the channels it covers, a narrower one is interpolated linearly between
+        neighbouring channels. Overrides binning. Grid values outside of the selected channels
+        are dropped.
+        Default: None
+    velocity_convention : str
+        Velocity convention ('radio', 'optical' or 'relativistic') used when channels or
+        spectral_grid are given as velocities for a frequency cube.
+        Default: 'radio'
+    cutout : tuple
+        Show only a region of the cube. Either a pixel box given by the bottom left and top right
+        corners ((x0,y0),(x1,y1)) (inclusive, zero-based), two astropy SkyCoord corners (blc,trc)
+        or a SkyCoord centre and an angular size (centre, size) where size is a Quantity or a
+        (width,height) tuple of Quantities. Only the cutout is read from disk and drawn, so a small
+        region of a large mosaic renders as fast as a small cube. None shows the full field.
+        Default: None
 
     figsize : tuple
         Size of the figure to show the channels in inches. If you find the movie to be blurry and
@@ -65,6 +132,38 @@ def cube2movie(cube,
         Percentiles to automatically determine vmin and vmax from. To apply the percentiles, both
         vmin and vmax must be set to their default "None".
         Default: [0.25, 99.75]
+    percentile_method : str
+        How to determine the percentiles. 'exact' uses SpectralCube.percentile which needs the
+        full cube in memory and sorts it. 'stream' reads the cube once in chunks and collects the
+        values in a histogram to estimate all percentiles from. The histogram is logarithmic for
+        values far outside the range of the first channels read, so that a few extreme outliers do
+        not coarsen it. The estimate is accurate to one histogram bin, which is printed.
+        Default: 'exact'
+    percentile_sample : float
+        Fraction of the cube to use for percentile_method='stream'. Values below 1 speed up the
+        estimate for very large cubes. For percentile_sampling='random', the resulting
+        uncertainty is printed.
+        Default: 1.
+    percentile_sampling : str
+        How to sample the cube for percentile_sample<1: 'stride' reads only every n-th channel,
+        'random' reads all channels but uses a random subset of the pixels.
+        Default: 'stride'
+    percentile_cache : bool
+        Store the histogram of percentile_method='stream' next to the input fits file as
+        '<file>.percentiles.npz' and reuse it as long as the file does not change (same path,
+        modification time and size), so that repeated renders of the same cube start instantly.
+        Default: True
+    scaling : str
+        'global' scales all channels from vmin to vmax. 'channel' scales every channel from the
+        percentiles of its own plane, so that faint channels are not drowned by the brightest one.
+        A given vmin or vmax then fixes that end of the range for all channels (e.g. vmin=0). The
+        ranges of all channels are computed in one pass (the planes of a chunk at once, on every
+        n-th pixel for percentile_sample=1/n) and the colorbar follows them from frame to frame.
+        Default: 'global'
+    scaling_window : int
+        With scaling='channel', smooth the ranges of the channels by a running median over this
+        many frames, so that the scaling does not jump between neighbouring channels.
+        Default: 1
     cmap : str
         Name of the matplotlib colormap to use.
         Default: 'RdBu_r'
@@ -80,8 +179,29 @@ def cube2movie(cube,
         contours.
         Default: []
     contour_kwargs : dict
-        Potential keyword arguments to be passed to ax.contour to draw the contours.
+        Potential keyword arguments to be passed to ax.contour to draw the contours: corner_mask,
+        algorithm and nchunk to trace the lines, colors, linewidths, linestyles,
+        negative_linestyles, alpha, zorder and antialiased to style them. Other keywords raise a
+        ValueError.
         Default: {}
+    contour_workers : int
+        Number of threads that compute the contour lines of the upcoming channels while the
+        current frame is drawn. The lines of each frame are shown by updating a single line
+        collection instead of calling ax.contour for every channel. 0 computes the lines when a
+        frame is drawn.
+        Default: 2
+    contour_cache : bool
+        Store the contour lines of a fits cube next to the file ('<file>.contours.npz') and reuse
+        them in later runs with the same file, cutout and contour levels.
+        Default: False
+    overlays : list
+        Static layers drawn on top of every frame, from cube2movie.Overlays: MomentContours
+        (contours of the moment 0 or peak intensity map of the cube, computed in one chunked pass),
+        ImageContours (contours of another image), BeamEllipse and Markers (SkyCoord positions).
+        Each layer is computed once; with renderer='blit' or 'numpy' it is part of the cached
+        foreground and adds no drawing per frame.
+        Example: [MomentContours([0.25, 0.5, 0.75], relative=True), BeamEllipse()]
+        Default: []
 
     decimals : int
         Number of decimal places to round the channel velocity/frequency to. Negative numbers are
@@ -95,6 +215,11 @@ def cube2movie(cube,
     channel_kwargs : dict
         Potential keyword arguments to be passed to ax.text to print the channel information.
         Default: {}
+    usetex : bool
+        Render all text with LaTeX (True) or with matplotlib's mathtext (False, no LaTeX
+        installation needed). The channel labels of all frames are rendered once before the first
+        frame with renderer='blit' or 'numpy', so LaTeX only adds to the setup time.
+        Default: True
 
     show_cbar : bool
         Show a static colorbar.
@@ -116,6 +241,18 @@ def cube2movie(cube,
     out : str
         File name to save to movie to. Existing files are overwritten!
         Default: 'movie.mp4'
+    outputs : list
+        Write several outputs in a single pass instead of out, e.g. for the web, a README and a
+        paper. Every frame is rendered once and encoded for all outputs concurrently. An output is
+        a file name or a dictionary with 'out' and optionally 'codec', 'bitrate', 'scale' (factor
+        of the frame size, e.g. 0.5), 'extra_args' (ffmpeg arguments) and 'encoder'. The codec is
+        chosen by the extension for .webm (VP9), .gif and .png and defaults to codec otherwise. A
+        file name with a counter like 'frames/%04d.png' writes a sequence of images. .gif and
+        .apng are written with a single global palette built from the colormap, so that frames do
+        not have to be quantized one by one ('encoder': 'palette'); set 'encoder': 'ffmpeg' to
+        encode them with ffmpeg instead. Requires writer='pipe' and workers=1.
+        Example: ['movie.mp4', {'out': 'web.webm', 'scale': 0.5}, {'out': 'readme.gif', 'scale': 0.25}, 'frames/%04d.png']
+        Default: None
     fps : int
         Speed of the movie given by the frames per second. To follow complex datasets a low frame
         rate <10 works well. In the case of many but narrow channels, a higher rate may be better.
@@ -136,49 +273,172 @@ def cube2movie(cube,
         codecs are supported on your system, run 'ffmpeg -formats' and 'ffmpeg -codecs' from the
         command line.
         Default" 'h264'
+    writer : str
+        How to write the movie. 'pipe' draws each frame directly and streams the raw pixel buffer
+        to an ffmpeg subprocess on a background thread, so that drawing and encoding overlap. Any
+        other value is passed as the writer to matplotlib.animation.FuncAnimation.save, e.g.
+        'ffmpeg' for matplotlib's own ffmpeg writer.
+        Default: 'pipe'
+    queue_depth : int
+        Number of frames that can be waiting for the encoder with writer='pipe'. Rendering pauses
+        when the queue is full. A deeper queue smooths out variations in the drawing and encoding
+        time per frame at the cost of one frame buffer in memory per queued frame.
+        Default: 8
     movie_kwargs : dict
         Potential keyword arguments to be passed to matplotlib.animation.FuncAnimation.save when
-        writing the movie to disk.
+        writing the movie to disk. With writer='pipe', only 'extra_args' (a list of additional
+        ffmpeg output arguments) is used.
         Default: {}
+    workers : int
+        Number of worker processes to render the movie with. For more than one worker, the
+        channels are split into contiguous segments that are rendered and encoded in parallel, each
+        in its own process with its own figure. The segments are then joined without re-encoding
+        (requires ffmpeg and a container that supports concatenation, e.g. mp4). A cube that is not
+        given as a file is written to a temporary fits file next to the movie, which the workers
+        read memory-mapped. Parallel rendering cannot be combined with preview_movie.
+        Default: 1
+    frame_cache : str
+        Directory to keep the rendered frames in. Frames are stored under a hash of their channel
+        data (for a fits file: its path, modification time and size) and of all settings that
+        change their pixels, so a re-run with a different fps,
+        codec, bitrate or channel selection only draws the frames that actually changed. The
+        frames are stored as raw RGBA pixels with zlib compression, not encoded, so all frames are
+        encoded again. An interrupted render resumes from the stored frames.
+        Only used with writer='pipe'. None disables the cache.
+        Default: None
+    frame_cache_bytes : int
+        Maximum size of the frame cache on disk in bytes. The least recently used frames are
+        deleted beyond that.
+        Default: 4*2**30 (4 GB)
 
     preview_movie : bool
-        Show a preview of the movie within an interactive matplotlib window. This preview might
-        stutter and temporarily slow down python interpreter or even make it become unresponsive
-        for large datasets.
+        Show a preview of the movie within an interactive matplotlib window. The frames are
+        rasterized ahead of time in the background and shown at the movie fps. If rasterizing
+        falls behind, frames are dropped instead of slowing down the preview or the interpreter.
+        Click into the window or press the space bar to stop and restart the preview. The preview
+        starts with the first frame of the movie while it is saved (with writer='pipe', otherwise
+        after saving) and cube2movie returns when the movie is saved, while the preview plays on.
         Default: False
+    preview_buffer : int
+        Number of frames the preview buffers ahead, from the movie while it is saved and
+        rasterized afterwards.
+        Default: 16
     repeat : bool
-        Repeat the preview or let it stop after playing once. Letting the animation run indefinetely
-        amplifies the slow down/unresponsiveness caused by the preview.
+        Repeat the preview or let it stop after playing once.
         Default: False
     animation_kwargs : dict
         Potential keyword arguments to be passed to animation.FuncAnimation() when annimating the
         image channels for a movie.
         Default: {}
 
+    renderer : str
+        How the frames are drawn. 'full' redraws the entire figure for every frame. 'blit' renders
+        the static parts of the figure (axes, coordinate grid, colorbar, labels) only once and
+        draws just the map, the contours and the channel label on top of this cached background
+        for every frame. This is much faster and also keeps the layout identical for all frames,
+        including the first one. 'numpy' additionally bypasses matplotlib for the map: the channel
+        planes are resampled to screen pixels and colorized with a lookup table of the colormap
+        in numpy, in batches of channels, and composited into the pre-rendered figure. This is
+        meant for large batch jobs and reaches far higher frame rates. The map is identical to
+        imshow with interpolation='nearest', which the numpy renderer always uses. Contours and
+        imshow_kwargs other than aspect and interpolation='nearest' are not supported by the numpy
+        renderer; with them, 'blit' is used instead.
+        Default: 'full'
+    downsample : str, int or bool
+        Reduce the channel maps by blocks of pixels before they are shown, so that no time is spent
+        on data pixels that are smaller than a pixel of the movie. 'auto' picks the largest block
+        size that keeps at least one data pixel per movie pixel, an integer sets the block size and
+        False always shows the full resolution. The planes are reduced when they are read, in
+        batches, before they reach matplotlib. Contours are traced on the reduced planes.
+        Default: 'auto'
+    downsample_mode : str
+        How the pixels of a block are combined: 'mean' or 'max' (keeps point sources visible).
+        Default: 'mean'
+    cache_bytes : int
+        Memory budget in bytes for the cache of channel planes. Channels are read from a memory
+        mapped fits file where possible and kept in a least-recently-used cache, so memory use
+        stays bounded also for cubes much larger than the available memory.
+        Default: 256*2**20 (256 MB)
+    readahead : int
+        Number of upcoming channels to read in the background while the current frame is drawn.
+        0 disables reading ahead.
+        Default: 4
+    out_of_core : bool
+        Open the cube with the dask backend of spectral_cube and read, bin and reduce it chunk by
+        chunk, each chunk holding whole channel planes. Memory use is bounded by a few chunks plus
+        the plane cache, for cubes of any size and in any format that spectral_cube reads with dask.
+        The percentiles are estimated in a streaming pass (see percentile_method) as the exact
+        percentile requires the whole cube in memory.
+        Default: False
+    chunk_bytes : int
+        Size in bytes of the chunks the cube is read in out of core. The chunks are aligned with
+        the chunks of the file if they already hold whole planes.
+        Default: 64*2**20 (64 MB)
+    memory_budget : int
+        Upper limit in bytes for the memory of the render. The cube is read out of core if the
+        file takes more than a quarter of the budget, and the plane cache, the chunks read out of
+        core, the batches of the numpy renderer, the frames queued for the encoders and the preview
+        are reduced to fit what is left; the exact percentile is replaced by the streamed estimate
+        and contour lines are released once drawn (unless contour_cache is set). With several
+        workers, the budget is shared by all processes and fewer workers are used if necessary.
+        The peak memory is printed at the end. Without a budget, the settings are used as given.
+        Default: None
+
+    hooks : list
+        Callables that receive a timing event (a dictionary with name, category, start, duration,
+        thread and args) for every stage (load_cube, set_range, set_up_plot, save_movie) and for
+        every step of every frame (fetch of the data, contour, draw, encode). A 'frame' event at
+        the end of every frame also reports the bytes read so far and the peak memory. Without
+        hooks or trace, no timing is done at all. Only the main process is instrumented when
+        rendering with several workers.
+        Default: []
+    trace : str
+        Collect all events and write them to this file. A summary per stage is printed at the end.
+        Default: None
+    trace_format : str
+        Format of the trace file: 'chrome' (Chrome trace, viewable in chrome://tracing or
+        https://ui.perfetto.dev) or 'json' (list of events plus summary).
+        Default: 'chrome'
+    profile : str
+        Run the frame loop of save_movie under cProfile and store the statistics in this file.
+        Default: None
+
+    Returns
+    -------
+    list
+        The movie files written.
+
 
     NOTE: cube2movie temporarily disables the interactive mode of matplotlib to significantly
     speed up rendering. interactive sessions are restored to interactive mode after rendering has
-    finished.
+    finished, or with preview_movie when the preview has finished or its window is closed.
 
     NOTE: cube2movie supresses specific warnings from SpectralCube and ax.contour because they
     can be repeated for each channel spamming the terminal and causing extensive slow-downs. These
     warnings can be re-enabled by running cube2movie.restore_warnings('all').
 
-    NOTE: The first frame is always not correctly set up but from the second frame on everythings
-    works just fine. This has something to do with tight_layout which is required to remove extensive
-    whitespace.
+    NOTE: With renderer='full', the first frame is always not correctly set up but from the second
+    frame on everythings works just fine. This has something to do with tight_layout which is
+    required to remove extensive whitespace. Use renderer='blit' to avoid this.
     """
 
     from .CubeToMovie import CubeToMovie
+    from .Instrumentation import TraceCollector
 
-    cubemovie = CubeToMovie(cube)
-    cubemovie.prepare_environment()
+    collector = TraceCollector() if trace is not None else None
+    cubemovie = CubeToMovie(cube, cutout=cutout, hooks=list(hooks)+([collector] if collector else []), out_of_core=out_of_core, memory_budget=memory_budget)
 
     # set figure properties
     cubemovie.figsize          = figsize
     cubemovie.vmin             = vmin
     cubemovie.vmax             = vmax
     cubemovie.percentiles      = percentiles
+    cubemovie.percentile_method   = percentile_method
+    cubemovie.percentile_sample   = percentile_sample
+    cubemovie.percentile_sampling = percentile_sampling
+    cubemovie.percentile_cache    = percentile_cache
+    cubemovie.scaling          = scaling
+    cubemovie.scaling_window   = scaling_window
     cubemovie.cmap             = cmap
     cubemovie.imshow_kwargs    = imshow_kwargs
     cubemovie.xlabel           = xlabel
@@ -196,31 +456,107 @@ def cube2movie(cube,
     # contour options
     cubemovie.contourlevels    = contourlevels
     cubemovie.contour_kwargs   = contour_kwargs
+    cubemovie.contour_workers  = contour_workers
+    cubemovie.contour_cache    = contour_cache
+    cubemovie.overlays         = overlays
 
     # channel label options
     cubemovie.decimals         = decimals
     cubemovie.channelunit      = channelunit
     cubemovie.channel_kwargs   = channel_kwargs
+    cubemovie.usetex           = usetex
 
     # movie options
     cubemovie.out              = out
+    cubemovie.outputs          = outputs
     cubemovie.fps              = fps
     cubemovie.dpi              = dpi
     cubemovie.bitrate          = bitrate
     cubemovie.codec            = codec
+    cubemovie.writer           = writer
+    cubemovie.queue_depth      = queue_depth
     cubemovie.movie_kwargs     = movie_kwargs
+    cubemovie.workers          = workers
+    cubemovie.frame_cache      = frame_cache
+    cubemovie.frame_cache_bytes = frame_cache_bytes
 
     # preview options
     cubemovie.preview_movie    = preview_movie
+    cubemovie.preview_buffer   = preview_buffer
     cubemovie.repeat           = repeat
     cubemovie.animation_kwargs = animation_kwargs
 
-    cubemovie.select_channels(channels)
-    cubemovie.set_range()
-    cubemovie.set_up_plot()
-    cubemovie.animate()
-    cubemovie.save_movie()
-    cubemovie.restore_environment()
+    # rendering options
+    cubemovie.renderer         = renderer
+    cubemovie.downsample       = downsample
+    cubemovie.downsample_mode  = downsample_mode
+    cubemovie.cache_bytes      = cache_bytes
+    cubemovie.readahead        = readahead
+    cubemovie.chunk_bytes      = chunk_bytes
+
+    # instrumentation
+    cubemovie.profile          = profile
+
+    # channel selection
+    cubemovie.binning          = binning
+    cubemovie.bin_mode         = bin_mode
+    cubemovie.spectral_grid    = spectral_grid
+    cubemovie.velocity_convention = velocity_convention
+
+    # after all settings: the environment depends on usetex and preview_movie
+    cubemovie.prepare_environment()
+    previewing = False
+    try:
+        cubemovie.select_channels(channels)
+        cubemovie.apply_memory_budget()
+        cubemovie.set_range()
+        if cubemovie.preview_movie:
+            cubemovie.set_up_plot()
+            cubemovie.save_with_preview()
+            # the preview restores the environment when it is over
+            previewing = True
+        elif cubemovie.workers > 1:
+            cubemovie.render_parallel()
+        else:
+            cubemovie.set_up_plot()
+            cubemovie.animate()
+            cubemovie.save_movie()
+    finally:
+        # also after an error or a cancelled render
+        if not previewing:
+            cubemovie.restore_environment()
+    if memory_budget is not None:
+        cubemovie.report_memory()
+
+    if collector is not None:
+        collector.print_summary()
+        collector.save(trace, format=trace_format)
+        print("Trace saved as "+trace)
+    return [spec['out'] for spec in cubemovie.output_specs()]
+
+
+def cube2movie_async(cube, **kwargs):
+    """Run cube2movie in a background process and return right away.
+
+    Takes the same arguments as cube2movie, which must be picklable (e.g. a file name rather than
+    an open cube; hooks are called in the background process). The render runs in a fresh
+    interpreter, so several renders can run at the same time without sharing the state of
+    matplotlib, and the calling interpreter (e.g. a Jupyter kernel) stays responsive. A preview
+    cannot be shown from the background.
+
+    Returns
+    -------
+    RenderHandle
+        Handle on the render with frames_done, frames_total, throughput and eta, result() (the
+        movie files written), cancel(), and awaitable in asyncio code (await handle). See
+        RenderHandle.
+    """
+
+    from .RenderHandle import RenderHandle
+
+    if kwargs.get('preview_movie', False):
+        raise ValueError("A preview cannot be shown by a render in the background. Use cube2movie for previews.")
+    return RenderHandle(cube, kwargs)
 
 
 ####################################################################################################
@@ -0,0 +1,228 @@
+####################################################################################################
+# reader backends for cubes stored as CASA images, Zarr or HDF5
+####################################################################################################
+
+__all__ = ["register_format", "read_cube", "array_cube", "HDF5Chunks"]
+
+import os
+import re
+import zlib
+import weakref
+import numpy as np
+
+
+# (name, detect, load), tried in order
+formats = []
+
+def register_format(name, detect, load):
+    """
+    Add a reader backend for a storage format. detect(source) tells whether the backend reads
+    source (a path or an object), load(source) returns a DaskSpectralCube (or another spectral_cube
+    cube backed by dask) whose chunks follow the chunks of the stored data. Such cubes are read chunk
+    by chunk (see readers.DaskReader), the chunks of a read are fetched and decompressed in
+    parallel by the threads of dask. Backends registered later are tried first.
+    """
+    formats.insert(0, (name, detect, load))
+
+
+def read_cube(source):
+    """
+    Load source with the first registered backend that detects it, or return None.
+    """
+    for name, detect, load in formats:
+        if detect(source):
+            print("Reading "+name+" cube ...")
+            return load(source)
+    return None
+
+
+def array_header(attrs):
+    """
+    FITS header of an array from its attributes: either the whole header as string in the
+    attribute 'header', or the FITS keywords (CTYPE1, CRVAL1, ..., BUNIT) as single attributes.
+    """
+    from astropy.io import fits
+
+    if 'header' in attrs:
+        header = attrs['header']
+        header = header.decode() if isinstance(header, bytes) else str(header)
+        return fits.Header.fromstring(header, sep='\n' if '\n' in header else '')
+    header = fits.Header()
+    for key, value in attrs.items():
+        if re.fullmatch('[A-Za-z0-9_-]{1,8}', key) and isinstance(value, (str, bytes, bool, int, float, np.generic)):
+            value = value.decode() if isinstance(value, bytes) else value
+            header[key.upper()] = value.item() if isinstance(value, np.generic) else value
+    return header
+
+
+def array_cube(array, attrs, chunks=None):
+    """
+    Wrap a chunked array (e.g. a zarr array, a h5py dataset or HDF5Chunks) in a DaskSpectralCube.
+    The WCS and unit are taken from the FITS header in attrs (see array_header). Degenerate axes
+    in front of the spectral axis (e.g. Stokes) are dropped.
+    """
+    import dask.array as da
+    from astropy.wcs import WCS
+    from spectral_cube import DaskSpectralCube
+
+    header = array_header(attrs)
+    if 'CTYPE3' not in header:
+        raise ValueError("No WCS found for the array. Store the FITS header of the cube as attribute 'header' or its keywords as attributes.")
+    wcs = WCS(header)
+    if chunks is None:
+        chunks = array.chunks or (1,)+tuple(array.shape[1:])
+    data = da.from_array(array, chunks=chunks)
+    while data.ndim > 3 and data.shape[0] == 1:
+        data = data[0]
+        wcs = wcs.dropaxis(wcs.naxis-1)
+    return DaskSpectralCube(data, wcs, meta={'BUNIT': header.get('BUNIT', '')}, header=header)
+
+
+def find_array(group):
+    """
+    The first array with at least three axes in a zarr or HDF5 group and its subgroups. An array
+    called 'data' is preferred.
+    """
+    for name in sorted(group.keys(), key=lambda name: name != 'data'):
+        node = group[name]
+        if hasattr(node, 'keys'):
+            node = find_array(node)
+        if node is not None and len(getattr(node, 'shape', ())) >= 3:
+            return node
+    return None
+
+
+####################################################################################################
+# CASA images
+
+def is_casa(source):
+    return isinstance(source, str) and os.path.isfile(os.path.join(source, 'table.dat'))
+
+def load_casa(source):
+    from spectral_cube import SpectralCube
+    # read by casa_formats_io straight from the tiles of the image, no casatools needed
+    return SpectralCube.read(source, format='casa_image', use_dask=True)
+
+
+####################################################################################################
+# Zarr
+
+def is_zarr(source):
+    if isinstance(source, str):
+        return os.path.isdir(source) and (source.rstrip('/').endswith('.zarr')
+                                          or any(os.path.exists(os.path.join(source, name)) for name in ['zarr.json', '.zarray', '.zgroup']))
+    return type(source).__module__.startswith('zarr')
+
+def load_zarr(source):
+    import zarr
+
+    node = zarr.open(source, mode='r') if isinstance(source, str) else source
+    array = node if hasattr(node, 'shape') else find_array(node)
+    if array is None:
+        raise ValueError("No array with three or more axes found in "+str(source)+".")
+    attrs = dict(node.attrs) if node is not array else {}
+    attrs.update(array.attrs)
+    return array_cube(array, attrs)
+
+
+####################################################################################################
+# HDF5
+
+class HDF5Chunks:
+    """
+    Array-like access to a chunked HDF5 dataset for dask. The stored chunks are read as they are
+    and decompressed here (deflate, shuffle and fletcher32 filters), so that dask can decompress
+    several chunks in parallel threads: h5py serializes all calls into the HDF5 library, reading
+    through it would decompress one chunk at a time. Reads that are not a single chunk, chunks
+    with other filters or chunks that were never written are read through h5py.
+    A file opened for the dataset (file) is closed with close, or when the chunks (i.e. the cube
+    read from them) are no longer used.
+    """
+
+    def __init__(self, dataset, file=None):
+        from h5py import h5z
+
+        self.dataset = dataset
+        self.file = file
+        self.finalizer = weakref.finalize(self, file.close) if file is not None else None
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+        self.ndim = dataset.ndim
+        self.chunks = dataset.chunks
+        plist = dataset.id.get_create_plist()
+        self.filters = [plist.get_filter(i)[0] for i in range(plist.get_nfilters())]
+        self.direct = self.chunks is not None and set(self.filters) <= {h5z.FILTER_DEFLATE, h5z.FILTER_SHUFFLE, h5z.FILTER_FLETCHER32}
+
+
+    def close(self):
+        if self.finalizer is not None:
+            self.finalizer()
+
+
+    def decode(self, raw):
+        """
+        Undo the filters of a stored chunk, in reverse order.
+        """
+        from h5py import h5z
+
+        for code in reversed(self.filters):
+            if code == h5z.FILTER_FLETCHER32:
+                raw = raw[:-4]
+            elif code == h5z.FILTER_DEFLATE:
+                raw = zlib.decompress(raw)
+            elif code == h5z.FILTER_SHUFFLE:
+                raw = np.frombuffer(raw, dtype=np.uint8).reshape(self.dtype.itemsize, -1).T.tobytes()
+        return raw
+
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if not self.direct or len(key) != self.ndim or not all(isinstance(k, slice) for k in key):
+            return self.dataset[key]
+        ranges = [k.indices(n) for k,n in zip(key, self.shape)]
+        if any(step != 1 or start%size != 0 or not 0 < stop-start <= size for (start,stop,step),size in zip(ranges, self.chunks)):
+            return self.dataset[key]
+        try:
+            mask, raw = self.dataset.id.read_direct_chunk(tuple(start for start,stop,step in ranges))
+        except (OSError, KeyError, ValueError):
+            return self.dataset[key]
+        if mask != 0:
+            # some filters were skipped for this chunk
+            return self.dataset[key]
+        chunk = np.frombuffer(self.decode(raw), dtype=self.dtype).reshape(self.chunks)
+        return chunk[tuple(slice(0, stop-start) for start,stop,step in ranges)]
+
+
+def is_hdf5(source):
+    if isinstance(source, str):
+        if not os.path.isfile(source):
+            return False
+        try:
+            import h5py
+        except ImportError:
+            return source.lower().endswith(('.h5', '.hdf5', '.hdf', '.he5'))
+        return h5py.is_hdf5(source)
+    return type(source).__module__.startswith('h5py')
+
+def load_hdf5(source):
+    import h5py
+
+    node = h5py.File(source, 'r') if isinstance(source, str) else source
+    dataset = node if isinstance(node, h5py.Dataset) else find_array(node)
+    if dataset is None:
+        if isinstance(source, str):
+            node.close()
+        raise ValueError("No dataset with three or more axes found in "+str(source)+".")
+    attrs = dict(node.attrs) if node is not dataset else {}
+    attrs.update(dataset.attrs)
+    # a file opened here stays open as long as the cube reads from it
+    chunks = HDF5Chunks(dataset, file=node if isinstance(source, str) else None)
+    return array_cube(chunks, attrs, chunks=dataset.chunks or (1,)+dataset.shape[1:])
+
+
+register_format('HDF5', is_hdf5, load_hdf5)
+register_format('Zarr', is_zarr, load_zarr)
+register_format('CASA', is_casa, load_casa)
+
+
+####################################################################################################
@@ -0,0 +1,232 @@
+####################################################################################################
+# readers for channel planes
+####################################################################################################
+
+__all__ = ["CubeReader", "FITSReader", "BinnedReader", "DownsampledReader", "DaskReader", "get_reader"]
+
+import threading
+import collections
+import numpy as np
+
+
+class CubeReader:
+    """
+    Read channel planes through a SpectralCube. The cube mask is applied (masked pixels are NaN).
+    """
+
+    def __init__(self, cube):
+        self.cube = cube
+        self.shape = cube.shape
+
+    def read(self, channels):
+        """
+        Read a channel plane (int) or a stack of channel planes (list of int).
+        """
+        return np.asarray(self.cube.filled_data[channels].value, dtype=np.float32)
+
+    def close(self):
+        pass
+
+
+class FITSReader:
+    """
+    Read channel planes directly from a memory-mapped fits file. Only the bytes of the requested
+    channels (and, for a cutout box (y0,y1,x0,x1), of the rows within the box) are touched on disk.
+    The cube is the first HDU with at least three axes, as the primary HDU may be empty.
+    """
+
+    def __init__(self, filename, shape, box=None):
+        from astropy.io import fits
+
+        self.hdulist = fits.open(filename, memmap=True)
+        hdu = cube_hdu(self.hdulist)
+        if hdu is None:
+            self.close()
+            raise ValueError("No HDU of "+filename+" holds a cube.")
+        self.data = self.hdulist[hdu].data
+        # drop degenerate (e.g. Stokes) axes in front of the spectral axis
+        while self.data.ndim > 3 and self.data.shape[0] == 1:
+            self.data = self.data[0]
+        if box is not None:
+            y0, y1, x0, x1 = box
+            self.data = self.data[:, y0:y1, x0:x1]
+        self.shape = self.data.shape
+        if self.shape != tuple(shape):
+            self.close()
+            raise ValueError("Data layout of "+filename+" does not match the cube.")
+
+    def read(self, channels):
+        """
+        Read a channel plane (int) or a stack of channel planes (list of int).
+        """
+        return np.asarray(self.data[channels], dtype=np.float32)
+
+    def close(self):
+        self.hdulist.close()
+
+
+class DaskReader:
+    """
+    Read channel planes chunk by chunk from a cube opened with the dask backend of spectral_cube.
+    The dask array is rechunked so that every chunk holds whole channel planes of at most
+    chunk_bytes (at least one plane). Existing chunks that already span whole planes are kept or
+    merged, so that chunk boundaries line up with the file layout. A plane is read together with
+    the rest of its chunk and the last keep chunks are held in memory, so reading the channels in
+    order reads every chunk once. The cube mask is applied (masked pixels are NaN).
+    """
+
+    def __init__(self, cube, chunk_bytes=64*2**20, keep=2):
+        # filled_data of a DaskSpectralCube is computed right away, the private method stays lazy
+        data = cube._get_filled_data(fill=np.nan)
+        nchan, ny, nx = data.shape
+        planes = max(1, chunk_bytes//(ny*nx*4))
+        if data.chunks[1] == (ny,) and data.chunks[2] == (nx,) and data.chunksize[0] <= planes:
+            planes = planes//data.chunksize[0]*data.chunksize[0]
+        data = data.rechunk((planes, -1, -1))
+        self.data = data
+        self.shape = data.shape
+        self.starts = np.cumsum((0,)+data.chunks[0])
+        self.keep = keep
+        self.kept = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def chunk(self, k):
+        """
+        Get chunk k as a float32 stack of planes.
+        """
+        with self.lock:
+            if k not in self.kept:
+                self.kept[k] = np.asarray(self.data[self.starts[k]:self.starts[k+1]].compute(), dtype=np.float32)
+                while len(self.kept) > self.keep:
+                    self.kept.popitem(last=False)
+            self.kept.move_to_end(k)
+            return self.kept[k]
+
+    def read(self, channels):
+        """
+        Read a channel plane (int) or a stack of channel planes (list of int).
+        """
+        if np.isscalar(channels):
+            k = np.searchsorted(self.starts, channels, side='right')-1
+            # a copy, so that cached planes do not hold on to the whole chunk
+            return self.chunk(k)[channels-self.starts[k]].copy()
+        channels = np.asarray(channels, dtype=np.intp)
+        chunks = np.searchsorted(self.starts, channels, side='right')-1
+        stack = np.empty((len(channels),)+self.shape[1:], dtype=np.float32)
+        for k in np.unique(chunks):
+            selected = chunks == k
+            stack[selected] = self.chunk(k)[channels[selected]-self.starts[k]]
+        return stack
+
+    def close(self):
+        self.kept.clear()
+
+
+class BinnedReader:
+    """
+    Combine the channel planes of another reader into bins. Each bin is a list of channels and
+    weights. mode='max' takes the maximum over the channels of a bin, any other mode the weighted
+    sum (e.g. weights 1 for a sum, 1/n for a mean or interpolation weights for resampling). Only
+    the channels of one bin are read at a time.
+    """
+
+    def __init__(self, reader, bins, mode='mean'):
+        self.reader = reader
+        self.bins = bins
+        self.mode = mode
+        self.shape = (len(bins),)+tuple(reader.shape[1:])
+
+    def read(self, channels):
+        """
+        Read a binned plane (int) or a stack of binned planes (list of int).
+        """
+        if not np.isscalar(channels):
+            return np.stack([self.read(channel) for channel in channels])
+        indices, weights = self.bins[channels]
+        planes = self.reader.read(list(indices))
+        if self.mode == 'max':
+            return planes.max(axis=0)
+        return np.tensordot(np.asarray(weights, dtype=np.float32), planes, axes=1)
+
+    def close(self):
+        self.reader.close()
+
+
+class DownsampledReader:
+    """
+    Reduce the channel planes of another reader by blocks of factor x factor pixels, taking the
+    mean or (mode='max') the maximum of each block. Pixels beyond the last full block are dropped.
+    Stacks of planes are reduced together, in batches of at most batch_bytes of input data.
+    """
+
+    def __init__(self, reader, factor, mode='mean', batch_bytes=64*2**20):
+        self.reader = reader
+        self.factor = factor
+        self.mode = mode
+        ny, nx = reader.shape[1:]
+        self.shape = (reader.shape[0], ny//factor, nx//factor)
+        self.batch_size = max(1, batch_bytes//(ny*nx*4))
+
+    def reduce(self, planes):
+        """
+        Reduce a stack of planes.
+        """
+        f = self.factor
+        n, ny, nx = len(planes), self.shape[1], self.shape[2]
+        blocks = planes[:, :ny*f, :nx*f].reshape(n, ny, f, nx, f)
+        if self.mode == 'max':
+            return blocks.max(axis=(2,4))
+        return blocks.mean(axis=(2,4), dtype=np.float32)
+
+    def read(self, channels):
+        """
+        Read a reduced plane (int) or a stack of reduced planes (list of int).
+        """
+        if np.isscalar(channels):
+            return self.reduce(self.reader.read([channels]))[0]
+        channels = list(channels)
+        return np.concatenate([self.reduce(self.reader.read(channels[start:start+self.batch_size]))
+                               for start in range(0, len(channels), self.batch_size)
+                              ])
+
+    def close(self):
+        self.reader.close()
+
+
+def cube_hdu(hdulist):
+    """
+    The index of the first HDU of a fits file with at least three axes, or None.
+    """
+    for i, hdu in enumerate(hdulist):
+        if hdu.is_image and hdu.header.get('NAXIS', 0) >= 3:
+            return i
+    return None
+
+
+def get_reader(source, cube, box=None, chunk_bytes=64*2**20):
+    """
+    Find the fastest way to read channel planes of the cube loaded from source. Cubes opened with
+    the dask backend (also CASA images, Zarr and HDF5, see formats) are read chunk by chunk
+    (chunk_bytes), plain fits files are memory-mapped, anything else is read through the
+    SpectralCube. box is the cutout (y0,y1,x0,x1) of the file that the cube was sliced to, if any.
+    """
+    from astropy.io import fits
+    from spectral_cube.dask_spectral_cube import DaskSpectralCubeMixin
+
+    if isinstance(cube, DaskSpectralCubeMixin):
+        return DaskReader(cube, chunk_bytes)
+    if isinstance(source, str) and source.lower().endswith(('.fits', '.fit', '.fts')):
+        with fits.open(source) as hdulist:
+            hdu = cube_hdu(hdulist)
+            header = fits.Header() if hdu is None else hdulist[hdu].header.copy()
+        unscaled = header.get('BSCALE', 1) == 1 and header.get('BZERO', 0) == 0 and 'BLANK' not in header
+        spectral = str(header.get('CTYPE3', '')).split('-')[0] in ['FREQ', 'VRAD', 'VOPT', 'VELO', 'ZOPT', 'WAVE', 'AWAV', 'BETA', 'FELO']
+        if unscaled and spectral:
+            try:
+                return FITSReader(source, cube.shape, box)
+            except ValueError:
+                pass
+    return CubeReader(cube)
+
+
+####################################################################################################
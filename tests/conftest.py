@@ -0,0 +1,91 @@
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+import pytest
+
+# make the package importable as cube2movie, also in spawned worker processes
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.basename(ROOT) == 'cube2movie':
+    LIB = os.path.dirname(ROOT)
+else:
+    LIB = tempfile.mkdtemp(prefix='cube2movie_tests_')
+    os.symlink(ROOT, os.path.join(LIB, 'cube2movie'))
+sys.path.insert(0, LIB)
+os.environ['PYTHONPATH'] = os.pathsep.join([LIB]+([os.environ['PYTHONPATH']] if 'PYTHONPATH' in os.environ else []))
+
+
+def pytest_unconfigure(config):
+    # the link is needed until the end of the session, as the test modules and spawned workers
+    # import the package through it
+    if LIB != os.path.dirname(ROOT):
+        shutil.rmtree(LIB, ignore_errors=True)
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="ffmpeg not installed")
+
+
+@pytest.fixture(scope='session')
+def cube_file(tmp_path_factory):
+    """
+    A small synthetic cube (48x48 pixels, 12 channels) as fits file.
+    """
+    from cube2movie.benchmark import synthetic_cube
+    return synthetic_cube(str(tmp_path_factory.mktemp('cubes')/'cube.fits'), nx=48, ny=48, nchan=12)
+
+
+@pytest.fixture
+def without_latex(tmp_path, monkeypatch):
+    """
+    A PATH with ffmpeg (if installed) but without latex.
+    """
+    bin_dir = tmp_path/'bin'
+    bin_dir.mkdir()
+    if shutil.which('ffmpeg'):
+        os.symlink(shutil.which('ffmpeg'), bin_dir/'ffmpeg')
+    monkeypatch.setenv('PATH', str(bin_dir))
+    assert shutil.which('latex') is None
+
+
+def make_movie(cube, **settings):
+    """
+    A CubeToMovie of cube set up for rendering without LaTeX, with further attributes from
+    settings. out_of_core is passed on to CubeToMovie, as it applies when loading the cube.
+    """
+    from cube2movie.CubeToMovie import CubeToMovie
+
+    cubemovie = CubeToMovie(cube, out_of_core=settings.pop('out_of_core', False))
+    cubemovie.usetex = False
+    cubemovie.figsize = (3,3)
+    cubemovie.dpi = 50
+    cubemovie.percentile_cache = False
+    for key, value in settings.items():
+        setattr(cubemovie, key, value)
+    cubemovie.prepare_environment()
+    return cubemovie
+
+
+def render(cube, channels=None, **settings):
+    """
+    Render the channels of cube and return the frames as array.
+    """
+    cubemovie = make_movie(cube, **settings)
+    try:
+        if channels is not None:
+            cubemovie.channels = list(channels)
+        cubemovie.set_range()
+        cubemovie.set_up_plot()
+        return np.array([np.array(frame) for frame in cubemovie.iter_frames()])
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+
+
+def read_movie(filename, width=150, height=150):
+    """
+    Decode a movie with ffmpeg and return its frames as RGB array.
+    """
+    import subprocess
+    raw = subprocess.run(['ffmpeg', '-loglevel', 'error', '-i', filename, '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'],
+                         check=True, capture_output=True).stdout
+    return np.frombuffer(raw, dtype=np.uint8).reshape(-1, height, width, 3)
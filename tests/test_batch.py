@@ -0,0 +1,81 @@
+import os
+import json
+import warnings
+import pytest
+
+from conftest import requires_ffmpeg, make_movie, render
+
+
+def test_read_manifest(tmp_path):
+    from cube2movie import batch
+
+    manifest = tmp_path/'manifest.json'
+    manifest.write_text(json.dumps({'defaults': {'fps': 5, 'usetex': False},
+                                    'jobs': ['a.fits', {'cube': 'b.fits', 'fps': 10, 'out': 'movies/b.gif'}]
+                                   }))
+    jobs = batch.read_manifest(str(manifest))
+    assert jobs == [{'cube': str(tmp_path/'a.fits'), 'out': str(tmp_path/'a.mp4'), 'fps': 5, 'usetex': False},
+                    {'cube': str(tmp_path/'b.fits'), 'out': str(tmp_path/'movies/b.gif'), 'fps': 10, 'usetex': False}]
+
+
+def test_estimate_cost(cube_file):
+    from cube2movie import batch
+
+    assert batch.estimate_cost({'cube': cube_file}) == 48*48*12
+    assert batch.estimate_cost({'cube': cube_file, 'channels': [0, 1, 2]}) == 48*48*3
+    assert batch.estimate_cost({'cube': cube_file+'.missing'}) == 0
+
+
+def test_warm_up_reports_failure(without_latex):
+    from cube2movie import batch
+
+    with pytest.warns(UserWarning, match="Warming up worker"):
+        batch._warm_up(usetex=True)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        batch._warm_up(usetex=False)
+    assert not [w for w in caught if "Warming up worker" in str(w.message)]
+
+
+@requires_ffmpeg
+def test_run_batch(cube_file, tmp_path, without_latex):
+    from cube2movie import batch
+
+    jobs = [{'cube': cube_file, 'out': str(tmp_path/'movie.mp4'), 'usetex': False, 'figsize': (3,3), 'dpi': 50, 'percentile_cache': False}]
+    summary = str(tmp_path/'summary.json')
+    results = batch.run_batch(jobs, workers=1, summary=summary)
+    assert [result['status'] for result in results] == ['ok']
+    assert os.path.getsize(jobs[0]['out']) > 0
+    assert os.path.exists(summary)
+
+
+def test_resolve_paths(tmp_path, monkeypatch):
+    from cube2movie import batch
+
+    monkeypatch.chdir(tmp_path)
+    job = batch.resolve_paths({'cube': 'a.fits', 'out': 'a.mp4', 'outputs': ['movies/a.gif', {'out': 'a.webm', 'scale': 0.5}]})
+    assert job == {'cube': str(tmp_path/'a.fits'), 'out': str(tmp_path/'a.mp4'),
+                   'outputs': [str(tmp_path/'movies/a.gif'), {'out': str(tmp_path/'a.webm'), 'scale': 0.5}]}
+
+
+def test_warm_figure_is_reused(cube_file, without_latex):
+    import importlib
+    import numpy as np
+    from cube2movie import batch
+    kept_figures = importlib.import_module('cube2movie.CubeToMovie')._kept_figures
+
+    fresh = render(cube_file, [0, 5])
+    batch._warm_up(usetex=False)
+    warm = kept_figures[-1]
+    cubemovie = make_movie(cube_file)
+    try:
+        cubemovie.channels = [0, 5]
+        cubemovie.set_range()
+        cubemovie.set_up_plot()
+        assert cubemovie.fig is warm
+        assert not kept_figures
+        reused = np.array([np.array(frame) for frame in cubemovie.iter_frames()])
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+    assert np.array_equal(fresh, reused)
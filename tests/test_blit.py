@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from conftest import render
+
+
+@pytest.mark.parametrize('settings', [{}, {'contourlevels': [0.3, 0.6]}, {'scaling': 'channel'}])
+def test_blitted_frames_match_full_frames(cube_file, settings):
+    blit = render(cube_file, renderer='blit', **settings)
+    full = render(cube_file, renderer='full', **settings)
+    # only the antialiased edges of the axes frame may differ, the map and label follow the channel
+    for channel in range(1, len(full)):
+        assert np.mean((blit[channel] != full[channel]).any(axis=2)) < 0.02
+        assert np.mean((blit[channel] != full[0]).any(axis=2)) > 0.05
+
+
+@pytest.mark.parametrize('settings', [{}, {'contourlevels': [0.3, 0.6]}, {'scaling': 'channel'}])
+def test_blitted_frames_do_not_depend_on_previous_frames(cube_file, settings):
+    frames = render(cube_file, renderer='blit', **settings)
+    assert np.array_equal(render(cube_file, channels=[5], renderer='blit', **settings)[0], frames[5])
+    assert np.array_equal(render(cube_file, channels=range(11,-1,-1), renderer='blit', **settings), frames[::-1])
+
+
+def test_blit_matches_first_full_frame(cube_file):
+    # the first frame of renderer='full' has the layout of the cached background
+    blit = render(cube_file, channels=[0], renderer='blit')[0]
+    full = render(cube_file, channels=[0], renderer='full')[0]
+    assert np.mean(blit != full) < 0.01
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from conftest import make_movie
+
+
+@pytest.fixture
+def cubemovie(cube_file):
+    cubemovie = make_movie(cube_file)
+    yield cubemovie
+    cubemovie.close_planes()
+    cubemovie.restore_environment()
+
+
+def planes(cubemovie):
+    return np.array([cubemovie.get_plane(channel) for channel in cubemovie.channels])
+
+
+def test_coarse_grid_averages_channels(cubemovie):
+    import astropy.units as u
+
+    data = cubemovie.cube.filled_data[:].value
+    # channels at -5...6 km/s, grid channels 3 km/s wide centred on -4, -1, 2 and 5 km/s
+    cubemovie.spectral_grid = np.array([-4, -1, 2, 5])*u.km/u.s
+    cubemovie.select_channels([])
+    expected = data.reshape(4, 3, *data.shape[1:]).mean(axis=1)
+    assert np.allclose(planes(cubemovie), expected, atol=1e-5)
+    assert np.allclose(cubemovie.channel_widths.to_value(u.km/u.s), 3)
+
+
+def test_fine_grid_interpolates(cubemovie):
+    import astropy.units as u
+
+    data = cubemovie.cube.filled_data[:].value
+    cubemovie.spectral_grid = np.arange(-4.5, 0.3, 0.25)*u.km/u.s
+    cubemovie.select_channels([])
+    expected = [(data[0]+data[1])/2, 0.75*data[5]+0.25*data[6]]
+    assert np.allclose(planes(cubemovie)[[0,-1]], expected, atol=1e-5)
+
+
+def test_grid_uses_selected_channels(cubemovie):
+    import astropy.units as u
+
+    data = cubemovie.cube.filled_data[:].value
+    cubemovie.spectral_grid = np.array([-4, -1, 2, 5])*u.km/u.s
+    with pytest.warns(UserWarning, match="Dropping 2 values"):
+        cubemovie.select_channels((-5*u.km/u.s, 0*u.km/u.s))
+    assert np.allclose(cubemovie.spectral_axis.value, [-4, -1])
+    # the grid channel at -1 km/s covers channels -2...0 km/s, of which only 0 km/s is selected
+    assert np.allclose(planes(cubemovie), [data[0:3].mean(axis=0), data[3:6].mean(axis=0)], atol=1e-5)
+
+
+def test_unknown_bin_mode(cubemovie):
+    cubemovie.binning = 3
+    cubemovie.bin_mode = 'maen'
+    with pytest.raises(ValueError, match='maen'):
+        cubemovie.select_channels([])
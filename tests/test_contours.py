@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from conftest import make_movie, render
+
+
+def planes(n=4, size=32):
+    y, x = np.mgrid[:size, :size]
+    return [np.exp(-((x-10-3*i)**2+(y-16)**2)/40.).astype(np.float32) for i in range(n)]
+
+
+def test_lines_match_contourpy():
+    import contourpy
+    from cube2movie.ContourEngine import ContourEngine
+
+    data = planes()
+    engine = ContourEngine([0.2, 0.5, 2.], data.__getitem__, workers=2)
+    engine.set_order(range(len(data)))
+    for channel, plane in enumerate(data):
+        segments, index = engine[channel]
+        # no lines at level 2
+        assert index.tolist() == [0, 1]
+        for segment, i in zip(segments, index):
+            lines = contourpy.contour_generator(z=plane, line_type='Separate').lines(engine.levels[i])
+            vertices = segment[np.isfinite(segment).all(axis=1)]
+            assert np.allclose(vertices, np.concatenate(lines), atol=1e-5)
+    engine.close()
+
+
+def test_options_are_passed_to_contourpy():
+    import contourpy
+    from cube2movie.ContourEngine import ContourEngine
+
+    plane = planes(1)[0]
+    # a masked pixel next to the contour line, which corner_mask=True cuts the corner around
+    plane[16,15] = np.nan
+    plane = np.ma.masked_invalid(plane)
+    lines = {}
+    for corner_mask in [True, False]:
+        engine = ContourEngine([0.5], [plane].__getitem__, workers=0, options={'corner_mask': corner_mask})
+        segment = engine[0][0][0]
+        lines[corner_mask] = segment[np.isfinite(segment).all(axis=1)]
+        expected = contourpy.contour_generator(z=plane, line_type='Separate', corner_mask=corner_mask).lines(0.5)
+        assert np.allclose(lines[corner_mask], np.concatenate(expected), atol=1e-5)
+    assert lines[True].shape != lines[False].shape or not np.allclose(lines[True], lines[False])
+
+
+def test_saved_lines(tmp_path):
+    from cube2movie.ContourEngine import ContourEngine
+
+    data = planes()
+    engine = ContourEngine([0.2, 0.5], data.__getitem__, workers=0)
+    engine.precompute(range(len(data)))
+    filename = str(tmp_path/'contours.npz')
+    engine.save(filename, size=32)
+
+    loaded = ContourEngine([0.2, 0.5], None, workers=0)
+    assert loaded.load(filename, size=32)
+    for channel in range(len(data)):
+        for a, b in zip(loaded[channel][0], engine[channel][0]):
+            assert np.array_equal(a, b, equal_nan=True)
+    assert not ContourEngine([0.3, 0.5], None, workers=0).load(filename, size=32)
+    assert not ContourEngine([0.2, 0.5], None, workers=0).load(filename, size=33)
+    assert not ContourEngine([0.2, 0.5], None, workers=0, options={'name': 'mpl2014'}).load(filename, size=32)
+
+
+def render_cached(cube, **settings):
+    """
+    Render with contour_cache and store the contours, as save_movie does.
+    """
+    cubemovie = make_movie(cube, renderer='blit', contourlevels=[0.3, 0.6], contour_cache=True, **settings)
+    try:
+        cubemovie.set_range()
+        cubemovie.set_up_plot()
+        frames = np.array([np.array(frame) for frame in cubemovie.iter_frames()])
+        cubemovie.save_contours()
+        return frames
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+
+
+def test_contour_cache_renders_same_frames(cube_file, tmp_path, capsys):
+    import shutil
+
+    cube = str(tmp_path/'cube.fits')
+    shutil.copy(cube_file, cube)
+    expected = render(cube, renderer='blit', contourlevels=[0.3, 0.6])
+    assert np.array_equal(render_cached(cube), expected)
+    assert (tmp_path/'cube.fits.contours.npz').exists()
+    assert np.array_equal(render_cached(cube), expected)
+    assert "Using cached contours" in capsys.readouterr().out
+
+
+def test_unsupported_contour_kwargs(cube_file):
+    with pytest.raises(ValueError, match='cmap'):
+        render(cube_file, channels=[0], renderer='blit', contourlevels=[0.3, 0.6], contour_kwargs={'cmap': 'viridis'})
+
+
+def test_contour_kwargs_change_the_lines(cube_file):
+    solid = render(cube_file, channels=[0,1], renderer='blit', contourlevels=[0.3, 0.6])
+    dashed = render(cube_file, channels=[0,1], renderer='blit', contourlevels=[0.3, 0.6], contour_kwargs={'linestyles': 'dashed'})
+    assert not np.array_equal(solid, dashed)
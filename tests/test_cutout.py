@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from conftest import make_movie
+
+
+@pytest.fixture
+def cubemovie(cube_file):
+    cubemovie = make_movie(cube_file)
+    yield cubemovie
+    cubemovie.close_planes()
+    cubemovie.restore_environment()
+
+
+def test_pixel_cutout_reads_box(cubemovie):
+    data = cubemovie.full_cube.filled_data[:].value
+    cubemovie.set_cutout(((10, 5), (29, 19)))
+    assert cubemovie.box == (5, 20, 10, 30)
+    assert cubemovie.cube.shape == (12, 15, 20)
+    cubemovie.select_channels([3])
+    assert np.array_equal(cubemovie.get_plane(3), data[3, 5:20, 10:30])
+
+
+def test_cutout_is_clipped(cubemovie):
+    cubemovie.set_cutout(((-5, 40), (60, 100)))
+    assert cubemovie.box == (40, 48, 0, 48)
+
+
+def test_sky_cutout(cubemovie):
+    import astropy.units as u
+
+    wcs = cubemovie.full_cube.wcs.celestial
+    centre = wcs.pixel_to_world(24, 24)
+    scale = abs(wcs.wcs.cdelt[0])*u.Unit(wcs.wcs.cunit[0])
+    cubemovie.set_cutout((centre, 10*scale))
+    y0, y1, x0, x1 = cubemovie.box
+    assert abs((x0+x1-1)/2-24) <= 1 and abs((y0+y1-1)/2-24) <= 1
+    assert 9 <= x1-x0 <= 11 and 9 <= y1-y0 <= 11
+
+    cubemovie.set_cutout(None)
+    assert cubemovie.box is None and cubemovie.cube.shape == (12, 48, 48)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from conftest import make_movie, render
+
+
+def test_downsampled_reader():
+    from cube2movie.readers import DownsampledReader
+
+    class Reader:
+        shape = (2, 7, 9)
+        data = np.arange(2*7*9, dtype=np.float32).reshape(shape)
+        def read(self, channels):
+            return self.data[channels]
+
+    mean = DownsampledReader(Reader(), 3)
+    assert mean.shape == (2, 2, 3)
+    assert np.array_equal(mean.read(1), Reader.data[1,:6,:9].reshape(2,3,3,3).mean(axis=(1,3)))
+    maximum = DownsampledReader(Reader(), 3, mode='max', batch_bytes=1)
+    assert np.array_equal(maximum.read([0, 1]), Reader.data[:,:6,:9].reshape(2,2,3,3,3).max(axis=(2,4)))
+
+
+@pytest.fixture(scope='module')
+def large_cube(tmp_path_factory):
+    from cube2movie.benchmark import synthetic_cube
+    return synthetic_cube(str(tmp_path_factory.mktemp('cubes')/'large.fits'), nx=400, ny=400, nchan=3)
+
+
+def test_auto_block_size(large_cube):
+    cubemovie = make_movie(large_cube, downsample='auto')
+    try:
+        cubemovie.set_range()
+        cubemovie.set_up_plot()
+        # about 150 screen pixels for 400 data pixels
+        assert cubemovie.block_size in [2, 3]
+        assert cubemovie.get_plane(0).shape == (400//cubemovie.block_size,)*2
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+
+
+def test_downsampled_frames_look_alike(large_cube):
+    settings = dict(renderer='blit', vmin=-0.1, vmax=0.9)
+    full = render(large_cube, downsample=False, **settings).astype(float)
+    reduced = render(large_cube, downsample='auto', **settings).astype(float)
+    assert np.abs(full-reduced).mean() < 5
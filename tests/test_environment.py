@@ -0,0 +1,31 @@
+import os
+import matplotlib as mpl
+
+from conftest import make_movie
+
+
+def test_prepare_and_restore_environment(cube_file):
+    cubemovie = make_movie(cube_file)
+    assert mpl.rcParams['text.usetex'] is False
+    assert os.environ['KMP_WARNINGS'] == 'off'
+    cubemovie.restore_environment()
+    assert all(cubemovie.warningstatus.values())
+
+
+def test_benchmark_stages(tmp_path):
+    from cube2movie.benchmark import benchmark_stages
+
+    case = benchmark_stages(nx=32, ny=32, nchan=4, directory=str(tmp_path), figsize=(3,3), dpi=50, usetex=False)
+    assert case['frames'] == 4
+    assert set(case['stages']) == {'load_cube', 'set_range', 'set_up_plot', 'draw', 'encode'}
+
+
+def test_restore_matplotlib_settings(cube_file):
+    with mpl.rc_context({'text.usetex': False, 'savefig.pad_inches': 0.3, 'interactive': True}):
+        cubemovie = make_movie(cube_file, usetex=True)
+        assert mpl.rcParams['text.usetex'] is True
+        assert mpl.rcParams['savefig.pad_inches'] == 0.
+        cubemovie.restore_environment()
+        assert mpl.rcParams['text.usetex'] is False
+        assert mpl.is_interactive()
+        assert mpl.rcParams['savefig.pad_inches'] == 0.3
@@ -0,0 +1,57 @@
+import gc
+import numpy as np
+import pytest
+
+from conftest import render
+
+# out of core, the percentiles are estimated: fix the range
+SETTINGS = dict(renderer='blit', vmin=-0.1, vmax=0.9)
+
+
+def store_hdf5(cube_file, filename):
+    import h5py
+    from astropy.io import fits
+
+    data, header = fits.getdata(cube_file, header=True)
+    with h5py.File(filename, 'w') as f:
+        dataset = f.create_dataset('data', data=data, chunks=(1,)+data.shape[1:], compression='gzip', shuffle=True)
+        dataset.attrs['header'] = header.tostring(sep='\n')
+    return filename
+
+
+def open_files():
+    import h5py
+    return h5py.h5f.get_obj_count(h5py.h5f.OBJ_ALL, h5py.h5f.OBJ_FILE)
+
+
+def test_hdf5_matches_fits(cube_file, tmp_path):
+    pytest.importorskip('h5py')
+    filename = store_hdf5(cube_file, str(tmp_path/'cube.h5'))
+    assert np.array_equal(render(filename, **SETTINGS), render(cube_file, **SETTINGS))
+
+
+def test_hdf5_file_closed(cube_file, tmp_path):
+    pytest.importorskip('h5py')
+    from cube2movie.formats import read_cube
+
+    filename = store_hdf5(cube_file, str(tmp_path/'cube.h5'))
+    gc.collect()
+    before = open_files()
+    cube = read_cube(filename)
+    assert open_files() == before+1
+    assert np.isfinite(cube[0].value).all()
+    del cube
+    gc.collect()
+    assert open_files() == before
+
+
+def test_zarr_matches_fits(cube_file, tmp_path):
+    zarr = pytest.importorskip('zarr')
+    from astropy.io import fits
+
+    data, header = fits.getdata(cube_file, header=True)
+    filename = str(tmp_path/'cube.zarr')
+    array = zarr.open(filename, mode='w', shape=data.shape, chunks=(1,)+data.shape[1:], dtype=data.dtype)
+    array[:] = data
+    array.attrs['header'] = header.tostring(sep='\n')
+    assert np.array_equal(render(filename, **SETTINGS), render(cube_file, **SETTINGS))
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import pytest
+
+from conftest import make_movie, render
+
+
+def cache_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith('.frame'))
+
+
+@pytest.mark.parametrize('renderer', ['blit', 'numpy'])
+def test_cached_frames_match_uncached(cube_file, tmp_path, renderer):
+    cache = str(tmp_path/'frames')
+    expected = render(cube_file, renderer=renderer)
+
+    first = render(cube_file, channels=range(0,12,2), renderer=renderer, frame_cache=cache)
+    assert np.array_equal(first, expected[::2])
+    assert len(os.listdir(cache)) == 6
+
+    # the cache only fits the primed frames: storing the new frames evicts frames this run still needs
+    frames = render(cube_file, renderer=renderer, frame_cache=cache, frame_cache_bytes=cache_bytes(cache))
+    assert np.array_equal(frames, expected)
+
+    # evicted while rendering
+    frames = render(cube_file, renderer=renderer, frame_cache=cache, frame_cache_bytes=1)
+    assert np.array_equal(frames, expected)
+
+
+def test_cache_reuses_frames(cube_file, tmp_path):
+    cache = str(tmp_path/'frames')
+    expected = render(cube_file, renderer='blit', frame_cache=cache)
+    mtimes = {name: os.stat(os.path.join(cache, name)).st_mtime_ns for name in os.listdir(cache)}
+    assert len(mtimes) == 12
+
+    frames = render(cube_file, renderer='blit', frame_cache=cache, dpi=50)
+    assert np.array_equal(frames, expected)
+    assert sorted(os.listdir(cache)) == sorted(mtimes)
+
+
+def frame_keys(cube, **settings):
+    cubemovie = make_movie(cube, **settings)
+    try:
+        keys = cubemovie.frame_keys(cubemovie.channels)
+        return keys, cubemovie.planes.bytes_read
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+
+
+def test_keys_identify_content(cube_file):
+    import matplotlib.colors
+    from astropy.io import fits
+    from astropy.wcs import WCS
+    from cube2movie.Overlays import ImageContours
+
+    header = WCS(fits.getheader(cube_file)).celestial.to_header()
+    image = np.zeros((48,48), dtype=np.float32)
+    changed = image.copy()
+    changed[24,24] = 1
+
+    def keys(image):
+        # new instances of the same norm and overlay, as in another run
+        overlays = [ImageContours(fits.PrimaryHDU(image, header), [0.5]), ImageContours((image, header), [0.5])]
+        return frame_keys(cube_file, vmin=0, vmax=1, imshow_kwargs={'norm': matplotlib.colors.PowerNorm(0.5)}, overlays=overlays)
+
+    first, read = keys(image)
+    # the planes of a fits file are identified by the file, not read
+    assert read == 0
+    assert len(set(first)) == 12
+    assert keys(image.copy())[0] == first
+    # differs from image only where numpy abbreviates its repr
+    assert keys(changed)[0] != first
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from conftest import requires_ffmpeg, read_movie
+
+
+def frames(n=5, height=32, width=48):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (n, height, width, 4), dtype=np.uint8)
+
+
+@requires_ffmpeg
+def test_frames_are_copied_before_writing(tmp_path):
+    from cube2movie.FrameWriter import FrameWriter
+
+    out = str(tmp_path/'movie.mkv')
+    expected = frames()
+    buffer = np.empty_like(expected[0])
+    with FrameWriter(out, codec='ffv1', queue_depth=2) as writer:
+        for frame in expected:
+            # the canvas buffer is reused for the next frame
+            buffer[:] = frame
+            writer.write(buffer)
+            buffer[:] = 0
+    assert writer.frames_written == len(expected)
+    assert np.array_equal(read_movie(out, 48, 32), expected[...,:3])
+
+
+@requires_ffmpeg
+def test_ffmpeg_failure_is_raised(tmp_path):
+    from cube2movie.FrameWriter import FrameWriter
+
+    with pytest.raises(RuntimeError, match="ffmpeg failed"):
+        with FrameWriter(str(tmp_path/'movie.mp4'), codec='no-such-codec') as writer:
+            for frame in frames(50):
+                writer.write(frame)
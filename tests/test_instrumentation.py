@@ -0,0 +1,59 @@
+import json
+import warnings
+import pytest
+
+from conftest import requires_ffmpeg, make_movie
+
+SETTINGS = dict(usetex=False, figsize=(3,3), dpi=50, percentile_cache=False, renderer='blit')
+
+
+def test_no_spans_without_hooks(cube_file):
+    from cube2movie.CubeToMovie import _NO_SPAN
+
+    cubemovie = make_movie(cube_file)
+    try:
+        assert cubemovie.span('set_range') is _NO_SPAN
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+
+
+@requires_ffmpeg
+def test_hooks_and_trace(cube_file, tmp_path):
+    import cube2movie as c2m
+
+    events = []
+    trace = str(tmp_path/'trace.json')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        c2m.cube2movie(cube_file, out=str(tmp_path/'movie.mp4'), hooks=[events.append], trace=trace, trace_format='json', **SETTINGS)
+
+    names = [event['name'] for event in events]
+    for stage in ['load_cube', 'set_range', 'set_up_plot', 'save_movie']:
+        assert names.count(stage) == 1
+    for step in ['draw', 'encode', 'frame']:
+        assert names.count(step) == 12
+    # the planes are also fetched to set up the figure
+    assert names.count('fetch') >= 12
+    frames = [event for event in events if event['name'] == 'frame']
+    assert all(event['args']['bytes_read'] > 0 and event['duration'] >= 0 for event in frames)
+
+    with open(trace) as f:
+        stored = json.load(f)
+    assert len(stored['events']) == len(events)
+    assert stored['summary']['frame']['count'] == 12
+
+
+def test_chrome_trace():
+    from cube2movie.Instrumentation import TraceCollector
+
+    collector = TraceCollector()
+    collector({'name': 'frame', 'cat': 'frame', 'start': 1., 'duration': 0.5, 'thread': 'MainThread', 'args': {'bytes_read': 10}})
+    collector({'name': 'fetch', 'cat': 'frame', 'start': 1.1, 'duration': 0.1, 'thread': 'ChannelPlanes', 'args': {}})
+    trace = collector.chrome_trace()['traceEvents']
+    spans = [event for event in trace if event['ph'] == 'X']
+    assert [(event['name'], event['ts'], event['dur']) for event in spans] == [('frame', 0, 5e5), ('fetch', pytest.approx(1e5), pytest.approx(1e5))]
+    assert [event['args'] for event in trace if event['ph'] == 'C'] == [{'bytes_read': 10}]
+    assert sorted(event['args']['name'] for event in trace if event['ph'] == 'M') == ['ChannelPlanes', 'MainThread']
+    with pytest.raises(ValueError):
+        collector.save('trace.txt', format='text')
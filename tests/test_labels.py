@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from conftest import make_movie
+
+
+def test_label_atlas_matches_drawn_labels(cube_file):
+    cubemovie = make_movie(cube_file, renderer='blit', channelunit='km/s', decimals=0)
+    try:
+        cubemovie.set_range()
+        cubemovie.set_up_plot()
+        frames = [np.array(frame) for frame in cubemovie.iter_frames()]
+        atlas = cubemovie.label_atlas
+        # every distinct label is rasterized once
+        assert len(atlas.rasters) == len({cubemovie.label(channel) for channel in cubemovie.channels}) == 12
+
+        # matplotlib draws the same label on top of the map
+        for channel in [0, 7]:
+            r0, r1, c0, c1 = atlas.rasters[cubemovie.label(channel)][2]
+            cubemovie.fig.canvas.restore_region(cubemovie.background)
+            cubemovie.map.set_data(cubemovie.get_plane(channel))
+            cubemovie.ax.draw_artist(cubemovie.map)
+            cubemovie.chanlabel.set_text(cubemovie.label(channel))
+            cubemovie.chanlabel.set_visible(True)
+            cubemovie.ax.draw_artist(cubemovie.chanlabel)
+            drawn = np.array(cubemovie.frame_buffer())[r0:r1,c0:c1].astype(int)
+            assert np.abs(drawn-frames[channel][r0:r1,c0:c1]).max() <= 1
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+
+
+@pytest.mark.parametrize('renderer', ['blit', 'numpy'])
+def test_only_the_label_changes_on_a_constant_map(cube_file, renderer):
+    # all values are below the range, so the map is the same in every frame
+    cubemovie = make_movie(cube_file, renderer=renderer, channelunit='km/s', decimals=0, vmin=100., vmax=101.,
+                           imshow_kwargs={'interpolation': 'nearest'})
+    try:
+        cubemovie.set_range()
+        cubemovie.set_up_plot()
+        frames = [np.array(frame) for frame in cubemovie.iter_frames()]
+        atlas = cubemovie.label_atlas
+        height = frames[0].shape[0]
+        x0, y0, x1, y1 = cubemovie.ax.bbox.extents
+        for channel in range(1, len(frames)):
+            changed = (frames[channel] != frames[channel-1]).any(axis=2)
+            # the label is on top of the map
+            assert changed[int(height-y1)+1:int(height-y0)-1,int(x0)+1:int(x1)-1].any()
+            for text in {cubemovie.label(channel), cubemovie.label(channel-1)}:
+                r0, r1, c0, c1 = atlas.rasters[text][2]
+                changed[r0:r1,c0:c1] = False
+            assert not changed.any()
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
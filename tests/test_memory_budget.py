@@ -0,0 +1,40 @@
+import os
+import warnings
+
+from conftest import requires_ffmpeg, make_movie
+
+
+def test_budget_shrinks_buffers(cube_file):
+    from cube2movie.Instrumentation import current_rss
+
+    cubemovie = make_movie(cube_file, memory_budget=current_rss()+8*2**20)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            cubemovie.apply_memory_budget()
+        plane_bytes = 48*48*4
+        assert 2*plane_bytes <= cubemovie.cache_bytes < 256*2**20
+        assert cubemovie.chunk_bytes < 64*2**20
+        assert cubemovie.queue_depth >= 1 and cubemovie.preview_buffer >= 1
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+
+
+@requires_ffmpeg
+def test_single_worker_renders_in_process(cube_file, tmp_path, capsys):
+    import cube2movie as c2m
+    from cube2movie.Instrumentation import current_rss
+
+    out = str(tmp_path/'movie.mp4')
+    events = []
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        result = c2m.cube2movie(cube_file, out=out, workers=2, memory_budget=2*current_rss(), hooks=[lambda event: events.append(event['name'])],
+                                usetex=False, figsize=(3,3), dpi=50, percentile_cache=False)
+    assert result == [out]
+    assert os.path.getsize(out) > 0
+    assert "Using 1 workers" in capsys.readouterr().out
+    # only frames drawn in this process are reported to the hooks
+    assert events.count('frame') == 12
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('cube2movie_')]
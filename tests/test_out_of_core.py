@@ -0,0 +1,32 @@
+import numpy as np
+
+from conftest import make_movie, render
+
+
+def test_dask_reader_chunks(cube_file):
+    from spectral_cube import SpectralCube
+    from cube2movie.readers import DaskReader
+
+    cube = SpectralCube.read(cube_file, use_dask=True)
+    data = cube.filled_data[:].value
+    reader = DaskReader(cube, chunk_bytes=5*48*48*4)
+    assert reader.data.chunks[0] == (5, 5, 2)
+    assert np.array_equal(reader.read([0, 6, 11]), data[[0, 6, 11]])
+    assert np.array_equal(reader.read(4), data[4])
+    assert len(reader.kept) <= reader.keep
+
+
+def test_out_of_core_matches_in_memory(cube_file):
+    from cube2movie.readers import DaskReader
+
+    cubemovie = make_movie(cube_file, out_of_core=True)
+    try:
+        cubemovie.select_channels([])
+        cubemovie.open_planes()
+        assert cubemovie.out_of_core and isinstance(cubemovie.planes.reader, DaskReader)
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+    # out of core, the percentiles are estimated: fix the range
+    settings = dict(renderer='blit', vmin=-0.1, vmax=0.9)
+    assert np.array_equal(render(cube_file, out_of_core=True, chunk_bytes=3*48*48*4, **settings), render(cube_file, **settings))
@@ -0,0 +1,39 @@
+import os
+import warnings
+import numpy as np
+
+from conftest import requires_ffmpeg, make_movie, read_movie
+
+SETTINGS = dict(usetex=False, figsize=(3,3), dpi=64, percentile_cache=False, renderer='blit')
+
+
+def test_output_specs(cube_file):
+    cubemovie = make_movie(cube_file, codec='h264', bitrate=1000)
+    try:
+        specs = cubemovie.output_specs(['a.mp4', 'b.webm', 'c.gif', {'out': 'd.mp4', 'scale': 0.5, 'bitrate': 200}])
+        assert [(spec['encoder'], spec['codec'], spec['bitrate'], spec['scale']) for spec in specs] == \
+               [('ffmpeg', 'h264', 1000, 1), ('ffmpeg', cubemovie.output_codecs['.webm'], 1000, 1), ('palette', 'gif', None, 1), ('ffmpeg', 'h264', 200, 0.5)]
+        assert [spec['out'] for spec in cubemovie.output_specs()] == [cubemovie.out]
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+
+
+@requires_ffmpeg
+def test_single_pass_to_several_outputs(cube_file, tmp_path):
+    import cube2movie as c2m
+
+    outputs = [str(tmp_path/'full.mp4'), {'out': str(tmp_path/'half.mp4'), 'scale': 0.5}, str(tmp_path/'frames'/'%04d.png')]
+    events = []
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        written = c2m.cube2movie(cube_file, outputs=outputs, hooks=[events.append], **SETTINGS)
+    assert written == [outputs[0], outputs[1]['out'], outputs[2]]
+    # every frame is drawn once
+    assert [event['name'] for event in events].count('draw') == 12
+    full = read_movie(outputs[0], 192, 192)
+    assert full.shape[0] == 12
+    assert read_movie(outputs[1]['out'], 96, 96).shape[0] == 12
+    assert sorted(os.listdir(tmp_path/'frames')) == ['%04d.png' % i for i in range(1, 13)]
+    frame = read_movie(str(tmp_path/'frames'/'0005.png'), 192, 192)[0].astype(float)
+    assert np.abs(frame-full[4]).mean() < 3
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from conftest import make_movie, render
+
+
+def moment0(cube_file, **settings):
+    from cube2movie.Overlays import MomentContours
+
+    cubemovie = make_movie(cube_file, **settings)
+    try:
+        cubemovie.select_channels([])
+        overlay = MomentContours([0.5], relative=True)
+        overlay.prepare(cubemovie)
+        return overlay.image
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+
+
+def test_overlay_is_abstract():
+    from cube2movie.Overlays import Overlay
+
+    with pytest.raises(TypeError):
+        Overlay()
+
+
+@pytest.mark.parametrize('bin_mode', ['mean', 'sum', 'max'])
+def test_moment0_of_binned_channels(cube_file, bin_mode):
+    expected = moment0(cube_file)
+    image = moment0(cube_file, binning=3, bin_mode=bin_mode)
+    assert np.allclose(image, expected, rtol=1e-4, atol=1e-3)
+
+
+def test_overlays_drawn_into_background(cube_file):
+    from cube2movie.Overlays import MomentContours
+
+    overlays = [MomentContours([0.3, 0.6], relative=True)]
+    plain = render(cube_file, channels=[0,1], renderer='blit', imshow_kwargs={'interpolation': 'nearest'})
+    frames = render(cube_file, channels=[0,1], renderer='blit', overlays=overlays, imshow_kwargs={'interpolation': 'nearest'})
+    assert not np.array_equal(frames, plain)
+    assert np.array_equal(frames, render(cube_file, channels=[0,1], renderer='numpy', overlays=overlays))
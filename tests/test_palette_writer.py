@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from cube2movie.PaletteWriter import PaletteWriter
+
+
+def make_frames(colors, n=5, size=40):
+    """
+    Frames of a white background with a square moving over it, in one of the colors per frame.
+    """
+    frames = np.full((n, size, size, 4), 255, dtype=np.uint8)
+    for i in range(n):
+        frames[i, 5:15, 5+4*i:15+4*i, :3] = colors[i % len(colors)]
+    return frames
+
+
+def read_frames(filename):
+    from PIL import Image, ImageSequence
+    with Image.open(filename) as image:
+        return np.array([np.asarray(frame.convert('RGB')) for frame in ImageSequence.Iterator(image)])
+
+
+@pytest.mark.parametrize('out', ['movie.gif', 'movie.png'])
+def test_palette_colors_round_trip(tmp_path, out):
+    colors = np.array([[200, 30, 30], [30, 200, 30], [30, 30, 200], [17, 17, 17]], dtype=np.uint8)
+    frames = make_frames(colors)
+    with PaletteWriter(str(tmp_path/out), fps=4, colors=colors) as writer:
+        for frame in frames:
+            writer.write(frame)
+    assert writer.frames_encoded == len(frames)
+    # colours of the palette are mapped onto themselves, also in the cropped later frames
+    assert np.array_equal(read_frames(tmp_path/out), frames[:,:,:,:3])
+
+
+def test_unknown_colors_map_to_nearest(tmp_path):
+    colors = np.array([[255, 0, 0], [0, 0, 255]], dtype=np.uint8)
+    frames = make_frames(colors, n=2)
+    frames[1, 5:15, 9:19, :3] = [250, 5, 5]
+    with PaletteWriter(str(tmp_path/'movie.gif'), colors=colors) as writer:
+        for frame in frames:
+            writer.write(frame)
+    assert np.array_equal(read_frames(tmp_path/'movie.gif')[1, 10, 12], [255, 0, 0])
+
+
+def test_scale_resamples_frames(tmp_path):
+    frames = make_frames(np.array([[0, 0, 0]], dtype=np.uint8), n=2)
+    with PaletteWriter(str(tmp_path/'movie.png'), scale=0.5) as writer:
+        for frame in frames:
+            writer.write(frame)
+    assert read_frames(tmp_path/'movie.png').shape == (2, 20, 20, 3)
@@ -0,0 +1,81 @@
+import os
+import warnings
+import numpy as np
+import pytest
+
+from conftest import requires_ffmpeg, make_movie, read_movie
+
+SETTINGS = dict(usetex=False, figsize=(3,3), dpi=50, percentile_cache=False)
+
+
+def test_split_channels(cube_file):
+    cubemovie = make_movie(cube_file)
+    try:
+        cubemovie.select_channels([0, 1, 2, 5, 6])
+        segments = cubemovie.split_channels(3)
+        assert segments == [[0, 1], [2, 5], [6]]
+        assert cubemovie.split_channels(8) == [[channel] for channel in [0, 1, 2, 5, 6]]
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize('renderer', ['blit', 'full'])
+def test_parallel_segments_match_single_process(cube_file, tmp_path, renderer):
+    import cube2movie as c2m
+
+    movies = {}
+    for workers in [1, 3]:
+        out = str(tmp_path/('movie_'+str(workers)+'.mp4'))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            assert c2m.cube2movie(cube_file, out=out, workers=workers, renderer=renderer, **SETTINGS) == [out]
+        movies[workers] = read_movie(out).astype(float)
+    assert movies[3].shape == movies[1].shape == (12, 150, 150, 3)
+    # the segments are encoded separately, which only changes the compression artefacts, also
+    # of the first frame of a segment
+    assert np.abs(movies[3]-movies[1]).mean(axis=(1,2,3)).max() < 2
+    # the segments are removed after joining
+    assert sorted(os.listdir(tmp_path)) == ['movie_1.mp4', 'movie_3.mp4']
+
+
+def test_failed_segment_restores_environment(cube_file, tmp_path, monkeypatch):
+    import matplotlib as mpl
+    from cube2movie.CubeToMovie import CubeToMovie, _render_segment
+
+    cubemovie = make_movie(cube_file)
+    settings = cubemovie.get_settings()
+    cubemovie.close_planes()
+    cubemovie.restore_environment()
+
+    def fail(self, outputs=None):
+        raise RuntimeError("ffmpeg failed")
+
+    monkeypatch.setattr(CubeToMovie, 'save_movie', fail)
+    monkeypatch.delenv('KMP_WARNINGS', raising=False)
+    # resolve the default backend, which the segment does
+    mpl.get_backend()
+    before = mpl.rcParams.copy()
+    with pytest.raises(RuntimeError):
+        _render_segment(cube_file, settings, [0, 1], str(tmp_path/'segment.mp4'))
+    assert mpl.rcParams == before
+    assert 'KMP_WARNINGS' not in os.environ
+
+
+@requires_ffmpeg
+def test_parallel_segments_of_a_cube_in_memory(cube_file, tmp_path):
+    from spectral_cube import SpectralCube
+    import cube2movie as c2m
+
+    cube = SpectralCube.read(cube_file)
+    movies = {}
+    for workers in [1, 2]:
+        out = str(tmp_path/('movie_'+str(workers)+'.mp4'))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            assert c2m.cube2movie(cube, out=out, workers=workers, renderer='blit', **SETTINGS) == [out]
+        movies[workers] = read_movie(out).astype(float)
+    assert np.abs(movies[2]-movies[1]).mean(axis=(1,2,3)).max() < 2
+    # the fits file written for the workers is removed with the segments
+    assert sorted(os.listdir(tmp_path)) == ['movie_1.mp4', 'movie_2.mp4']
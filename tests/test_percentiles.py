@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from conftest import make_movie
+
+
+def assert_percentiles(estimator, values, q):
+    """
+    The estimated percentiles lie between the values of the neighbouring ranks, up to the error
+    of the binning.
+    """
+    values = np.sort(np.ravel(values))
+    rank = np.asarray(q)/100*(len(values)-1)
+    below, above = values[np.floor(rank).astype(int)], values[np.ceil(rank).astype(int)]
+    error = estimator.value_error(q)
+    estimate = estimator.percentile(q)
+    assert np.all(estimate >= below-error) and np.all(estimate <= above+error)
+
+
+def test_streaming_percentiles_match_numpy():
+    from cube2movie.StreamingPercentiles import StreamingPercentiles
+
+    values = np.random.default_rng(1).normal(size=(20,1000))
+    estimator = StreamingPercentiles()
+    for chunk in values:
+        estimator.add(chunk)
+    q = [0.25, 50, 99.75]
+    assert estimator.value_error(q) < 1e-3
+    assert_percentiles(estimator, values, q)
+    assert estimator.rank_error() == 0
+
+
+def test_streaming_percentiles_outlier():
+    from cube2movie.StreamingPercentiles import StreamingPercentiles
+
+    values = np.random.default_rng(2).normal(size=(20,1000))
+    values[10,0] = 1e7
+    estimator = StreamingPercentiles()
+    for chunk in values:
+        estimator.add(chunk)
+    q = [0.25, 99.75]
+    # a linear histogram over the range of the outlier has bins of 150
+    assert estimator.value_error(q) < 0.01
+    assert_percentiles(estimator, values, q)
+    assert np.allclose(estimator.percentile(q), np.percentile(values, q), atol=0.01)
+    assert estimator.percentile(100) == pytest.approx(1e7, rel=1e-3)
+
+
+def test_rank_error_only_for_random_samples():
+    from cube2movie.StreamingPercentiles import StreamingPercentiles
+
+    chunk = np.arange(100.)
+    estimator = StreamingPercentiles()
+    estimator.add(chunk, total=1000)
+    assert estimator.rank_error() > 0
+    estimator = StreamingPercentiles()
+    estimator.add(chunk, total=1000, random=False)
+    assert estimator.rank_error() is None
+
+
+def test_saved_percentiles(tmp_path):
+    from cube2movie.StreamingPercentiles import StreamingPercentiles
+
+    estimator = StreamingPercentiles()
+    estimator.add(np.arange(100.), total=1000, random=False)
+    filename = str(tmp_path/'percentiles.npz')
+    estimator.save(filename, size=100)
+    loaded = StreamingPercentiles.load(filename, size=100)
+    assert loaded.percentile(50) == estimator.percentile(50)
+    assert loaded.rank_error() is None
+    assert StreamingPercentiles.load(filename, size=101) is None
+
+
+@pytest.mark.parametrize('sampling', ['stride', 'random'])
+def test_cube_percentiles_streamed(cube_file, sampling):
+    cubemovie = make_movie(cube_file, percentile_method='stream', percentile_sample=0.5, percentile_sampling=sampling)
+    try:
+        exact = np.nanpercentile(cubemovie.cube.filled_data[:].value, cubemovie.percentiles)
+        assert np.allclose(cubemovie.cube_percentile(cubemovie.percentiles), exact, atol=0.05)
+        assert (cubemovie.histogram.rank_error() is None) == (sampling == 'stride')
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
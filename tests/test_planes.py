@@ -0,0 +1,157 @@
+import time
+import threading
+import numpy as np
+import pytest
+
+from conftest import render
+
+
+class CountingReader:
+    """
+    Channel planes filled with their channel number, counting the reads.
+    """
+
+    def __init__(self, nchan=10, ny=4, nx=5):
+        self.shape = (nchan, ny, nx)
+        self.reads = []
+        self.lock = threading.Lock()
+
+    def read(self, channels):
+        if not np.isscalar(channels):
+            return np.stack([self.read(channel) for channel in channels])
+        with self.lock:
+            self.reads.append(channels)
+        return np.full(self.shape[1:], channels, dtype=np.float32)
+
+    def close(self):
+        pass
+
+
+class FailingReader(CountingReader):
+    """
+    A CountingReader whose first read raises, once the test releases it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.failed = False
+
+    def read(self, channels):
+        if not self.failed:
+            self.failed = True
+            self.release.wait(10)
+            raise OSError("read failed")
+        return super().read(channels)
+
+
+def test_cache_is_bounded():
+    from cube2movie.ChannelPlanes import ChannelPlanes
+
+    reader = CountingReader()
+    planes = ChannelPlanes(reader, cache_bytes=3*4*5*4, readahead=0)
+    for channel in [0, 1, 2, 0, 3]:
+        plane = planes[channel]
+        assert (plane == channel).all()
+        assert not plane.flags.writeable
+    assert len(planes.cache) == 3
+    # channel 0 was still cached when requested again, channel 1 was evicted last
+    assert reader.reads == [0, 1, 2, 3]
+    assert list(planes.cache) == [2, 0, 3]
+    planes.close()
+
+
+def test_read_ahead_in_order():
+    from cube2movie.ChannelPlanes import ChannelPlanes
+
+    reader = CountingReader()
+    planes = ChannelPlanes(reader, cache_bytes=2**20, readahead=3)
+    order = [9, 7, 5, 3, 1]
+    planes.set_order(order)
+    assert (planes[9] == 9).all()
+    end = time.time()+10
+    while len(reader.reads) < 4 and time.time() < end:
+        time.sleep(0.01)
+    assert reader.reads == [9, 7, 5, 3]
+    assert [int(plane[0,0]) for plane in planes.get(order)] == order
+    assert sorted(reader.reads) == sorted(order)
+    planes.close()
+
+
+def test_failed_read_releases_waiters():
+    from cube2movie.ChannelPlanes import ChannelPlanes
+
+    reader = FailingReader()
+    planes = ChannelPlanes(reader, cache_bytes=2**20, readahead=0)
+    errors = []
+
+    def first():
+        try:
+            planes[0]
+        except OSError as error:
+            errors.append(error)
+
+    results = []
+    failing = threading.Thread(target=first, daemon=True)
+    failing.start()
+    while 0 not in planes.pending:
+        time.sleep(0.01)
+    # waits for the read of the first thread, then reads the plane itself
+    waiting = threading.Thread(target=lambda: results.append(planes[0]), daemon=True)
+    waiting.start()
+    reader.release.set()
+    failing.join(10)
+    waiting.join(10)
+    assert not waiting.is_alive()
+    assert len(errors) == 1
+    assert (results[0] == 0).all()
+    assert not planes.pending
+    planes.close()
+
+
+def test_chunks_bypass_cache():
+    from cube2movie.ChannelPlanes import ChannelPlanes
+
+    reader = CountingReader()
+    planes = ChannelPlanes(reader, cache_bytes=2**20, readahead=0)
+    chunks = list(planes.chunks(range(10), chunk_bytes=4*4*5*4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert np.array_equal(np.concatenate(chunks)[:,0,0], np.arange(10))
+    assert len(planes.cache) == 0
+    planes.close()
+
+
+def test_fits_reader_matches_cube(cube_file):
+    from spectral_cube import SpectralCube
+    from cube2movie.readers import get_reader, FITSReader, CubeReader
+
+    cube = SpectralCube.read(cube_file)
+    reader = get_reader(cube_file, cube)
+    assert isinstance(reader, FITSReader)
+    expected = CubeReader(cube).read([0, 5, 11])
+    assert np.array_equal(reader.read([0, 5, 11]), expected)
+    assert np.array_equal(reader.read(5), expected[1])
+    reader.close()
+
+
+def test_fits_reader_finds_the_cube_in_an_extension(cube_file, tmp_path):
+    from astropy.io import fits
+    from spectral_cube import SpectralCube
+    from cube2movie.readers import get_reader, FITSReader, CubeReader
+
+    filename = str(tmp_path/'extension.fits')
+    with fits.open(cube_file) as hdul:
+        fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(hdul[0].data, hdul[0].header)]).writeto(filename)
+    cube = SpectralCube.read(filename, hdu=1)
+    reader = get_reader(filename, cube)
+    assert isinstance(reader, FITSReader)
+    assert np.array_equal(reader.read([0, 5, 11]), CubeReader(cube).read([0, 5, 11]))
+    reader.close()
+
+    # loaded from the extension as well
+    assert np.array_equal(render(filename, channels=[0, 5], renderer='blit'), render(cube_file, channels=[0, 5], renderer='blit'))
+
+    empty = str(tmp_path/'empty.fits')
+    fits.PrimaryHDU(np.zeros((4,4), dtype=np.float32)).writeto(empty)
+    with pytest.raises(ValueError):
+        FITSReader(empty, cube.shape)
@@ -0,0 +1,82 @@
+import os
+import time
+import pytest
+
+from conftest import make_movie, requires_ffmpeg
+
+SETTINGS = dict(usetex=False, figsize=(3,3), dpi=50, percentile_cache=False, preview_movie=True, renderer='blit')
+
+
+def wait_for_preview(timeout=60):
+    import threading
+
+    end = time.time()+timeout
+    while any(thread.name == 'PreviewPlayer' for thread in threading.enumerate()) and time.time() < end:
+        time.sleep(0.1)
+
+
+def close_window(fig):
+    """
+    Close the window of a figure as a GUI backend does, which the Agg backend of the tests cannot.
+    """
+    from matplotlib.backend_bases import CloseEvent
+    fig.canvas.callbacks.process('close_event', CloseEvent('close_event', fig.canvas))
+
+
+@requires_ffmpeg
+def test_preview_with_cube2movie(cube_file, tmp_path, monkeypatch):
+    import matplotlib as mpl
+    import matplotlib.pyplot as plt
+    import cube2movie as c2m
+
+    monkeypatch.delenv('KMP_WARNINGS', raising=False)
+    out = str(tmp_path/'movie.mp4')
+    events = []
+    hook = lambda event: events.append(event['name'])
+    with pytest.warns(UserWarning):
+        result = c2m.cube2movie(cube_file, out=out, hooks=[hook], **SETTINGS)
+    try:
+        assert result == [out]
+        assert os.path.getsize(out) > 0
+        assert events.count('frame') == 12
+
+        # the environment stays prepared while the preview plays ...
+        assert mpl.is_interactive()
+        assert os.environ['KMP_WARNINGS'] == 'off'
+        # ... and is restored when its window is closed
+        close_window(plt.figure(plt.get_fignums()[-1]))
+        assert not mpl.is_interactive()
+        assert 'KMP_WARNINGS' not in os.environ
+    finally:
+        wait_for_preview()
+        plt.close('all')
+
+
+@requires_ffmpeg
+def test_preview_starts_while_saving(cube_file, tmp_path):
+    import matplotlib as mpl
+    import matplotlib.pyplot as plt
+
+    cubemovie = make_movie(cube_file, preview_movie=True, preview_buffer=4, renderer='blit', repeat=False,
+                           out=str(tmp_path/'movie.mp4'))
+    shown = []
+    cubemovie.add_hook(lambda event: shown.append(cubemovie.movie.shown) if event['name'] == 'frame' else None)
+    try:
+        cubemovie.set_range()
+        cubemovie.set_up_plot()
+        with pytest.warns(UserWarning):
+            cubemovie.save_with_preview()
+        player = cubemovie.movie
+        # the first frame is on screen before the second one is rendered
+        assert len(shown) == 12 and shown[0] == 1
+        # the save runs ahead of the preview: the rest is left to the rasterizer
+        assert 4 <= player.next_index < 12
+        assert player.clone is not None
+        assert mpl.is_interactive()
+        close_window(player.fig)
+        assert not player.thread.is_alive()
+        assert not mpl.is_interactive()
+    finally:
+        wait_for_preview()
+        cubemovie.close_planes()
+        plt.close('all')
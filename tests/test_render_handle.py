@@ -0,0 +1,113 @@
+import os
+import time
+import glob
+import asyncio
+import pytest
+
+from conftest import requires_ffmpeg, read_movie
+
+SETTINGS = dict(usetex=False, figsize=(3,3), dpi=50, percentile_cache=False, renderer='blit')
+
+
+@requires_ffmpeg
+def test_result_and_progress(cube_file, tmp_path):
+    import cube2movie as c2m
+
+    out = str(tmp_path/'movie.mp4')
+    handle = c2m.cube2movie_async(cube_file, out=out, **SETTINGS)
+    assert handle.result(timeout=300) == [out]
+    assert handle.done() and not handle.cancelled()
+    assert handle.frames_done == handle.frames_total == 12
+    assert handle.eta == 0.
+    assert 'done: 12/12 frames' in repr(handle)
+    assert len(read_movie(out)) == 12
+
+
+@requires_ffmpeg
+def test_await(cube_file, tmp_path):
+    import cube2movie as c2m
+
+    out = str(tmp_path/'movie.mp4')
+
+    async def main():
+        return await c2m.cube2movie_async(cube_file, out=out, **SETTINGS)
+    assert asyncio.run(main()) == [out]
+
+
+def test_cancel(cube_file, tmp_path):
+    import concurrent.futures
+    import cube2movie as c2m
+
+    out = str(tmp_path/'movie.mp4')
+    handle = c2m.cube2movie_async(cube_file, out=out, **SETTINGS)
+    # cancelled while the process is still starting, i.e. at the first event of the render
+    assert handle.cancel()
+    assert handle.cancelled() and not handle.process.is_alive()
+    with pytest.raises(concurrent.futures.CancelledError):
+        handle.result()
+    assert handle.cancel() is False
+
+
+def descendants(pid):
+    """
+    The process ids of all descendants of a process (from /proc).
+    """
+    children = {}
+    for stat in glob.glob('/proc/[0-9]*/stat'):
+        try:
+            with open(stat) as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(stat.split('/')[2]))
+    found, todo = [], [pid]
+    while todo:
+        for child in children.get(todo.pop(), []):
+            found.append(child)
+            todo.append(child)
+    return found
+
+
+@requires_ffmpeg
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason="needs /proc to find the processes")
+def test_cancel_parallel_render(tmp_path):
+    import cube2movie as c2m
+    from cube2movie.benchmark import synthetic_cube
+
+    cube = synthetic_cube(str(tmp_path/'long.fits'), nx=64, ny=64, nchan=240)
+    out = str(tmp_path/'movie.mp4')
+    handle = c2m.cube2movie_async(cube, out=out, workers=2, vmin=-1, vmax=1, **dict(SETTINGS, renderer='full'))
+
+    # wait until the workers encode their segments
+    end = time.time()+300
+    while not glob.glob(str(tmp_path/'cube2movie_*'/'segment_*')) and time.time() < end:
+        assert not handle.done(), handle.exception()
+        time.sleep(0.1)
+    processes = descendants(handle.process.pid)
+    assert len(processes) >= 3  # the workers and ffmpeg
+    assert handle.cancel()
+    assert handle.cancelled()
+
+    # no worker, no ffmpeg, no segments and no partial movie left behind
+    end = time.time()+10
+    while any(os.path.exists('/proc/'+str(pid)) for pid in processes) and time.time() < end:
+        time.sleep(0.1)
+    assert not [pid for pid in processes if os.path.exists('/proc/'+str(pid))]
+    assert not glob.glob(str(tmp_path/'cube2movie_*'))
+    assert not os.path.exists(out)
+
+
+def test_errors_are_raised_by_result(tmp_path):
+    import cube2movie as c2m
+
+    handle = c2m.cube2movie_async(str(tmp_path/'missing.fits'), out=str(tmp_path/'movie.mp4'), **SETTINGS)
+    with pytest.raises(RuntimeError, match="missing.fits"):
+        handle.result(timeout=300)
+    assert 'failed' in repr(handle)
+
+
+def test_no_preview_in_background(cube_file):
+    import cube2movie as c2m
+
+    with pytest.raises(ValueError):
+        c2m.cube2movie_async(cube_file, preview_movie=True)
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from conftest import make_movie, render
+
+
+@pytest.fixture(scope='module')
+def blanked_cube(cube_file, tmp_path_factory):
+    """
+    The test cube with blanked (NaN) rows and a blanked channel.
+    """
+    from astropy.io import fits
+
+    with fits.open(cube_file) as hdul:
+        data = hdul[0].data.copy()
+        header = hdul[0].header
+    data[:,::7] = np.nan
+    data[3] = np.nan
+    filename = str(tmp_path_factory.mktemp('blanked')/'blanked.fits')
+    fits.writeto(filename, data, header)
+    return filename
+
+
+@pytest.mark.parametrize('cube', ['cube_file', 'blanked_cube'])
+def test_numpy_renderer_matches_blit(cube, request):
+    cube = request.getfixturevalue(cube)
+    expected = render(cube, renderer='blit', imshow_kwargs={'interpolation': 'nearest'})
+    frames = render(cube, renderer='numpy')
+    assert np.array_equal(frames, expected)
+
+
+@pytest.mark.parametrize('cube', ['cube_file', 'blanked_cube'])
+def test_numpy_renderer_matches_full(cube, request):
+    cube = request.getfixturevalue(cube)
+    full = render(cube, renderer='full', imshow_kwargs={'interpolation': 'nearest'})
+    frames = render(cube, renderer='numpy')
+    # only the antialiased edges of the axes frame may differ, the map and label follow the channel
+    for channel in range(1, len(full)):
+        assert np.mean((frames[channel] != full[channel]).any(axis=2)) < 0.02
+        assert np.mean((frames[channel] != full[0]).any(axis=2)) > 0.05
+
+
+def test_numpy_renderer_with_empty_range(cube_file):
+    from cube2movie.NumpyRenderer import NumpyRenderer
+
+    cubemovie = make_movie(cube_file, renderer='numpy', vmin=0.5, vmax=0.5)
+    try:
+        cubemovie.set_range()
+        cubemovie.set_up_plot()
+        renderer = NumpyRenderer(cubemovie)
+        renderer.prepare()
+        # every value is mapped to the lowest color, as matplotlib's Normalize does
+        rgba, bad = renderer.colorize(cubemovie.get_planes([0,1]))
+        assert not bad.any()
+        assert (rgba == cubemovie.colormap()(0, bytes=True)).all()
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+
+
+def test_numpy_renderer_forces_nearest(cube_file):
+    cubemovie = make_movie(cube_file, renderer='numpy')
+    try:
+        cubemovie.set_range()
+        cubemovie.set_up_plot()
+        assert cubemovie.map.get_interpolation() == 'nearest'
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+
+
+@pytest.mark.parametrize('imshow_kwargs', [{'interpolation': 'bilinear'}, {'alpha': 0.5}])
+def test_numpy_renderer_falls_back(cube_file, imshow_kwargs):
+    with pytest.warns(UserWarning, match="Falling back to renderer='blit'"):
+        frames = render(cube_file, channels=[0,1], renderer='numpy', imshow_kwargs=imshow_kwargs)
+    assert np.array_equal(frames, render(cube_file, channels=[0,1], renderer='blit', imshow_kwargs=imshow_kwargs))
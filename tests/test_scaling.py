@@ -0,0 +1,53 @@
+import warnings
+import numpy as np
+
+from conftest import make_movie
+from cube2movie.StreamingPercentiles import plane_percentiles
+
+
+def test_plane_percentiles_match_nanpercentile():
+    rng = np.random.default_rng(3)
+    planes = rng.normal(size=(4, 9, 11)).astype(np.float32)
+    planes[1, ::2] = np.nan
+    planes[3] = np.nan
+    result = plane_percentiles(planes, [0.25, 50, 99.75])
+    with warnings.catch_warnings():
+        # all-NaN plane
+        warnings.simplefilter('ignore', RuntimeWarning)
+        expected = np.nanpercentile(planes.reshape(4, -1), [0.25, 50, 99.75], axis=1)
+    assert np.allclose(result[:, :3], expected[:, :3], rtol=1e-6)
+    # planes without finite values give NaN
+    assert np.isnan(result[:, 3]).all()
+
+
+def test_channel_scaling_uses_the_percentiles_of_every_channel(cube_file):
+    cubemovie = make_movie(cube_file, scaling='channel', percentiles=[1, 99])
+    try:
+        cubemovie.set_range()
+        assert cubemovie.channel_limits.shape == (len(cubemovie.planes), 2)
+        for channel in cubemovie.channels:
+            expected = np.nanpercentile(cubemovie.get_plane(channel), [1, 99])
+            assert np.allclose(cubemovie.channel_range(channel), expected, rtol=1e-5)
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
+
+
+def test_channel_scaling_window_and_fixed_ends(cube_file):
+    cubemovie = make_movie(cube_file, scaling='channel', scaling_window=3, vmin=-1.)
+    try:
+        cubemovie.set_range()
+        limits = cubemovie.channel_limits
+        assert (limits[:, 0] == -1).all()
+        # a running median never leaves the range of the single channels
+        single = make_movie(cube_file, scaling='channel', vmin=-1.)
+        try:
+            single.set_range()
+            assert limits[:, 1].min() >= single.channel_limits[:, 1].min()
+            assert limits[:, 1].max() <= single.channel_limits[:, 1].max()
+        finally:
+            single.close_planes()
+            single.restore_environment()
+    finally:
+        cubemovie.close_planes()
+        cubemovie.restore_environment()
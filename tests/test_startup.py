@@ -0,0 +1,41 @@
+import sys
+import json
+import subprocess
+
+from conftest import requires_ffmpeg
+
+HEAVY = ['numpy', 'matplotlib', 'matplotlib.pyplot', 'astropy', 'spectral_cube']
+GUI = ['tkinter', 'PyQt5', 'PyQt6', 'PySide2', 'PySide6', 'gi', 'wx']
+
+
+def loaded_modules(code, cwd):
+    """
+    Run code in a fresh interpreter and return the modules it loaded. Runs in cwd, as in the
+    package directory cube2movie.py itself would be imported as cube2movie.
+    """
+    script = code+"\nimport sys, json\nprint(json.dumps(sorted(sys.modules)))"
+    output = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True, cwd=cwd).stdout
+    return set(json.loads(output.splitlines()[-1]))
+
+
+def test_import_is_lazy(tmp_path):
+    modules = loaded_modules("import cube2movie as c2m\nassert 'cube2movie' in c2m.__all__", tmp_path)
+    assert not modules & set(HEAVY)
+
+
+def test_attributes_are_the_functions_and_classes(tmp_path):
+    modules = loaded_modules("import cube2movie as c2m\n"
+                             "from cube2movie.cube2movie import cube2movie\n"
+                             "assert c2m.cube2movie is cube2movie and callable(c2m.cube2movie)\n"
+                             "assert isinstance(c2m.CubeToMovie, type)", tmp_path)
+    assert 'numpy' in modules
+
+
+@requires_ffmpeg
+def test_render_without_pyplot(cube_file, tmp_path):
+    out = str(tmp_path/'movie.mp4')
+    modules = loaded_modules("import cube2movie as c2m\n"
+                             "c2m.cube2movie("+repr(cube_file)+", out="+repr(out)+", usetex=False, figsize=(3,3), dpi=50,"
+                             " percentile_cache=False, renderer='blit')", tmp_path)
+    assert 'matplotlib.pyplot' not in modules
+    assert not modules & set(GUI)
@@ -0,0 +1,20 @@
+import os
+import warnings
+import pytest
+
+from conftest import requires_ffmpeg
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize('workers', [1, 2])
+def test_render_without_latex(cube_file, tmp_path, without_latex, workers):
+    import matplotlib as mpl
+    import cube2movie as c2m
+
+    usetex = mpl.rcParams['text.usetex']
+    out = str(tmp_path/'movie.mp4')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        c2m.cube2movie(cube_file, out=out, usetex=False, workers=workers, figsize=(3,3), dpi=50, percentile_cache=False)
+    assert os.path.getsize(out) > 0
+    assert mpl.rcParams['text.usetex'] == usetex